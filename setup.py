@@ -51,7 +51,7 @@ setup(
     package_dir={
         '': 'src'},
     py_modules=[splitext(basename(path))[0] for path in glob('src/*.py')],
-    python_requires='>= 3.6',  # default dictionary is sorted
+    python_requires='>= 3.7',  # mp_context of ProcessPoolExecutor
     include_package_data=True,
     zip_safe=False,
     classifiers=[
@@ -63,7 +63,6 @@ setup(
         'Operating System :: POSIX',
         'Operating System :: Microsoft :: Windows',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Topic :: Utilities',
@@ -72,11 +71,11 @@ setup(
         'DTS', 'Calibration',
         ],
     install_requires=[
-        'numpy',
+        'numpy>=1.17',  # numpy.random.SeedSequence
         'xarray',
         'pyyaml',
         'xmltodict',
-        'scipy',
+        'scipy>=1.7',  # scipy.stats.qmc
         'patsy',  # a dependency of statsmodels
         'statsmodels',
         'nbsphinx',
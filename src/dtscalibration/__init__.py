@@ -1,5 +1,8 @@
 # coding=utf-8
+from .calibration_model import CalibrationModel
+from .calibration_model import OnlineCalibrationSingleEnded
 from .datastore import DataStore
+from .datastore import ingest_new_files
 from .datastore import open_datastore
 from .datastore import open_mf_datastore
 from .datastore import plot_dask
@@ -10,6 +13,7 @@ from .datastore import read_silixa_files
 
 __version__ = '0.7.4'
 __all__ = [
-    "DataStore", "open_datastore", "open_mf_datastore",
+    "CalibrationModel", "DataStore", "ingest_new_files", "open_datastore",
+    "open_mf_datastore", "OnlineCalibrationSingleEnded",
     "read_apsensing_files", "read_sensornet_files", "read_sensortran_files",
     "read_silixa_files", "plot_dask"]
@@ -1,5 +1,9 @@
 # coding=utf-8
+import time
+
+import dask
 import numpy as np
+import scipy.linalg as sla
 import scipy.sparse as sp
 from scipy.sparse import linalg as ln
 
@@ -12,7 +16,9 @@ def calibration_single_ended_solver(
         ast_var=None,
         calc_cov=True,
         solver='sparse',
-        verbose=False):
+        verbose=False,
+        x0=None,
+        solver_kwargs=None):
     """
     Parameters
     ----------
@@ -31,17 +37,32 @@ def calibration_single_ended_solver(
         variance is a function of the intensity (Poisson distributed) define an
         array with shape (nx, nt), where nx are the number of calibration
         locations.
-    calc_cov : bool
+    calc_cov : bool or {'full', 'diag', 'blocks'}
         whether to calculate the covariance matrix. Required for calculation
-        of confidence boundaries. But uses a lot of memory.
-    solver : {'sparse', 'stats', 'external', 'external_split'}
+        of confidence boundaries. But uses a lot of memory. 'diag' and
+        'blocks' return a sparse covariance matrix with only the variances
+        or, for 'blocks', also the covariances of gamma and dalpha with all
+        other parameters.
+    solver : {'sparse', 'stats', 'structured', 'matrix_free', 'lsmr',
+              'external', 'external_split'}
         Always use sparse to save memory. The statsmodel can be used to validate
-        sparse solver. `external` returns the matrices that would enter the
+        sparse solver. `structured` eliminates the intercepts per time step
+        analytically, without constructing X, and is exact and fast for
+        large datasets. `matrix_free` solves with lsqr without constructing
+        X, see `design_operator`.
+        `lsmr` solves with lsmr and column equilibration, see `wls_lsmr`.
+        `external` returns the matrices that would enter the
         matrix solver (Eq.37). `external_split` returns a dictionary with
         matrix X split in the coefficients per parameter. The use case for
         the latter is when certain parameters are fixed/combined.
 
     verbose : bool
+    x0 : array-like, optional
+        Initial estimate of the parameters of the iterative solvers, e.g.
+        the solution of a previous calibration. Of size nt + 2.
+    solver_kwargs : dict, optional
+        Passed to `wls_lsmr` or `wls_matrix_free`, e.g. atol, btol and
+        iter_lim.
 
     Returns
     -------
@@ -50,44 +71,53 @@ def calibration_single_ended_solver(
     ix_sec = ds.ufunc_per_section(x_indices=True, calc_per='all')
     ds_sec = ds.isel(x=ix_sec)
 
+    # The Stokes data can be stored as float32 or int32
+    ds_sec = ds_sec.assign(
+        {k: ds_sec[k].astype(float) for k in (st_label, ast_label)})
+
     x_sec = ds_sec['x'].values
     nx = x_sec.size
 
     nt = ds.time.size
     p0_est = np.asarray([485., 0.1] + nt * [1.4])
 
+    if x0 is not None:
+        p0_est = np.asarray(x0, dtype=float)
+
     # X \gamma  # Eq.34
     cal_ref = ds.ufunc_per_section(
         label=st_label, ref_temp_broadcasted=True, calc_per='all')
 
     data_gamma = 1 / (cal_ref.ravel() + 273.15)  # gamma
-    coord_gamma_row = np.arange(nt * nx, dtype=int)
-    coord_gamma_col = np.zeros(nt * nx, dtype=int)
-    X_gamma = sp.coo_matrix(
-        (data_gamma, (coord_gamma_row, coord_gamma_col)),
-        shape=(nt * nx, 1),
-        copy=False)
-
-    # X \Delta\alpha  # Eq.34
-    data_dalpha = np.repeat(-x_sec, nt)  # dalpha
-    coord_dalpha_row = np.arange(nt * nx, dtype=int)
-    coord_dalpha_col = np.zeros(nt * nx, dtype=int)
-    X_dalpha = sp.coo_matrix(
-        (data_dalpha, (coord_dalpha_row, coord_dalpha_col)),
-        shape=(nt * nx, 1),
-        copy=False)
-
-    # X C  # Eq.34
-    data_c = -np.ones(nt * nx, dtype=int)
-    coord_c_row = np.arange(nt * nx, dtype=int)
-    coord_c_col = np.tile(np.arange(nt, dtype=int), nx)
-    X_c = sp.coo_matrix(
-        (data_c, (coord_c_row, coord_c_col)),
-        shape=(nt * nx, nt),
-        copy=False)
-
-    # Stack all X's
-    X = sp.hstack((X_gamma, X_dalpha, X_c))
+
+    if solver not in ('matrix_free', 'structured'):
+        coord_gamma_row = np.arange(nt * nx, dtype=int)
+        coord_gamma_col = np.zeros(nt * nx, dtype=int)
+        X_gamma = sp.coo_matrix(
+            (data_gamma, (coord_gamma_row, coord_gamma_col)),
+            shape=(nt * nx, 1),
+            copy=False)
+
+        # X \Delta\alpha  # Eq.34
+        data_dalpha = np.repeat(-x_sec, nt)  # dalpha
+        coord_dalpha_row = np.arange(nt * nx, dtype=int)
+        coord_dalpha_col = np.zeros(nt * nx, dtype=int)
+        X_dalpha = sp.coo_matrix(
+            (data_dalpha, (coord_dalpha_row, coord_dalpha_col)),
+            shape=(nt * nx, 1),
+            copy=False)
+
+        # X C  # Eq.34
+        data_c = -np.ones(nt * nx, dtype=int)
+        coord_c_row = np.arange(nt * nx, dtype=int)
+        coord_c_col = np.tile(np.arange(nt, dtype=int), nx)
+        X_c = sp.coo_matrix(
+            (data_c, (coord_c_row, coord_c_col)),
+            shape=(nt * nx, nt),
+            copy=False)
+
+        # Stack all X's
+        X = sp.hstack((X_gamma, X_dalpha, X_c))
 
     # y
     y = np.log(ds_sec[st_label] / ds_sec[ast_label]).values.ravel()
@@ -104,7 +134,8 @@ def calibration_single_ended_solver(
     if solver == 'sparse':
         if calc_cov:
             p_sol, p_var, p_cov = wls_sparse(
-                X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose)
+                X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose,
+                cov_rows=[0, 1])
         else:
             p_sol, p_var = wls_sparse(
                 X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose)
@@ -112,11 +143,53 @@ def calibration_single_ended_solver(
     elif solver == 'stats':
         if calc_cov:
             p_sol, p_var, p_cov = wls_stats(
-                X, y, w=w, calc_cov=calc_cov, verbose=verbose)
+                X, y, w=w, calc_cov=calc_cov, verbose=verbose,
+                cov_rows=[0, 1])
         else:
             p_sol, p_var = wls_stats(
                 X, y, w=w, calc_cov=calc_cov, verbose=verbose)
 
+    elif solver == 'structured':
+        # Coefficients of gamma and dalpha per observation, shape (nx, nt)
+        U = [np.asarray(data_gamma).reshape(nx, nt), -x_sec[:, None]]
+
+        if calc_cov:
+            p_sol, p_var, p_cov = wls_structured(
+                U, y.reshape(nx, nt), w=w, calc_cov=calc_cov,
+                verbose=verbose, cov_rows=[0, 1])
+        else:
+            p_sol, p_var = wls_structured(
+                U, y.reshape(nx, nt), w=w, calc_cov=calc_cov,
+                verbose=verbose)
+
+    elif solver == 'matrix_free':
+        # Row block of the observations, shape (nx, nt). See design_operator
+        blocks = [dict(
+            shape=(nx, nt),
+            w=np.broadcast_to(w, nt * nx).reshape(nx, nt),
+            terms=[(0, None, np.asarray(data_gamma).reshape(nx, nt)),  # gamma
+                   (1, None, -x_sec[:, None]),  # dalpha
+                   (2, 1, -1.)])]  # c
+
+        if calc_cov:
+            p_sol, p_var, p_cov = wls_matrix_free(
+                blocks, y, npar=nt + 2, x0=p0_est, calc_cov=calc_cov,
+                verbose=verbose, cov_rows=[0, 1], **(solver_kwargs or {}))
+        else:
+            p_sol, p_var = wls_matrix_free(
+                blocks, y, npar=nt + 2, x0=p0_est, calc_cov=calc_cov,
+                verbose=verbose, **(solver_kwargs or {}))
+
+    elif solver == 'lsmr':
+        if calc_cov:
+            p_sol, p_var, p_cov = wls_lsmr(
+                X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose,
+                cov_rows=[0, 1], **(solver_kwargs or {}))
+        else:
+            p_sol, p_var = wls_lsmr(
+                X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose,
+                **(solver_kwargs or {}))
+
     elif solver == 'external':
         return X, y, w, p0_est
 
@@ -152,7 +225,9 @@ def calibration_double_ended_solver(
         solver='sparse',
         matching_indices=None,
         transient_asym_att_x=None,
-        verbose=False):
+        verbose=False,
+        x0=None,
+        solver_kwargs=None):
     """
     The construction of X differs a bit from what is presented in the
     article. The choice to divert from the article is made because
@@ -192,12 +267,21 @@ def calibration_double_ended_solver(
         variance is a function of the intensity (Poisson distributed) define an
         array with shape (nx, nt), where nx are the number of calibration
         locations.
-    calc_cov : bool
+    calc_cov : bool or {'full', 'diag', 'blocks'}
         whether to calculate the covariance matrix. Required for calculation
-        of confidence boundaries. But uses a lot of memory.
-    solver : {'sparse', 'stats', 'external', 'external_split'}
+        of confidence boundaries. But uses a lot of memory. 'diag' and
+        'blocks' return a sparse covariance matrix with only the variances
+        or, for 'blocks', also the covariances of gamma with all other
+        parameters and the covariances among the parameters of each time
+        step: D_fw, D_bw and the transient attenuation.
+    solver : {'sparse', 'stats', 'block', 'matrix_free', 'lsmr', 'external',
+              'external_split'}
         Always use sparse to save memory. The statsmodel can be used to validate
-        sparse solver. `external` returns the matrices that would enter the
+        sparse solver. `block` eliminates E analytically from the normal
+        equations and is exact and fast for large datasets. `matrix_free`
+        solves with lsqr without constructing X, see `design_operator`.
+        `lsmr` solves with lsmr and column equilibration, see `wls_lsmr`.
+        `external` returns the matrices that would enter the
         matrix solver (Eq.37). `external_split` returns a dictionary with
         matrix X split in the coefficients per parameter. The use case for
         the latter is when certain parameters are fixed/combined.
@@ -215,11 +299,29 @@ def calibration_double_ended_solver(
         matching sections. If multiple locations are defined, the losses are
         added.
     verbose : bool
+    x0 : array-like, optional
+        Initial estimate of the parameters of the iterative solvers, e.g.
+        the solution of a previous calibration. Contains E of the locations
+        within the reference sections only, as `p0_est`.
+    solver_kwargs : dict, optional
+        Passed to `wls_lsmr` or `wls_matrix_free`, e.g. atol, btol and
+        iter_lim.
 
     Returns
     -------
 
     """
+    def connector_index(transient_asym_att_xi, x_sec):
+        """First index in the reference sections on the right hand side of
+        the connector"""
+        # Deal with connector outside of fiber
+        if transient_asym_att_xi >= x_sec[-1]:
+            return x_sec.size
+        elif transient_asym_att_xi <= x_sec[0]:
+            return 0
+        else:
+            return np.flatnonzero(x_sec >= transient_asym_att_xi)[0]
+
     def construct_submatrices(nt, nx, st_label, ds, transient_asym_att_x, x_sec):
         """Wrapped in a function to reduce memory usage.
         Constructing:
@@ -279,14 +381,7 @@ def calibration_double_ended_solver(
             for transient_asym_att_xi in transient_asym_att_x:
                 """For forward direction. """
                 # first index on the right hand side a the difficult splice
-                # Deal with connector outside of fiber
-                if transient_asym_att_xi >= x_sec[-1]:
-                    ix_sec_ta_ix0 = nx
-                elif transient_asym_att_xi <= x_sec[0]:
-                    ix_sec_ta_ix0 = 0
-                else:
-                    ix_sec_ta_ix0 = np.flatnonzero(
-                        x_sec >= transient_asym_att_xi)[0]
+                ix_sec_ta_ix0 = connector_index(transient_asym_att_xi, x_sec)
 
                 # Data is -1 for both forward and backward
                 # I_fw = 1/Tref*gamma - D_fw - E - TA_fw. Eq40
@@ -330,6 +425,11 @@ def calibration_double_ended_solver(
     ix_sec = ds.ufunc_per_section(x_indices=True, calc_per='all')
     ds_sec = ds.isel(x=ix_sec)
 
+    # The Stokes data can be stored as float32 or int32
+    ds_sec = ds_sec.assign({
+        k: ds_sec[k].astype(float)
+        for k in (st_label, ast_label, rst_label, rast_label)})
+
     x_sec = ds_sec['x'].values
     nx = x_sec.size
     nt = ds.time.size
@@ -352,9 +452,14 @@ def calibration_double_ended_solver(
     p0_est = np.concatenate((np.asarray([485.] + 2 * nt * [1.4]),
                              E_all_guess[ix_sec], nta * nt * 2 * [0.]))
 
-    E, Z_D, Z_gamma, Zero_d, Zero_gamma, Z_TA_fw, Z_TA_bw, Z_TA_E, Zero_E, \
-        Z_TA_att, Z_D_att, Zero_gamma_att, Zero_E_att = construct_submatrices(
-            nt, nx, st_label, ds, transient_asym_att_x, x_sec)
+    if x0 is not None:
+        p0_est = np.asarray(x0, dtype=float)
+
+    if solver != 'matrix_free':
+        E, Z_D, Z_gamma, Zero_d, Zero_gamma, Z_TA_fw, Z_TA_bw, Z_TA_E, \
+            Zero_E, Z_TA_att, Z_D_att, Zero_gamma_att, Zero_E_att = \
+            construct_submatrices(
+                nt, nx, st_label, ds, transient_asym_att_x, x_sec)
 
     # if matching_indices is not None:
     #     # The matching indices are location indices along the entire fiber.
@@ -389,13 +494,13 @@ def calibration_double_ended_solver(
     #     y_mF = (F[hix_sec] + F[tix_sec]).flatten()
     #     y_mB = (B[hix_sec] + B[tix_sec]).flatten()
 
-    # Stack all X's
-    X = sp.vstack(
-        (sp.hstack((Z_gamma, -Z_D, Zero_d, -E, Z_TA_fw)),
-         sp.hstack((Z_gamma, Zero_d, -Z_D, E, Z_TA_bw)),
-         sp.hstack((Zero_gamma, Z_D / 2, -Z_D / 2, E, Z_TA_E)),
-         sp.hstack((Zero_gamma_att, Z_D_att / 2, -Z_D_att / 2, Zero_E_att,
-                    Z_TA_att))))
+        # Stack all X's
+        X = sp.vstack(
+            (sp.hstack((Z_gamma, -Z_D, Zero_d, -E, Z_TA_fw)),
+             sp.hstack((Z_gamma, Zero_d, -Z_D, E, Z_TA_bw)),
+             sp.hstack((Zero_gamma, Z_D / 2, -Z_D / 2, E, Z_TA_E)),
+             sp.hstack((Zero_gamma_att, Z_D_att / 2, -Z_D_att / 2,
+                        Zero_E_att, Z_TA_att))))
 
     # y  # Eq.41--45
     y_F = np.log(ds_sec[st_label] / ds_sec[ast_label]).values.ravel()
@@ -428,14 +533,14 @@ def calibration_double_ended_solver(
             ds_sec[rst_label] ** -2 * rst_var / 2 +
             ds_sec[rast_label] ** -2 * rast_var / 2).values.ravel()
         w_att2 = 1 / (
-            ds[st_label].isel(x=0) ** -2 * st_var / 2 +
-            ds[ast_label].isel(x=0) ** -2 * ast_var / 2 +
-            ds[rst_label].isel(x=0) ** -2 * rst_var / 2 +
-            ds[rast_label].isel(x=0) ** -2 * rast_var / 2 +
-            ds[st_label].isel(x=-1) ** -2 * st_var / 2 +
-            ds[ast_label].isel(x=-1) ** -2 * ast_var / 2 +
-            ds[rst_label].isel(x=-1) ** -2 * rst_var / 2 +
-            ds[rast_label].isel(x=-1) ** -2 * rast_var / 2).values
+            ds[st_label].isel(x=0).astype(float) ** -2 * st_var / 2 +
+            ds[ast_label].isel(x=0).astype(float) ** -2 * ast_var / 2 +
+            ds[rst_label].isel(x=0).astype(float) ** -2 * rst_var / 2 +
+            ds[rast_label].isel(x=0).astype(float) ** -2 * rast_var / 2 +
+            ds[st_label].isel(x=-1).astype(float) ** -2 * st_var / 2 +
+            ds[ast_label].isel(x=-1).astype(float) ** -2 * ast_var / 2 +
+            ds[rst_label].isel(x=-1).astype(float) ** -2 * rst_var / 2 +
+            ds[rast_label].isel(x=-1).astype(float) ** -2 * rast_var / 2).values
 
     else:  # OLS
         w_F = np.ones(nt * nx)
@@ -445,10 +550,13 @@ def calibration_double_ended_solver(
 
     w = np.concatenate((w_F, w_B, w_att1, w_att2))
 
+    cov_blocks = cov_blocks_per_time(nt, nta, 1, 1 + 2 * nt + nx)
+
     if solver == 'sparse':
         if calc_cov:
             p_sol, p_var, p_cov = wls_sparse(
-                X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose)
+                X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose,
+                cov_rows=[0], cov_blocks=cov_blocks)
         else:
             p_sol, p_var = wls_sparse(
                 X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose)
@@ -456,11 +564,77 @@ def calibration_double_ended_solver(
     elif solver == 'stats':
         if calc_cov:
             p_sol, p_var, p_cov = wls_stats(
-                X, y, w=w, calc_cov=calc_cov, verbose=verbose)
+                X, y, w=w, calc_cov=calc_cov, verbose=verbose,
+                cov_rows=[0], cov_blocks=cov_blocks)
         else:
             p_sol, p_var = wls_stats(
                 X, y, w=w, calc_cov=calc_cov, verbose=verbose)
 
+    elif solver == 'block':
+        ix_E = 1 + 2 * nt + np.arange(nx)
+
+        if calc_cov:
+            p_sol, p_var, p_cov = wls_block(
+                X, y, w=w, ix_diag=ix_E, calc_cov=calc_cov, verbose=verbose,
+                cov_rows=[0], cov_blocks=cov_blocks)
+        else:
+            p_sol, p_var = wls_block(
+                X, y, w=w, ix_diag=ix_E, calc_cov=calc_cov, verbose=verbose)
+
+    elif solver == 'matrix_free':
+        # Row blocks of the observations. See design_operator
+        # I_fw = 1/Tref*gamma - D_fw - E - TA_fw
+        # I_bw = 1/Tref*gamma - D_bw + E - TA_bw
+        # (I_bw - I_fw) / 2 = D_fw/2 - D_bw/2 + E + TA_fw/2 - TA_bw/2 Eq42
+        cal_ref = np.array(ds.ufunc_per_section(
+            label=st_label, ref_temp_broadcasted=True, calc_per='all'))
+        data_gamma = 1 / (cal_ref + 273.15)  # gamma
+        i_E = 1 + 2 * nt
+
+        terms_F = [(0, None, data_gamma), (1, 1, -1.), (i_E, 0, -1.)]
+        terms_B = [(0, None, data_gamma), (1 + nt, 1, -1.), (i_E, 0, 1.)]
+        terms_att1 = [(1, 1, 0.5), (1 + nt, 1, -0.5), (i_E, 0, 1.)]
+        terms_att2 = [(1, 1, 0.5), (1 + nt, 1, -0.5)]
+
+        for ita, transient_asym_att_xi in enumerate(
+                transient_asym_att_x or []):
+            ix_sec_ta_ix0 = connector_index(transient_asym_att_xi, x_sec)
+            ta_fw = (np.arange(nx) >= ix_sec_ta_ix0)[:, None].astype(float)
+            ta_bw = 1. - ta_fw
+            i_TA = 1 + 2 * nt + nx + 2 * nt * ita
+
+            terms_F.append((i_TA, 1, -ta_fw))
+            terms_B.append((i_TA + nt, 1, -ta_bw))
+            terms_att1.extend([(i_TA, 1, ta_fw / 2),
+                               (i_TA + nt, 1, -ta_bw / 2)])
+
+        blocks = [
+            dict(shape=(nx, nt), w=w_F.reshape(nx, nt), terms=terms_F),
+            dict(shape=(nx, nt), w=w_B.reshape(nx, nt), terms=terms_B),
+            dict(shape=(nx, nt), w=w_att1.reshape(nx, nt), terms=terms_att1),
+            dict(shape=(1, nt), w=w_att2.reshape(1, nt), terms=terms_att2)]
+        npar = 1 + 2 * nt + nx + nta * nt * 2
+
+        if calc_cov:
+            p_sol, p_var, p_cov = wls_matrix_free(
+                blocks, y, npar=npar, x0=p0_est, calc_cov=calc_cov,
+                verbose=verbose, cov_rows=[0], cov_blocks=cov_blocks,
+                **(solver_kwargs or {}))
+        else:
+            p_sol, p_var = wls_matrix_free(
+                blocks, y, npar=npar, x0=p0_est, calc_cov=calc_cov,
+                verbose=verbose, **(solver_kwargs or {}))
+
+    elif solver == 'lsmr':
+        if calc_cov:
+            p_sol, p_var, p_cov = wls_lsmr(
+                X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose,
+                cov_rows=[0], cov_blocks=cov_blocks, **(solver_kwargs or {}))
+        else:
+            p_sol, p_var = wls_lsmr(
+                X, y, w=w, x0=p0_est, calc_cov=calc_cov, verbose=verbose,
+                **(solver_kwargs or {}))
+
     elif solver == 'external':
         return X, y, w, p0_est
 
@@ -531,17 +705,11 @@ def calibration_double_ended_solver(
     po_var[1 + 2 * nt + ix_sec] = p_var[1 + 2 * nt:1 + 2 * nt + nx]
 
     if calc_cov:
-        # the COV can be expensive to compute (in the least squares routine)
-        po_cov = np.diag(po_var).copy()
-
         from_i = np.concatenate((np.arange(1 + 2 * nt),
                                  1 + 2 * nt + ix_sec,
                                  np.arange(1 + 2 * nt + nx,
                                            1 + 2 * nt + nx + nta * nt * 2)))
-
-        iox_sec1, iox_sec2 = np.meshgrid(
-            from_i, from_i, indexing='ij')
-        po_cov[iox_sec1, iox_sec2] = p_cov
+        po_cov = expand_cov(p_cov, po_var, from_i)
 
         return po_sol, po_var, po_cov
 
@@ -549,7 +717,365 @@ def calibration_double_ended_solver(
         return po_sol, po_var
 
 
-def wls_sparse(X, y, w=1., calc_cov=False, verbose=False, **kwargs):
+def calibration_single_ended_fixed(
+        ds,
+        st_label,
+        ast_label,
+        st_var=None,
+        ast_var=None,
+        fix_gamma=None,
+        fix_dalpha=None,
+        calc_cov=True,
+        fix_cov=None):
+    """
+    Single-ended calibration with fixed gamma and dalpha. The remaining
+    parameter of each time step, c, is the weighted mean over the reference
+    sections, so that no system of equations needs to be solved. The sums
+    over the reference sections are computed in a single pass, also if the
+    Stokes data are Dask arrays. The weights of the observations and the
+    residual variance are identical to those of the solvers, thus the
+    results are the same as `wls_sparse` with the coefficients of c only.
+
+    Parameters
+    ----------
+    ds : DataStore
+    st_label : str
+    ast_label : str
+    st_var : float, array-like, optional
+        If `None` use ols calibration.
+    ast_var : float, array-like, optional
+        If `None` use ols calibration.
+    fix_gamma : tuple
+        The value of gamma and its variance
+    fix_dalpha : tuple
+        The value of dalpha and its variance
+    calc_cov : bool or {'full', 'diag', 'blocks'}
+        Whether to return the covariance matrix of c, which is diagonal.
+        'diag' and 'blocks' return a sparse matrix.
+    fix_cov : array-like, optional
+        Covariance matrix of gamma and dalpha, e.g., estimated with
+        `datastore_utils.calibrate_time_windows`. If given, their
+        uncertainty is propagated into c, c being linear in gamma and
+        dalpha, instead of being added to the variance of the
+        observations. `p_var` then includes it, and `p_cov` is the
+        covariance matrix of all parameters, [gamma, dalpha, c]. With
+        'blocks' it is sparse, with full rows for gamma and dalpha and the
+        covariance among the c's only on the diagonal.
+
+    Returns
+    -------
+    p_sol : ndarray
+        c of each time step
+    p_var : ndarray
+    p_cov : ndarray or scipy.sparse.csr_matrix, optional
+        Only if `calc_cov`
+    """
+    ix_sec = ds.ufunc_per_section(x_indices=True, calc_per='all')
+    ds_sec = ds.isel(x=ix_sec)
+
+    x_sec = ds_sec['x'].values[:, None]
+    nx = x_sec.size
+    nt = ds.time.size
+
+    st = ds_sec[st_label].data.astype(float)
+    ast = ds_sec[ast_label].data.astype(float)
+    cal_ref = ds.ufunc_per_section(
+        label=st_label, ref_temp_broadcasted=True, calc_per='all')
+    data_gamma = 1 / (cal_ref + 273.15)  # gamma
+
+    # Move the coefficients times the fixed parameters to the observations.
+    # The coefficients of dalpha and c are -x and -1
+    y = np.log(st / ast) - fix_gamma[0] * data_gamma + fix_dalpha[0] * x_sec
+
+    if st_var is not None and fix_cov is not None:
+        w = 1 / (st ** -2 * st_var + ast ** -2 * ast_var)
+
+    elif st_var is not None:
+        # variances are added. weight is the inverse of the variance
+        # of the observations. The variance of a fixed parameter enters
+        # times its coefficient squared
+        w = 1 / (st ** -2 * st_var + ast ** -2 * ast_var +
+                 fix_gamma[1] * data_gamma ** 2 + fix_dalpha[1] * x_sec ** 2)
+
+    else:
+        w = np.ones((nx, nt))
+
+    sw, swy, swyy, swg, swx = dask.compute(
+        w.sum(axis=0), (w * y).sum(axis=0), (w * y ** 2).sum(axis=0),
+        (w * data_gamma).sum(axis=0), (w * x_sec).sum(axis=0))
+
+    p_sol = -swy / sw
+
+    # sum(w * (y + c) ** 2)
+    err_var = np.sum(swyy - swy ** 2 / sw) / (nx * nt - nt)
+    p_var = err_var / sw
+
+    if fix_cov is not None:
+        # The derivatives of c to gamma and dalpha, the weighted means of
+        # their coefficients
+        fix_cov = np.asarray(fix_cov, dtype=float)
+        g = np.stack((swg / sw, -swx / sw), axis=1)
+        cov_cg = np.dot(g, fix_cov)
+        p_var = p_var + np.sum(cov_cg * g, axis=1)
+
+        if not calc_cov:
+            return p_sol, p_var
+
+        elif calc_cov is True or calc_cov == 'full':
+            p_cov = np.zeros((nt + 2, nt + 2))
+            p_cov[:2, :2] = fix_cov
+            p_cov[2:, :2] = cov_cg
+            p_cov[:2, 2:] = cov_cg.T
+            p_cov[2:, 2:] = np.dot(cov_cg, g.T)
+            p_cov[2 + np.arange(nt), 2 + np.arange(nt)] = p_var
+            return p_sol, p_var, p_cov
+
+        elif calc_cov == 'diag':
+            return p_sol, p_var, sp.diags(
+                np.concatenate((np.diag(fix_cov), p_var)), format='csr')
+
+        else:
+            ic = 2 + np.arange(nt)
+            row = np.concatenate(([0, 0, 1, 1], ic, ic, ic, [0] * nt,
+                                  [1] * nt))
+            col = np.concatenate(([0, 1, 0, 1], ic, [0] * nt, [1] * nt, ic,
+                                  ic))
+            data = np.concatenate((
+                fix_cov.ravel(), p_var, cov_cg[:, 0], cov_cg[:, 1],
+                cov_cg[:, 0], cov_cg[:, 1]))
+            return p_sol, p_var, sp.csr_matrix(
+                (data, (row, col)), shape=(nt + 2, nt + 2))
+
+    if not calc_cov:
+        return p_sol, p_var
+
+    elif calc_cov is True or calc_cov == 'full':
+        return p_sol, p_var, np.diag(p_var)
+
+    else:
+        return p_sol, p_var, sp.diags(p_var, format='csr')
+
+
+def calibration_double_ended_fixed(
+        ds,
+        st_label,
+        ast_label,
+        rst_label,
+        rast_label,
+        st_var=None,
+        ast_var=None,
+        rst_var=None,
+        rast_var=None,
+        fix_gamma=None,
+        fix_alpha=None,
+        calc_cov=True):
+    """
+    Double-ended calibration with fixed gamma and alpha and without
+    transient attenuation. What remains are D_fw and D_bw of each time
+    step. Their normal equations are a 2x2 system per time step, which is
+    solved in closed form for all time steps at once. The sums over the
+    reference sections are computed in a single pass, also if the Stokes
+    data are Dask arrays. The weights of the observations and the residual
+    variance are identical to those of the solvers.
+
+    Parameters
+    ----------
+    ds : DataStore
+    st_label : str
+    ast_label : str
+    rst_label : str
+    rast_label : str
+    st_var, ast_var, rst_var, rast_var : float, array-like, optional
+        If `None` use ols calibration.
+    fix_gamma : tuple
+        The value of gamma and its variance
+    fix_alpha : tuple
+        The values of alpha and their variances of all locations
+    calc_cov : bool or {'full', 'diag', 'blocks'}
+        Whether to return the covariance matrix of [D_fw, D_bw]. Only D_fw
+        and D_bw of the same time step are correlated. 'diag' returns a
+        sparse matrix with the variances and 'blocks' also with these
+        covariances.
+
+    Returns
+    -------
+    p_sol : ndarray
+        [D_fw, D_bw] of each time step
+    p_var : ndarray
+    p_cov : ndarray or scipy.sparse.csr_matrix, optional
+        Only if `calc_cov`
+    """
+    ix_sec = ds.ufunc_per_section(x_indices=True, calc_per='all')
+    ds_sec = ds.isel(x=ix_sec)
+
+    nx = ix_sec.size
+    nt = ds.time.size
+
+    st, ast, rst, rast = [
+        ds_sec[k].data.astype(float)
+        for k in (st_label, ast_label, rst_label, rast_label)]
+    cal_ref = ds.ufunc_per_section(
+        label=st_label, ref_temp_broadcasted=True, calc_per='all')
+    data_gamma = 1 / (cal_ref + 273.15)  # gamma
+    E = np.asarray(fix_alpha[0])[ix_sec, None]
+    E_var = np.asarray(fix_alpha[1])[ix_sec, None]
+
+    # Move the coefficients times the fixed parameters to the observations
+    # I_fw = 1/Tref*gamma - D_fw - E
+    # I_bw = 1/Tref*gamma - D_bw + E
+    # (I_bw - I_fw) / 2 = D_fw/2 - D_bw/2 + E
+    y_F = np.log(st / ast)
+    y_B = np.log(rst / rast)
+    y_att1 = (y_B - y_F) / 2 - E
+    y_F = y_F - fix_gamma[0] * data_gamma + E
+    y_B = y_B - fix_gamma[0] * data_gamma - E
+    # (I_bw - I_fw) / 2 at both ends: D_fw/2 - D_bw/2
+    y_att2 = -(np.log(st[0] / ast[0]) + np.log(st[-1] / ast[-1]) -
+               np.log(rst[0] / rast[0]) - np.log(rst[-1] / rast[-1])) / 4
+
+    if st_var is not None:
+        # variances are added. weight is the inverse of the variance
+        # of the observations. The variance of a fixed parameter enters
+        # times its coefficient squared, that of E with a coefficient of 1
+        w_F = 1 / (st ** -2 * st_var + ast ** -2 * ast_var +
+                   E_var + fix_gamma[1] * data_gamma ** 2)
+        w_B = 1 / (rst ** -2 * rst_var + rast ** -2 * rast_var +
+                   E_var + fix_gamma[1] * data_gamma ** 2)
+        w_att1 = 1 / (
+            st ** -2 * st_var / 2 + ast ** -2 * ast_var / 2 +
+            rst ** -2 * rst_var / 2 + rast ** -2 * rast_var / 2 + E_var)
+        w_att2 = 1 / sum(
+            ds[k].isel(x=ix).data.astype(float) ** -2 * k_var / 2
+            for ix in (0, -1)
+            for k, k_var in ((st_label, st_var), (ast_label, ast_var),
+                             (rst_label, rst_var), (rast_label, rast_var)))
+
+    else:
+        w_F = np.ones((nx, nt))
+        w_B = np.ones((nx, nt))
+        w_att1 = np.ones((nx, nt))
+        w_att2 = np.ones(nt)
+
+    sums = dask.compute(
+        w_F.sum(axis=0), w_B.sum(axis=0), w_att1.sum(axis=0),
+        (w_F * y_F).sum(axis=0), (w_B * y_B).sum(axis=0),
+        (w_att1 * y_att1).sum(axis=0),
+        (w_F * y_F ** 2 + w_B * y_B ** 2 + w_att1 * y_att1 ** 2).sum(axis=0),
+        w_att2, y_att2)
+    sw_F, sw_B, sw_att1, swy_F, swy_B, swy_att1, swyy, w_att2, y_att2 = sums
+
+    # Normal equations per time step. The coefficients of D_fw and D_bw
+    # are -1 and 0 (F), 0 and -1 (B) and 1/2 and -1/2 (att1 and att2)
+    sw_att = (sw_att1 + w_att2) / 4
+    n11 = sw_F + sw_att
+    n22 = sw_B + sw_att
+    n12 = -sw_att
+    b1 = -swy_F + (swy_att1 + w_att2 * y_att2) / 2
+    b2 = -swy_B - (swy_att1 + w_att2 * y_att2) / 2
+    det = n11 * n22 - n12 ** 2
+
+    d_fw = (n22 * b1 - n12 * b2) / det
+    d_bw = (n11 * b2 - n12 * b1) / det
+    p_sol = np.concatenate((d_fw, d_bw))
+
+    # The weighted sum of squared residuals is sum(w * y ** 2) - p.T b
+    rss = np.sum(swyy + w_att2 * y_att2 ** 2 - d_fw * b1 - d_bw * b2)
+    err_var = rss / (3 * nx * nt + nt - 2 * nt)
+
+    # The inverse of the normal matrix per time step
+    p_var = np.concatenate((n22 / det, n11 / det)) * err_var
+    p_cov_fb = -n12 / det * err_var
+
+    if not calc_cov:
+        return p_sol, p_var
+
+    ix = np.arange(nt)
+    p_cov = sp.coo_matrix(
+        (np.concatenate((p_var, p_cov_fb, p_cov_fb)),
+         (np.concatenate((np.arange(2 * nt), ix, nt + ix)),
+          np.concatenate((np.arange(2 * nt), nt + ix, ix)))),
+        shape=(2 * nt, 2 * nt))
+
+    if calc_cov is True or calc_cov == 'full':
+        return p_sol, p_var, p_cov.toarray()
+
+    elif calc_cov == 'diag':
+        return p_sol, p_var, sp.diags(p_var, format='csr')
+
+    else:
+        return p_sol, p_var, p_cov.tocsr()
+
+
+def cov_blocks_per_time(nt, nta, i_d, i_ta):
+    """
+    Indices of the double-ended parameters per time step: D_fw, D_bw and
+    the transient attenuation of each connector. Used as `cov_blocks` for
+    `calc_cov='blocks'`.
+
+    Parameters
+    ----------
+    nt : int
+        Number of time steps
+    nta : int
+        Number of connectors with transient asymmetrical attenuation
+    i_d : int
+        Index of the first D_fw parameter
+    i_ta : int
+        Index of the first transient attenuation parameter
+
+    Returns
+    -------
+    cov_blocks : list of ndarray
+    """
+    return [
+        np.concatenate(([i_d + it, i_d + nt + it],
+                        i_ta + it + nt * np.arange(2 * nta)))
+        for it in range(nt)]
+
+
+def expand_cov(p_cov, p_var, from_i):
+    """
+    Embed the covariance matrix of a subset of the parameters in the
+    covariance matrix of all parameters. The other parameters, e.g. fixed
+    parameters or the integrated differential attenuation outside the
+    reference sections, only have a variance.
+
+    Parameters
+    ----------
+    p_cov : array-like or scipy.sparse matrix
+        Covariance matrix of the subset of parameters
+    p_var : array-like
+        Variance of all parameters
+    from_i : array-like of int
+        Indices of the subset of parameters in all parameters
+
+    Returns
+    -------
+    po_cov : ndarray or scipy.sparse.csr_matrix
+        Sparse if `p_cov` is sparse
+    """
+    npar = p_var.size
+
+    if sp.issparse(p_cov):
+        p_cov = p_cov.tocoo()
+        not_from_i = np.setdiff1d(np.arange(npar), from_i)
+
+        return sp.coo_matrix(
+            (np.concatenate((p_cov.data, p_var[not_from_i])),
+             (np.concatenate((from_i[p_cov.row], not_from_i)),
+              np.concatenate((from_i[p_cov.col], not_from_i)))),
+            shape=(npar, npar)).tocsr()
+
+    # whether it returns a copy or a view depends on what
+    # version of numpy you are using
+    po_cov = np.diag(p_var).copy()
+    po_cov[np.ix_(from_i, from_i)] = p_cov
+
+    return po_cov
+
+
+def wls_sparse(X, y, w=1., calc_cov=False, verbose=False, cov_rows=None,
+               cov_blocks=None, **kwargs):
     """
 
     Parameters
@@ -557,8 +1083,16 @@ def wls_sparse(X, y, w=1., calc_cov=False, verbose=False, **kwargs):
     X
     y
     w
-    calc_cov
+    calc_cov : bool or {'full', 'diag', 'blocks'}
+        If True or 'full', return the dense covariance matrix. 'diag' and
+        'blocks' return a sparse matrix with the variances and, for
+        'blocks', the covariances in `cov_rows` and `cov_blocks`. See
+        `cov_subset`.
     verbose
+    cov_rows : array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+    cov_blocks : list of array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
     kwargs
 
     Returns
@@ -601,34 +1135,12 @@ def wls_sparse(X, y, w=1., calc_cov=False, verbose=False, **kwargs):
     if calc_cov:
         # assert np.any()
         arg = wX.T.dot(wX)
+        solve_normal = factorize_normal(arg)
 
-        if sp.issparse(arg):
-            # arg is square of size double: 1 + nt + no; single: 2 : nt
-            # arg_inv = np.linalg.inv(arg.toarray())
-            arg_inv = np.linalg.lstsq(
-                arg.todense(), np.eye(npar), rcond=None)[0]
-        else:
-            # arg_inv = np.linalg.inv(arg)
-            arg_inv = np.linalg.lstsq(
-                arg, np.eye(npar), rcond=None)[0]
-
-        # for tall systems pinv (approximate) is recommended above inv
-        # https://vene.ro/blog/inverses-pseudoinverses-numerical-issues-spee
-        # d-symmetry.html
-        # but better to solve with eye
-        # p_cov = np.array(np.linalg.pinv(arg) * err_var)
-        # arg_inv = np.linalg.pinv(arg)
-        # else:
-        #     try:
-        #         arg_inv = np.linalg.lstsq(arg, np.eye(nobs), rcond=None)[0]
-        #
-        #     except MemoryError:
-        #         print('Try calc_cov = False and p_cov = np.diag(p_var); '
-        #               'And neglect the covariances.')
-        #         arg_inv = np.linalg.lstsq(arg, np.eye(nobs), rcond=None)[0]
-
-        p_cov = np.array(arg_inv * err_var)
-        p_var = np.diagonal(p_cov)
+        p_cov = cov_subset(
+            solve_normal, npar, calc_cov=calc_cov, cov_rows=cov_rows,
+            cov_blocks=cov_blocks) * err_var
+        p_var = p_cov.diagonal()
 
         assert np.all(p_var >= 0), 'Unable to invert the matrix' + str(p_var)
 
@@ -639,7 +1151,683 @@ def wls_sparse(X, y, w=1., calc_cov=False, verbose=False, **kwargs):
         return p_sol, p_var
 
 
-def wls_stats(X, y, w=1., calc_cov=False, verbose=False):
+def factorize_normal(arg):
+    """
+    Factorize the normal matrix, `X.T W X`, for solving the normal
+    equations repeatedly, e.g. per batch of columns in `cov_subset`.
+
+    Parameters
+    ----------
+    arg : array-like or scipy.sparse matrix
+        The normal matrix of shape (npar, npar)
+
+    Returns
+    -------
+    solve_normal : callable
+        `solve_normal(rhs)` solves the normal equations for a right hand
+        side of shape (npar, n)
+    """
+    npar = arg.shape[0]
+
+    if sp.issparse(arg):
+        # arg is square of size double: 1 + nt + no; single: 2 : nt
+        # Factorize the sparse normal matrix instead of computing a dense
+        # inverse. The covariance is obtained per batch of columns.
+        try:
+            lu = ln.splu(sp.csc_matrix(arg))
+            return lu.solve
+
+        except RuntimeError:
+            # Singular matrix. Fall back to the least squares inverse
+            arg = arg.toarray()
+
+    # arg_inv = np.linalg.inv(arg)
+    arg_inv = np.linalg.lstsq(arg, np.eye(npar), rcond=None)[0]
+
+    def solve_normal(rhs):
+        return np.dot(arg_inv, rhs)
+
+    return solve_normal
+
+
+def cov_subset(solve_normal, npar, calc_cov='full', cov_rows=None,
+               cov_blocks=None, batch_size=256):
+    """
+    Assemble the (unscaled) covariance matrix, the inverse of the normal
+    matrix, from solutions of the normal equations. The solutions are
+    computed per batch of `batch_size` columns, so that only the requested
+    entries are kept in memory.
+
+    Parameters
+    ----------
+    solve_normal : callable
+        `solve_normal(rhs)` solves the normal equations for a right hand
+        side of shape (npar, n)
+    npar : int
+        Number of parameters
+    calc_cov : bool or {'full', 'diag', 'blocks'}
+        True or 'full' returns the dense covariance matrix. 'diag' returns
+        only the variances. 'blocks' returns the variances, the full rows
+        and columns of the parameters in `cov_rows`, e.g. gamma, and the
+        covariances within each group of parameters in `cov_blocks`, e.g.
+        the parameters of a single time step.
+    cov_rows : array-like of int, optional
+    cov_blocks : list of array-like of int, optional
+    batch_size : int
+
+    Returns
+    -------
+    p_cov : ndarray or scipy.sparse.csr_matrix
+        Dense if `calc_cov` is 'full', sparse otherwise
+    """
+    if calc_cov is True or calc_cov == 'full':
+        p_cov = np.empty((npar, npar))
+
+        for i0 in range(0, npar, batch_size):
+            ix = np.arange(i0, min(i0 + batch_size, npar))
+            rhs = np.zeros((npar, ix.size))
+            rhs[ix, np.arange(ix.size)] = 1.
+            p_cov[:, ix] = solve_normal(rhs)
+
+        return p_cov
+
+    elif calc_cov not in ('diag', 'blocks'):
+        raise ValueError("Choose a valid calc_cov")
+
+    if calc_cov == 'diag' or cov_rows is None:
+        cov_rows = []
+
+    if calc_cov == 'diag' or cov_blocks is None:
+        cov_blocks = []
+
+    cov_rows = np.asarray(cov_rows, dtype=int)
+    cov_blocks = [np.asarray(block, dtype=int) for block in cov_blocks]
+
+    block_of = np.full(npar, -1, dtype=int)
+    for i_block, block in enumerate(cov_blocks):
+        block_of[block] = i_block
+
+    is_row = np.zeros(npar, dtype=bool)
+    is_row[cov_rows] = True
+
+    rows, cols, data = [], [], []
+
+    for i0 in range(0, npar, batch_size):
+        ix = np.arange(i0, min(i0 + batch_size, npar))
+        rhs = np.zeros((npar, ix.size))
+        rhs[ix, np.arange(ix.size)] = 1.
+        sol = solve_normal(rhs)
+
+        for i_col, col in enumerate(ix):
+            if is_row[col]:
+                irow = np.arange(npar)
+
+            elif block_of[col] >= 0:
+                irow = np.unique(np.concatenate(
+                    ([col], cov_rows, cov_blocks[block_of[col]])))
+
+            else:
+                irow = np.unique(np.concatenate(([col], cov_rows)))
+
+            rows.append(irow)
+            cols.append(np.full(irow.size, col))
+            data.append(sol[irow, i_col])
+
+    return sp.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(npar, npar))
+
+
+def wls_structured(U, y, w=1., calc_cov=False, verbose=False,
+                   cov_rows=None, cov_blocks=None):
+    """
+    Weighted least squares for the arrow-shaped coefficient matrix of the
+    single-ended calibration, solved from the per-time arrays of the
+    observations without assembling the coefficient matrix. Each
+    observation `y[ix, it]` has the coefficients `U[g][ix, it]` for the
+    global parameters, e.g. gamma and dalpha, and -1 for the intercept of
+    time step `it`.
+
+    The intercepts are eliminated analytically with the Schur complement of
+    the normal equations. What remains is a small system for the global
+    parameters. The intercepts and the exact (co)variances follow in
+    O(nx * nt) operations, without iterations.
+
+    Parameters
+    ----------
+    U : list of array-like
+        Coefficients of the global parameters, each broadcastable to the
+        shape of `y`, e.g. `1 / T_ref` of shape (nx, nt) for gamma and
+        `-x_sec[:, None]` for dalpha
+    y : array-like
+        Observations of shape (nx, nt)
+    w : float or array-like
+        Weights of the observations, of size nx * nt or broadcastable to the
+        shape of `y`
+    calc_cov : bool or {'full', 'diag', 'blocks'}
+        Whether to return the full covariance matrix, or a sparse matrix
+        with only the entries selected by `cov_subset`
+    verbose : bool
+    cov_rows : array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+    cov_blocks : list of array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+
+    Returns
+    -------
+    p_sol : ndarray
+        The global parameters followed by the nt intercepts
+    p_var : ndarray
+    p_cov : ndarray, optional
+        Only returned if `calc_cov` is True
+    """
+    y = np.asarray(y, dtype=float)
+    nx, nt = y.shape
+    nobs = y.size
+    ng = len(U)
+
+    w = np.asarray(w, dtype=float)
+    if w.size == nobs:
+        w = w.reshape((nx, nt))
+    else:
+        w = np.broadcast_to(w, (nx, nt))
+
+    U = [np.broadcast_to(np.asarray(u, dtype=float), (nx, nt)) for u in U]
+    wU = [w * u for u in U]
+
+    # Blocks of the normal equations [[A, B^T], [B, diag(d)]]
+    A = np.array([[np.sum(wu * u) for u in U] for wu in wU]).reshape(ng, ng)
+    B = -np.array([wu.sum(axis=0) for wu in wU]).reshape(ng, nt).T
+    d = w.sum(axis=0)
+    b_g = np.array([np.sum(wu * y) for wu in wU])
+    b_c = -(w * y).sum(axis=0)
+
+    # Schur complement of the intercept block
+    V = B / d[:, None]
+    S = A - np.dot(B.T, V)
+
+    if ng:
+        S_inv = np.linalg.inv(S)
+    else:
+        S_inv = np.zeros((0, 0))
+
+    p_g = np.dot(S_inv, b_g - np.dot(V.T, b_c))
+    p_c = (b_c - np.dot(B, p_g)) / d
+    p_sol = np.concatenate((p_g, p_c))
+
+    # The residual degree of freedom, defined as the number of observations
+    # minus the rank of the regressor matrix.
+    resid = y + p_c[None]
+    for u, p_gi in zip(U, p_g):
+        resid = resid - u * p_gi
+
+    err_var = np.sum(w * resid ** 2) / (nobs - ng - nt)
+
+    if verbose:
+        print('Residual variance of the structured solver:', err_var)
+
+    p_var_g = np.diagonal(S_inv) * err_var
+    p_var_c = (1 / d + np.einsum('tg,gh,th->t', V, S_inv, V)) * err_var
+    p_var = np.concatenate((p_var_g, p_var_c))
+
+    if calc_cov in ('diag', 'blocks'):
+        def solve_normal(rhs):
+            sol_g = np.dot(S_inv, rhs[:ng] - np.dot(V.T, rhs[ng:]))
+            sol_c = (rhs[ng:] - np.dot(B, sol_g)) / d[:, None]
+            return np.concatenate((sol_g, sol_c))
+
+        p_cov = cov_subset(
+            solve_normal, ng + nt, calc_cov=calc_cov, cov_rows=cov_rows,
+            cov_blocks=cov_blocks) * err_var
+
+        return p_sol, p_var, p_cov
+
+    elif calc_cov:
+        p_cov = np.empty((ng + nt, ng + nt))
+        p_cov[:ng, :ng] = S_inv
+        p_cov[:ng, ng:] = -np.dot(S_inv, V.T)
+        p_cov[ng:, :ng] = p_cov[:ng, ng:].T
+        p_cov[ng:, ng:] = np.dot(np.dot(V, S_inv), V.T)
+        p_cov[ng + np.arange(nt), ng + np.arange(nt)] += 1 / d
+        p_cov *= err_var
+
+        return p_sol, p_var, p_cov
+
+    else:
+        return p_sol, p_var
+
+
+def wls_block(X, y, w=1., ix_diag=None, calc_cov=False, verbose=False,
+              cov_rows=None, cov_blocks=None):
+    """
+    Weighted least squares via the normal equations, for coefficient
+    matrices with a set of columns that do not share observations with
+    each other. For the double-ended calibration these are the columns of
+    E, the integrated differential attenuation per location, or the
+    columns of D_fw per time step if E is fixed. Their block of the normal
+    equations is diagonal and is eliminated with the Schur complement. Only
+    the remaining dense system, e.g. for gamma, D_fw, D_bw and the
+    transient attenuation, is factorized with Cholesky.
+
+    Parameters
+    ----------
+    X : array-like or sparse matrix
+        Coefficient matrix of shape (nobs, npar)
+    y : array-like
+        Observations of size nobs
+    w : float or array-like
+        Weights of the observations
+    ix_diag : array-like of int, optional
+        Indices of the columns of `X` that do not share observations with
+        each other. If None, all columns are solved in one dense system.
+    calc_cov : bool or {'full', 'diag', 'blocks'}
+        Whether to return the full covariance matrix, or a sparse matrix
+        with only the entries selected by `cov_subset`
+    verbose : bool
+    cov_rows : array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+    cov_blocks : list of array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+
+    Returns
+    -------
+    p_sol : ndarray
+    p_var : ndarray
+    p_cov : ndarray, optional
+        Only returned if `calc_cov` is True
+    """
+    y = np.asarray(y, dtype=float)
+    nobs = y.size
+    npar = X.shape[1]
+    w = np.broadcast_to(np.asarray(w, dtype=float), (nobs,))
+
+    if ix_diag is None:
+        ix_diag = []
+
+    ix_diag = np.asarray(ix_diag, dtype=int)
+    ix_rest = np.setdiff1d(np.arange(npar), ix_diag)
+
+    # Normal equations [[N_rr, N_rd], [N_rd^T, diag(d)]]
+    X = sp.csr_matrix(X)
+    N = X.T.dot(sp.diags(w)).dot(X).tocsr()
+    b = X.T.dot(w * y)
+
+    N_dd = N[ix_diag][:, ix_diag]
+    d = N_dd.diagonal()
+    assert (N_dd - sp.diags(d)).count_nonzero() == 0, \
+        'The columns in ix_diag share observations'
+
+    N_rd = N[ix_rest][:, ix_diag].toarray()
+    N_rr = N[ix_rest][:, ix_rest].toarray()
+
+    # Schur complement of the diagonal block
+    G = N_rd / d[None]
+    S = N_rr - np.dot(G, N_rd.T)
+
+    try:
+        K = sla.cho_solve(sla.cho_factor(S), np.eye(ix_rest.size))
+    except np.linalg.LinAlgError:
+        K = np.linalg.lstsq(S, np.eye(ix_rest.size), rcond=None)[0]
+
+    p_sol = np.empty(npar)
+    p_sol[ix_rest] = np.dot(K, b[ix_rest] - np.dot(G, b[ix_diag]))
+    p_sol[ix_diag] = (b[ix_diag] - np.dot(N_rd.T, p_sol[ix_rest])) / d
+
+    # The residual degree of freedom, defined as the number of observations
+    # minus the rank of the regressor matrix.
+    resid = y - X.dot(p_sol)
+    err_var = np.sum(w * resid ** 2) / (nobs - npar)
+
+    if verbose:
+        print('Residual variance of the block solver:', err_var)
+
+    KG = np.dot(K, G)
+
+    p_var = np.empty(npar)
+    p_var[ix_rest] = np.diagonal(K)
+    p_var[ix_diag] = 1 / d + np.sum(G * KG, axis=0)
+    p_var *= err_var
+
+    if calc_cov in ('diag', 'blocks'):
+        def solve_normal(rhs):
+            sol = np.empty_like(rhs)
+            sol[ix_rest] = np.dot(K, rhs[ix_rest] - np.dot(G, rhs[ix_diag]))
+            sol[ix_diag] = (rhs[ix_diag] -
+                            np.dot(N_rd.T, sol[ix_rest])) / d[:, None]
+            return sol
+
+        p_cov = cov_subset(
+            solve_normal, npar, calc_cov=calc_cov, cov_rows=cov_rows,
+            cov_blocks=cov_blocks) * err_var
+
+        return p_sol, p_var, p_cov
+
+    elif calc_cov:
+        p_cov = np.empty((npar, npar))
+        p_cov[np.ix_(ix_rest, ix_rest)] = K
+        p_cov[np.ix_(ix_rest, ix_diag)] = -KG
+        p_cov[np.ix_(ix_diag, ix_rest)] = -KG.T
+        p_cov[np.ix_(ix_diag, ix_diag)] = np.dot(G.T, KG)
+        p_cov[ix_diag, ix_diag] += 1 / d
+        p_cov *= err_var
+
+        return p_sol, p_var, p_cov
+
+    else:
+        return p_sol, p_var
+
+
+def design_operator(blocks, npar):
+    """
+    Matrix-free weighted coefficient matrix, `sqrt(w) * X`, that can be
+    passed directly to `scipy.sparse.linalg.lsqr` and `lsmr`. The matrix
+    vector products are computed from the arrays that describe the blocks
+    of rows of X, so that X is never constructed.
+
+    Parameters
+    ----------
+    blocks : list of dict
+        The blocks of rows of X. The observations of a block have the shape
+        `shape`, (n0, n1), and are ordered as `np.ravel`. The weights `w`
+        are broadcastable to `shape`. Each of the `terms`, `(col0, dim,
+        val)`, adds for observation (i0, i1) a coefficient `val[i0, i1]` to
+        column `col0` if `dim` is None, column `col0 + i0` if `dim` is 0 and
+        column `col0 + i1` if `dim` is 1. `val` is broadcastable to `shape`.
+    npar : int
+        Number of parameters
+
+    Returns
+    -------
+    wX : scipy.sparse.linalg.LinearOperator
+        Of shape (nobs, npar)
+    """
+    w_stds = [np.sqrt(np.broadcast_to(block['w'], block['shape']))
+              for block in blocks]
+    sizes = [int(np.prod(block['shape'])) for block in blocks]
+    offsets = np.cumsum([0] + sizes)
+    nobs = offsets[-1]
+
+    def matvec(p):
+        p = np.ravel(p)
+        out = np.empty(nobs)
+
+        for block, w_std, i0, i1 in zip(
+                blocks, w_stds, offsets[:-1], offsets[1:]):
+            Xp = np.zeros(block['shape'])
+
+            for col0, dim, val in block['terms']:
+                Xp += val * p[term_columns(col0, dim, block['shape'])]
+
+            out[i0:i1] = (w_std * Xp).ravel()
+
+        return out
+
+    def rmatvec(r):
+        r = np.ravel(r)
+        p = np.zeros(npar)
+
+        for block, w_std, i0, i1 in zip(
+                blocks, w_stds, offsets[:-1], offsets[1:]):
+            wr = w_std * r[i0:i1].reshape(block['shape'])
+
+            for col0, dim, val in block['terms']:
+                axis = tuple(i for i in (0, 1) if i != dim)
+                cols = term_columns(col0, dim, block['shape'])
+                p[np.ravel(cols)] += np.ravel(
+                    np.sum(val * wr, axis=axis, keepdims=True))
+
+        return p
+
+    return ln.LinearOperator(
+        (nobs, npar), matvec=matvec, rmatvec=rmatvec, dtype=float)
+
+
+def term_columns(col0, dim, shape):
+    """
+    Column indices of a term of a block of rows of X, broadcastable to
+    `shape`. See `design_operator`.
+    """
+    if dim is None:
+        return np.full((1, 1), col0, dtype=int)
+
+    elif dim == 0:
+        return col0 + np.arange(shape[0], dtype=int)[:, None]
+
+    else:
+        return col0 + np.arange(shape[1], dtype=int)[None, :]
+
+
+def normal_matrix(blocks, npar):
+    """
+    The normal matrix, `X.T W X`, of the blocks of rows of X that are
+    described in `design_operator`. It is computed from the products of
+    pairs of terms summed over the observations, so that X is never
+    constructed.
+
+    Parameters
+    ----------
+    blocks : list of dict
+        See `design_operator`
+    npar : int
+        Number of parameters
+
+    Returns
+    -------
+    arg : scipy.sparse.csr_matrix
+        Of shape (npar, npar)
+    """
+    rows, cols, data = [], [], []
+
+    for block in blocks:
+        shape = block['shape']
+        terms = block['terms']
+
+        for i, (col0_i, dim_i, val_i) in enumerate(terms):
+            for j, (col0_j, dim_j, val_j) in enumerate(terms[i:], start=i):
+                # Sum over the dimensions along which the columns are equal
+                axis = tuple(
+                    k for k in (0, 1) if k != dim_i and k != dim_j)
+                wvv = np.sum(
+                    np.broadcast_to(block['w'] * val_i * val_j, shape),
+                    axis=axis, keepdims=True)
+                row_ij, col_ij, data_ij = np.broadcast_arrays(
+                    term_columns(col0_i, dim_i, shape),
+                    term_columns(col0_j, dim_j, shape),
+                    wvv)
+
+                rows.append(row_ij.ravel())
+                cols.append(col_ij.ravel())
+                data.append(data_ij.ravel())
+
+                if i != j:
+                    rows.append(col_ij.ravel())
+                    cols.append(row_ij.ravel())
+                    data.append(data_ij.ravel())
+
+    # Duplicate entries are summed
+    return sp.coo_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(npar, npar)).tocsr()
+
+
+def wls_matrix_free(blocks, y, npar, calc_cov=False, verbose=False,
+                    cov_rows=None, cov_blocks=None, **kwargs):
+    """
+    Weighted least squares with lsqr and the matrix-free coefficient matrix
+    of `design_operator`. The peak memory usage is dominated by the
+    observations instead of by the sparse coefficient matrix. The
+    covariance matrix is obtained from the normal matrix that is computed
+    with `normal_matrix`.
+
+    Parameters
+    ----------
+    blocks : list of dict
+        The blocks of rows of X and their weights. See `design_operator`
+    y : array-like
+        The observations of all blocks, concatenated
+    npar : int
+        Number of parameters
+    calc_cov : bool or {'full', 'diag', 'blocks'}
+        See `wls_sparse`
+    verbose : bool
+    cov_rows : array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+    cov_blocks : list of array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+    kwargs
+        Passed to `scipy.sparse.linalg.lsqr`, e.g. x0
+
+    Returns
+    -------
+
+    """
+    wX = design_operator(blocks, npar)
+    w_std = np.concatenate([
+        np.sqrt(np.broadcast_to(block['w'], block['shape'])).ravel()
+        for block in blocks])
+    wy = w_std * y
+
+    out_sol = ln.lsqr(wX, wy, show=verbose, calc_var=True, **kwargs)
+    p_sol = out_sol[0]
+
+    nobs = len(y)
+    wresid = wy - wX.matvec(p_sol)
+    err_var = np.dot(wresid, wresid) / (nobs - npar)
+
+    if verbose:
+        print('Residual variance of the matrix-free solver:', err_var)
+
+    if calc_cov:
+        solve_normal = factorize_normal(normal_matrix(blocks, npar))
+
+        p_cov = cov_subset(
+            solve_normal, npar, calc_cov=calc_cov, cov_rows=cov_rows,
+            cov_blocks=cov_blocks) * err_var
+        p_var = p_cov.diagonal()
+
+        assert np.all(p_var >= 0), 'Unable to invert the matrix' + str(p_var)
+
+        return p_sol, p_var, p_cov
+
+    else:
+        p_var = out_sol[-1] * err_var  # normalized covariance
+        return p_sol, p_var
+
+
+def wls_lsmr(X, y, w=1., calc_cov=False, verbose=False, cov_rows=None,
+             cov_blocks=None, x0=None, atol=1e-8, btol=1e-8, iter_lim=None,
+             info=None):
+    """
+    Weighted least squares with lsmr and column equilibration. The columns
+    of X are badly scaled, e.g., the coefficients of gamma are about 1/300
+    while those of the other parameters are about 1. Each column of the
+    weighted X is scaled to unit norm, which reduces the number of
+    iterations and improves the accuracy at a given tolerance. A previous
+    solution can be passed as `x0` to start from, e.g., when calibrating
+    overlapping time windows.
+
+    The normal matrix is only factorized to obtain the covariance if
+    `calc_cov` is set. Otherwise the variances are estimated from the
+    diagonal of the normal matrix, neglecting the correlations between the
+    parameters. These are a lower bound of the variances.
+
+    Parameters
+    ----------
+    X : array-like or scipy.sparse matrix
+    y : array-like
+    w : array-like or float
+    calc_cov : bool or {'full', 'diag', 'blocks'}
+        See `wls_sparse`
+    verbose : bool
+    cov_rows : array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+    cov_blocks : list of array-like of int, optional
+        Only used if `calc_cov` is 'blocks'
+    x0 : array-like, optional
+        Initial estimate of the parameters
+    atol, btol : float
+        Stopping tolerances of `scipy.sparse.linalg.lsmr`
+    iter_lim : int, optional
+        Maximum number of iterations. Defaults to the number of parameters.
+    info : dict, optional
+        Is updated with the convergence diagnostics: the reason for
+        stopping, `istop`, see `scipy.sparse.linalg.lsmr`, the number of
+        iterations, the norm of the weighted residuals and the wall time of
+        the solve in seconds.
+
+    Returns
+    -------
+
+    """
+    if w is None:  # gracefully default to unweighted
+        w = 1.
+
+    w_std = np.asarray(np.sqrt(w))
+    wy = np.asarray(w_std * y)
+
+    w_std = np.broadcast_to(
+        np.atleast_2d(np.squeeze(w_std)).T, (X.shape[0], 1))
+
+    if not sp.issparse(X):
+        wX = w_std * X
+        col_norm = np.linalg.norm(wX, axis=0)
+    else:
+        wX = X.multiply(w_std).tocsr()
+        col_norm = np.sqrt(np.asarray(wX.multiply(wX).sum(axis=0)).ravel())
+
+    # Solve for the scaled parameters, p = col_scale * p_scaled
+    col_scale = 1 / np.where(col_norm > 0., col_norm, 1.)
+    wX_scaled = ln.aslinearoperator(wX) * ln.aslinearoperator(
+        sp.diags(col_scale))
+
+    if x0 is not None:
+        x0 = np.asarray(x0, dtype=float) / col_scale
+
+    t0 = time.perf_counter()
+    out_sol = ln.lsmr(
+        wX_scaled, wy, atol=atol, btol=btol, maxiter=iter_lim, show=verbose,
+        x0=x0)
+    wall_time = time.perf_counter() - t0
+
+    p_sol = out_sol[0] * col_scale
+
+    nobs = len(y)
+    npar = X.shape[1]
+    wresid = wy - wX.dot(p_sol)
+    err_var = np.dot(wresid, wresid) / (nobs - npar)
+
+    if info is not None:
+        info.update(
+            istop=int(out_sol[1]),
+            iterations=int(out_sol[2]),
+            residual_norm=float(np.linalg.norm(wresid)),
+            wall_time=wall_time)
+
+    if verbose:
+        print('Residual variance of the lsmr solver:', err_var)
+        print('Iterations of the lsmr solver:', out_sol[2])
+
+    if calc_cov:
+        # lsmr does not estimate the variances of the parameters
+        solve_normal = factorize_normal(wX.T.dot(wX))
+        p_cov = cov_subset(
+            solve_normal, npar, calc_cov=calc_cov, cov_rows=cov_rows,
+            cov_blocks=cov_blocks) * err_var
+        p_var = p_cov.diagonal()
+
+        assert np.all(p_var >= 0), 'Unable to invert the matrix' + str(p_var)
+
+        return p_sol, p_var, p_cov
+
+    else:
+        # Only the diagonal of the normal matrix, avoiding its
+        # factorization. A lower bound of the variances.
+        p_var = err_var / np.where(col_norm > 0., col_norm, np.nan) ** 2
+        return p_sol, p_var
+
+
+def wls_stats(X, y, w=1., calc_cov=False, verbose=False, cov_rows=None,
+              cov_blocks=None):
     """
 
     Parameters
@@ -647,8 +1835,10 @@ def wls_stats(X, y, w=1., calc_cov=False, verbose=False):
     X
     y
     w
-    calc_cov
+    calc_cov : bool or {'full', 'diag', 'blocks'}
     verbose
+    cov_rows : array-like of int, optional
+    cov_blocks : list of array-like of int, optional
 
     Returns
     -------
@@ -672,6 +1862,12 @@ def wls_stats(X, y, w=1., calc_cov=False, verbose=False):
     p_cov = res_wls.cov_params()
     p_var = res_wls.bse**2
 
+    if calc_cov in ('diag', 'blocks'):
+        cov_full = np.asarray(p_cov)
+        p_cov = cov_subset(
+            lambda rhs: np.dot(cov_full, rhs), p_sol.size, calc_cov=calc_cov,
+            cov_rows=cov_rows, cov_blocks=cov_blocks)
+
     if calc_cov:
         return p_sol, p_var, p_cov
     else:
@@ -0,0 +1,495 @@
+# coding=utf-8
+import numpy as np
+import scipy.sparse as sp
+import xarray as xr
+import yaml
+
+from .datastore_utils import get_p_cov
+
+
+class CalibrationModel:
+    """
+    The calibration parameters that are constant in time, together with the
+    sections, labels and variances of the Stokes signals with which they are
+    estimated. Applying the model to new measurements only requires the
+    parameters of each time step, c (single-ended) or D_fw and D_bw
+    (double-ended). These are obtained in closed form with the parameters of
+    the model fixed, which scales with nx * nt of the new measurements.
+
+    Single-ended models contain gamma and dalpha and their covariance matrix.
+    Double-ended models contain gamma and alpha and only their variances.
+    The errors of gamma and alpha are correlated, and these correlations are
+    not propagated by `apply`. The variances of D_fw, D_bw and the
+    temperatures of double-ended models are therefore lower bounds.
+
+    Create a model with `CalibrationModel.from_datastore` after a
+    calibration, store it with `to_netcdf` and load it with
+    `CalibrationModel.from_netcdf`.
+
+    Parameters
+    ----------
+    params : xarray.Dataset
+        The parameters of the model and, as attributes, the sections, labels
+        and variances.
+    """
+
+    def __init__(self, params):
+        self.params = params
+
+    def __repr__(self):
+        s = ['<dtscalibration.CalibrationModel>']
+        s.append(
+            'Double-ended' if self.is_double_ended else 'Single-ended')
+        s.append('Sections: ' + ', '.join(self.sections))
+        s.append(f"gamma: {float(self.params['gamma']):.4f}")
+        return '\n'.join(s)
+
+    @property
+    def is_double_ended(self):
+        return bool(self.params.attrs['isDoubleEnded'])
+
+    @property
+    def sections(self):
+        return yaml.load(self.params.attrs['_sections'],
+                         Loader=yaml.UnsafeLoader)
+
+    @property
+    def labels(self):
+        """The labels of the Stokes signals"""
+        return yaml.safe_load(self.params.attrs['labels'])
+
+    @property
+    def variances(self):
+        """The variances of the noise of the Stokes signals. None for models
+        estimated with ols"""
+        return yaml.safe_load(self.params.attrs['variances'])
+
+    @classmethod
+    def from_datastore(
+            cls,
+            ds,
+            st_label='ST',
+            ast_label='AST',
+            rst_label='REV-ST',
+            rast_label='REV-AST',
+            st_var=None,
+            ast_var=None,
+            rst_var=None,
+            rast_var=None,
+            store_gamma='gamma',
+            store_dalpha='dalpha',
+            store_alpha='alpha',
+            store_p_cov='p_cov'):
+        """
+        Export the model of a calibrated DataStore. The labels, variances
+        and `store_*` labels should be those passed to the calibration.
+
+        Parameters
+        ----------
+        ds : DataStore
+            Calibrated with `calibration_single_ended` or
+            `calibration_double_ended`.
+        st_label, ast_label, rst_label, rast_label : str
+            Labels of the Stokes and anti-Stokes signals. The reverse
+            labels are only used for double-ended setups.
+        st_var, ast_var, rst_var, rast_var : float, optional
+            The variances of the noise of the Stokes signals. None if the
+            calibration used ols.
+        store_gamma : str
+            Label of gamma
+        store_dalpha : str
+            Label of dalpha. Only used for single-ended setups.
+        store_alpha : str
+            Label of alpha. Only used for double-ended setups.
+        store_p_cov : str
+            Key of the covariance matrix of the parameters. Not available if
+            the calibration used ols, in which case the variances of the
+            parameters are zero.
+
+        Returns
+        -------
+        model : CalibrationModel
+        """
+        x_dim = ds.get_x_dim()
+        time_dim = ds.get_time_dim()
+        nt = ds[time_dim].size
+
+        if store_p_cov in ds:
+            p_cov = sp.csr_matrix(get_p_cov(ds, label=store_p_cov))
+        else:
+            p_cov = None
+
+        if ds.is_double_ended:
+            labels = dict(st_label=st_label, ast_label=ast_label,
+                          rst_label=rst_label, rast_label=rast_label)
+            variances = dict(st_var=st_var, ast_var=ast_var,
+                             rst_var=rst_var, rast_var=rast_var)
+
+            nx = ds[x_dim].size
+
+            if p_cov is not None:
+                p_var = p_cov.diagonal()
+                gamma_var = p_var[0]
+                alpha_var = p_var[1 + 2 * nt:1 + 2 * nt + nx]
+            else:
+                gamma_var = 0.
+                alpha_var = np.zeros(nx)
+
+            params = xr.Dataset({
+                'gamma': ((), ds[store_gamma].values),
+                'gamma_var': ((), gamma_var),
+                'alpha': ((x_dim,), ds[store_alpha].values),
+                'alpha_var': ((x_dim,), alpha_var)},
+                coords={x_dim: ds[x_dim].values})
+
+        else:
+            labels = dict(st_label=st_label, ast_label=ast_label)
+            variances = dict(st_var=st_var, ast_var=ast_var)
+
+            if p_cov is not None:
+                cov = p_cov[:2, :2].toarray()
+            else:
+                cov = np.zeros((2, 2))
+
+            params = xr.Dataset({
+                'gamma': ((), ds[store_gamma].values),
+                'dalpha': ((), ds[store_dalpha].values),
+                'p_cov': (('params1', 'params2'), cov)})
+
+        for k, v in variances.items():
+            assert v is None or np.size(v) == 1, \
+                f'{k} should be a single value to be applied to new data'
+
+        params.attrs['isDoubleEnded'] = int(ds.is_double_ended)
+        params.attrs['_sections'] = ds.attrs['_sections']
+        params.attrs['labels'] = yaml.safe_dump(labels)
+        params.attrs['variances'] = yaml.safe_dump({
+            k: None if v is None else float(v)
+            for k, v in variances.items()})
+
+        return cls(params)
+
+    @classmethod
+    def from_netcdf(cls, path):
+        """
+        Load a model stored with `to_netcdf`.
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        model : CalibrationModel
+        """
+        return cls(xr.load_dataset(path))
+
+    def to_netcdf(self, path):
+        """
+        Store the model in a small netCDF file.
+
+        Parameters
+        ----------
+        path : str
+        """
+        self.params.to_netcdf(path)
+
+    def apply(self, ds, **kwargs):
+        """
+        Calibrate new measurements with the parameters of the model fixed.
+        The parameters of each time step and the temperatures are stored in
+        `ds` as with `calibration_single_ended` or
+        `calibration_double_ended`. The new measurements should contain
+        the reference temperatures of the sections.
+
+        Parameters
+        ----------
+        ds : DataStore
+            New measurements
+        kwargs
+            Passed to the calibration method, e.g. `store_tmpw=None` to skip
+            the Monte Carlo estimate of the variance of the weighted
+            temperature of double-ended setups.
+
+        Notes
+        -----
+        Double-ended models fix gamma and alpha with their variances only,
+        as if their errors were independent. The variances of D_fw, D_bw
+        and the temperatures are lower bounds. Those of single-ended models
+        include the covariance of gamma and dalpha.
+        """
+        variances = self.variances
+        method = 'ols' if variances['st_var'] is None else 'wls'
+
+        cal_kwargs = dict(
+            sections=self.sections, method=method, **self.labels, **variances)
+
+        if self.is_double_ended:
+            x_dim = ds.get_x_dim()
+            assert ds[x_dim].size == self.params[x_dim].size and np.allclose(
+                ds[x_dim].values, self.params[x_dim].values), \
+                'The new measurements should have the same x-coordinates ' \
+                'as the model'
+
+            # Without the covariance of gamma and alpha, the variances are
+            # lower bounds
+            cal_kwargs.update(
+                fix_gamma=(float(self.params['gamma']),
+                           float(self.params['gamma_var'])),
+                fix_alpha=(self.params['alpha'].values,
+                           self.params['alpha_var'].values))
+            cal_kwargs.update(kwargs)
+            ds.calibration_double_ended(**cal_kwargs)
+
+        else:
+            # gamma and dalpha are strongly correlated
+            cov = self.params['p_cov'].values
+            # Without the covariance of gamma and alpha, the variances are
+            # lower bounds
+            cal_kwargs.update(
+                fix_gamma=(float(self.params['gamma']), cov[0, 0]),
+                fix_dalpha=(float(self.params['dalpha']), cov[1, 1]),
+                fix_cov=cov)
+            cal_kwargs.update(kwargs)
+            ds.calibration_single_ended(**cal_kwargs)
+
+        pass
+
+
+class OnlineCalibrationSingleEnded:
+    """
+    Recursive single-ended calibration for measurements that arrive one or a
+    few time steps at a time. Of the normal equations of the single-ended
+    calibration, see `calibrate_utils.wls_structured`, only the 2x2 system
+    of gamma and dalpha is kept, in which c of each time step is eliminated
+    analytically. Each time step adds its sums over the reference sections
+    to this system, after which gamma, dalpha and c of that time step
+    follow. The cost per time step scales with the number of locations and
+    is independent of the number of previous time steps.
+
+    With a `forgetting_factor` of 1, gamma and dalpha equal the solution of
+    `calibration_single_ended` of all time steps so far. With a smaller
+    `forgetting_factor` the weight of previous time steps decays
+    exponentially, allowing gamma and dalpha to drift slowly.
+
+    Parameters
+    ----------
+    sections : Dict[str, List[slice]]
+        The calibration sections
+    st_label : str
+        Label of the forward stokes measurement
+    ast_label : str
+        Label of the anti-Stoke measurement
+    st_var : float, optional
+        The variance of the measurement noise of the Stokes signals. If
+        None, ols is used.
+    ast_var : float, optional
+        The variance of the measurement noise of the anti-Stokes signals. If
+        None, ols is used.
+    forgetting_factor : float
+        Between 0 and 1. The weight of the previous time steps is multiplied
+        with this factor for every new time step.
+    p_val : array-like, optional
+        Prior estimate of gamma and dalpha
+    p_cov : array-like, optional
+        Covariance of the prior estimate of gamma and dalpha. Its inverse is
+        added to the normal equations, assuming a residual variance of 1.
+    """
+
+    def __init__(
+            self,
+            sections,
+            st_label='ST',
+            ast_label='AST',
+            st_var=None,
+            ast_var=None,
+            forgetting_factor=1.,
+            p_val=None,
+            p_cov=None):
+        assert 0. < forgetting_factor <= 1., \
+            'The forgetting_factor should be between 0 and 1'
+        assert (st_var is None) == (ast_var is None), \
+            'Define both st_var and ast_var for wls'
+
+        self.sections = sections
+        self.st_label = st_label
+        self.ast_label = ast_label
+        self.st_var = st_var
+        self.ast_var = ast_var
+        self.forgetting_factor = forgetting_factor
+
+        # Normal equations of gamma and dalpha, the weighted sum of squares
+        # of the observations and the number of observations and time steps
+        if p_cov is not None:
+            self.A = np.linalg.inv(p_cov)
+            self.b = self.A.dot(p_val)
+            self.syy = np.dot(p_val, self.b)
+        else:
+            self.A = np.zeros((2, 2))
+            self.b = np.zeros(2)
+            self.syy = 0.
+
+        self.nobs = 0.
+        self.nt = 0.
+
+    @classmethod
+    def from_calibration_model(cls, model, forgetting_factor=1.):
+        """
+        Start from the parameters, sections, labels and variances of a
+        single-ended `CalibrationModel`.
+
+        Parameters
+        ----------
+        model : CalibrationModel
+        forgetting_factor : float
+
+        Returns
+        -------
+        online : OnlineCalibrationSingleEnded
+        """
+        assert not model.is_double_ended, 'Requires a single-ended model'
+
+        p_val = np.array(
+            [float(model.params['gamma']), float(model.params['dalpha'])])
+        p_cov = model.params['p_cov'].values
+
+        if not np.any(p_cov):
+            # ols models have no covariance
+            p_val, p_cov = None, None
+
+        return cls(
+            model.sections,
+            forgetting_factor=forgetting_factor,
+            p_val=p_val,
+            p_cov=p_cov,
+            **model.labels,
+            **model.variances)
+
+    @property
+    def p_val(self):
+        """The current estimate of gamma and dalpha"""
+        return np.linalg.lstsq(self.A, self.b, rcond=None)[0]
+
+    @property
+    def err_var(self):
+        """The current estimate of the residual variance"""
+        p_val = self.p_val
+        rss = self.syy - 2 * np.dot(p_val, self.b) + \
+            np.dot(p_val, self.A.dot(p_val))
+        dof = self.nobs - self.nt - 2
+
+        return rss / dof if dof > 0 else np.nan
+
+    @property
+    def p_cov(self):
+        """The current covariance matrix of gamma and dalpha"""
+        return np.linalg.pinv(self.A) * self.err_var
+
+    def update(
+            self,
+            ds,
+            store_c='c',
+            store_gamma='gamma',
+            store_dalpha='dalpha',
+            store_tmpf='TMPF',
+            variance_suffix='_var'):
+        """
+        Add the time steps of `ds` to the calibration, in order, and
+        calibrate each time step with the estimate of gamma and dalpha that
+        includes that time step.
+
+        Parameters
+        ----------
+        ds : DataStore
+            The new measurements, containing the reference temperatures
+        store_c : str
+            Label of where to store c
+        store_gamma : str
+            Label of where to store gamma. Stored per time step.
+        store_dalpha : str
+            Label of where to store dalpha. Stored per time step.
+        store_tmpf : str
+            Label of where to store the calibrated temperature of the
+            forward direction
+        variance_suffix : str
+            String appended for storing the variances. Only used with wls.
+
+        Returns
+        -------
+        tmpf : xarray.DataArray
+            The calibrated temperature
+        """
+        ds.sections = self.sections
+
+        x_dim = ds.get_x_dim()
+        time_dim = ds.get_time_dim()
+        nt = ds[time_dim].size
+        x = ds[x_dim].values
+
+        ix_sec = ds.ufunc_per_section(x_indices=True, calc_per='all')
+        x_sec = x[ix_sec]
+
+        st = ds[self.st_label].values.astype(float)
+        ast = ds[self.ast_label].values.astype(float)
+        cal_ref = np.asarray(ds.ufunc_per_section(
+            label=self.st_label, ref_temp_broadcasted=True, calc_per='all'))
+
+        # Coefficients of gamma and dalpha. That of c is -1
+        U = np.stack(
+            (1 / (cal_ref + 273.15),
+             np.broadcast_to(-x_sec[:, None], cal_ref.shape)), axis=-1)
+        y = np.log(st[ix_sec] / ast[ix_sec])
+
+        if self.st_var is not None:
+            w = 1 / (st[ix_sec] ** -2 * self.st_var +
+                     ast[ix_sec] ** -2 * self.ast_var)
+        else:
+            w = np.ones(y.shape)
+
+        p_val = np.zeros((nt, 2))
+        p_var = np.zeros((nt, 2))
+        c = np.zeros(nt)
+        c_var = np.zeros(nt)
+
+        for it in range(nt):
+            Ui, yi, wi = U[:, it], y[:, it], w[:, it]
+
+            sw = wi.sum()
+            su = wi.dot(Ui)
+            sy = wi.dot(yi)
+
+            # Eliminate c of this time step
+            A_t = (wi[:, None] * Ui).T.dot(Ui) - np.outer(su, su) / sw
+            b_t = (wi * yi).dot(Ui) - su * sy / sw
+            syy_t = wi.dot(yi ** 2) - sy ** 2 / sw
+
+            f = self.forgetting_factor
+            self.A = f * self.A + A_t
+            self.b = f * self.b + b_t
+            self.syy = f * self.syy + syy_t
+            self.nobs = f * self.nobs + yi.size
+            self.nt = f * self.nt + 1
+
+            p_val[it] = self.p_val
+            p_cov = self.p_cov
+            p_var[it] = np.diag(p_cov)
+
+            # y = gamma * U_0 + dalpha * U_1 - c
+            g = su / sw
+            c[it] = g.dot(p_val[it]) - sy / sw
+            c_var[it] = self.err_var / sw + g.dot(p_cov).dot(g)
+
+        gamma, dalpha = p_val.T
+        ds[store_gamma] = ((time_dim,), gamma)
+        ds[store_dalpha] = ((time_dim,), dalpha)
+        ds[store_c] = ((time_dim,), c)
+
+        if self.st_var is not None:
+            ds[store_gamma + variance_suffix] = ((time_dim,), p_var[:, 0])
+            ds[store_dalpha + variance_suffix] = ((time_dim,), p_var[:, 1])
+            ds[store_c + variance_suffix] = ((time_dim,), c_var)
+
+        ds[store_tmpf] = ((x_dim, time_dim), gamma / (
+            np.log(st / ast) + c + x[:, None] * dalpha) - 273.15)
+
+        return ds[store_tmpf]
@@ -2,12 +2,15 @@
 import glob
 import inspect
 import os
+import re
+import weakref
 from typing import Dict
 from typing import List
 
 import dask
 import dask.array as da
 import numpy as np
+import pandas as pd
 import scipy.sparse as sp
 import scipy.stats as sst
 import xarray as xr
@@ -16,15 +19,37 @@ from scipy.optimize import minimize
 from scipy.sparse import linalg as ln
 
 from .calibrate_utils import calc_alpha_double
+from .calibrate_utils import calibration_double_ended_fixed
 from .calibrate_utils import calibration_double_ended_solver
+from .calibrate_utils import calibration_single_ended_fixed
 from .calibrate_utils import calibration_single_ended_solver
+from .calibrate_utils import cov_blocks_per_time
+from .calibrate_utils import expand_cov
+from .calibrate_utils import wls_block
 from .calibrate_utils import wls_sparse
 from .calibrate_utils import wls_stats
+from .calibrate_utils import wls_structured
+from .datastore_utils import CovarianceFactor
+from .datastore_utils import StreamingStatistics
+from .datastore_utils import calibrate_time_windows
 from .datastore_utils import check_dims
 from .datastore_utils import check_timestep_allclose
+from .datastore_utils import dask_normal_rvs
+from .datastore_utils import get_p_cov
+from .datastore_utils import get_zarr_encoding
+from .datastore_utils import linear_combination_var
+from .datastore_utils import set_p_cov
+from .datastore_utils import spawn_generator
+from .datastore_utils import standard_normal_rvs
+from .io import evict_cache
+from .io import filename_timestamp
+from .io import filepathlist_time_range
+from .io import open_executor
 from .io import read_apsensing_files_routine
 from .io import read_sensornet_files_routine_v3
+from .io import read_sensornet_timestamp
 from .io import read_sensortran_files_routine
+from .io import read_sensortran_header
 from .io import read_silixa_files_routine_v4
 from .io import read_silixa_files_routine_v6
 from .io import sensortran_binary_version_check
@@ -80,7 +105,7 @@ class DataStore(xr.Dataset):
         dtscalibration.open_datastore : Load (calibrated) measurements from
         netCDF-like file
         """
-    __slots__ = ('__name__')
+    __slots__ = ('__name__', '_cov_factors')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -802,6 +827,76 @@ class DataStore(xr.Dataset):
                 l.remove(time_dim)  # noqa: E741
                 return l[0]
 
+    def get_cov_factor(self, p_cov='p_cov', cov_rows=None, subset=None):
+        """The factor of the covariance matrix of the calibrated parameters,
+        to draw Monte Carlo samples of the parameters, see
+        `datastore_utils.CovarianceFactor`. The factor is memoized on the
+        DataStore for as long as the covariance matrix exists, so that
+        repeated calls of `conf_int_single_ended` and `conf_int_double_ended`
+        skip the factorization. A new calibration stores a new covariance
+        matrix, and thus a new factor. The factors are discarded together
+        with the DataStore, or with `clear_cov_factors`.
+
+        Parameters
+        ----------
+        p_cov : str or array-like or scipy.sparse matrix
+            The label of the covariance matrix stored with
+            `datastore_utils.set_p_cov`, or the covariance matrix itself.
+        cov_rows : array-like of int, optional
+            See `datastore_utils.CovarianceFactor`
+        subset : array-like of int, optional
+            The indices of the parameters that are sampled jointly. The
+            factor is of the covariance matrix of these parameters.
+
+        Returns
+        -------
+        factor : datastore_utils.CovarianceFactor
+        """
+        if isinstance(p_cov, str):
+            source = self[p_cov].values
+            cov = None
+        else:
+            source = cov = p_cov
+
+        key = (
+            id(source),
+            None if cov_rows is None else tuple(np.asarray(cov_rows).tolist()),
+            None if subset is None else np.asarray(subset).tobytes())
+
+        factors = getattr(self, '_cov_factors', None)
+        if factors is None:
+            factors = {}
+            self._cov_factors = factors
+
+        if key in factors:
+            ref, factor = factors[key]
+
+            if ref() is source:
+                return factor
+
+        if cov is None:
+            cov = get_p_cov(self, label=p_cov)
+
+        if subset is not None:
+            if sp.issparse(cov):
+                cov = sp.csr_matrix(cov)[subset][:, subset]
+            else:
+                cov = cov[np.ix_(subset, subset)]
+
+        factor = CovarianceFactor(cov, cov_rows=cov_rows)
+
+        # The factors of covariance matrices that no longer exist
+        for k in [k for k, (ref, _) in factors.items() if ref() is None]:
+            del factors[k]
+
+        factors[key] = (weakref.ref(source), factor)
+        return factor
+
+    def clear_cov_factors(self):
+        """Discard the factors of the covariance matrices that are memoized
+        by `get_cov_factor`."""
+        self._cov_factors = {}
+
     def variance_stokes(
             self,
             st_label,
@@ -967,7 +1062,9 @@ class DataStore(xr.Dataset):
         # for reference.
 
         x = np.concatenate(x_list)  # coordinates are already in memory
-        y = np.concatenate(y_list)
+
+        # The Stokes data can be stored as float32 or int32
+        y = np.concatenate(y_list).astype(float)
 
         data1 = x
         data2 = np.ones(sum(len_stretch_list) * nt)
@@ -1075,8 +1172,8 @@ class DataStore(xr.Dataset):
             return var_I, resid_da
 
     def i_var(self, st_var, ast_var, st_label='ST', ast_label='AST'):
-        st = self[st_label]
-        ast = self[ast_label]
+        st = self[st_label].astype(float)
+        ast = self[ast_label].astype(float)
         return st ** -2 * st_var + ast ** -2 * ast_var
 
     def inverse_variance_weighted_mean(
@@ -1225,7 +1322,12 @@ class DataStore(xr.Dataset):
             p_var=None,
             p_cov=None,
             fix_gamma=None,
-            fix_dalpha=None):
+            fix_dalpha=None,
+            fix_cov=None,
+            calc_cov='full',
+            time_window=None,
+            n_jobs=None,
+            solver_kwargs=None):
         """
 
         Parameters
@@ -1235,6 +1337,9 @@ class DataStore(xr.Dataset):
         store_p_val : str
             Key to store the values of the calibrated parameters
         p_val : array-like, optional
+            The calibrated parameters if method is 'external'. Otherwise the
+            initial estimate of the iterative solvers, e.g. `store_p_val` of
+            a previous calibration of the same size.
         p_var : array-like, optional
         p_cov : array-like, optional
         sections : dict, optional
@@ -1269,10 +1374,17 @@ class DataStore(xr.Dataset):
         method : {'ols', 'wls'}
             Use 'ols' for ordinary least squares and 'wls' for weighted least
             squares
-        solver : {'sparse', 'stats'}
-            Either use the homemade weighted sparse solver or the weighted
+        solver : {'sparse', 'stats', 'structured', 'matrix_free',
+                  'lsmr'}
+            Either use the homemade weighted sparse solver, the weighted
             dense matrix solver of
-            statsmodels
+            statsmodels, or the structured solver that eliminates the
+            intercepts per time step analytically. The latter is exact and
+            much faster for large datasets. 'matrix_free' is the sparse
+            solver without constructing the coefficient matrix, which
+            reduces the peak memory usage. 'lsmr' solves with lsmr and
+            column equilibration, see `calibrate_utils.wls_lsmr`. With fixed
+            parameters 'matrix_free' and 'lsmr' fall back to 'sparse'.
         fix_gamma : tuple
             A tuple containing two floats. The first float is the value of
             gamma, and the second item is the variance of the estimate of gamma.
@@ -1284,6 +1396,33 @@ class DataStore(xr.Dataset):
             variance of the estimate of dalpha.
             Covariances between alpha and other parameters are not accounted
             for.
+        fix_cov : array-like, optional
+            The 2x2 covariance matrix of the fixed gamma and dalpha, e.g.,
+            of a `CalibrationModel`. Only used if both `fix_gamma` and
+            `fix_dalpha` are given. Their uncertainty is then propagated
+            into c including their covariance, and the variances on the
+            diagonal of `fix_cov` take precedence over those of `fix_gamma`
+            and `fix_dalpha`. See
+            `calibrate_utils.calibration_single_ended_fixed`.
+        calc_cov : {'full', 'diag', 'blocks'}
+            Which part of the covariance matrix of the parameters is computed
+            if method is wls. 'diag' only computes the variances and
+            'blocks' also the covariances of gamma and dalpha with the
+            other parameters. These are stored compactly as a sparse matrix,
+            see `datastore_utils.get_p_cov`.
+        time_window : int, optional
+            Calibrate windows of `time_window` time steps in parallel. Their
+            estimates of gamma and dalpha are combined, see
+            `datastore_utils.calibrate_time_windows`, after which c is
+            obtained with the combined gamma and dalpha fixed. Reduces the
+            size of the system of equations for long measurement records.
+        n_jobs : int, optional
+            Number of processes used for the time windows. Defaults to the
+            number of processors.
+        solver_kwargs : dict, optional
+            Passed to the 'lsmr' and 'matrix_free' solvers, e.g. atol, btol
+            and iter_lim. The convergence diagnostics of the 'lsmr' solver
+            are stored as attributes of `store_gamma`.
 
         Returns
         -------
@@ -1308,6 +1447,34 @@ class DataStore(xr.Dataset):
             self[ast_label] <= 0.), \
             'There is uncontrolled noise in the AST signal'
 
+        if fix_cov is not None:
+            assert fix_gamma and fix_dalpha, \
+                'fix_cov requires both fix_gamma and fix_dalpha'
+
+        # The covariance of gamma and dalpha that are estimated per time
+        # window is used as fix_cov
+        if time_window and time_window < nt and not (fix_gamma and fix_dalpha):
+            assert method in ('ols', 'wls'), \
+                'Time windows require method ols or wls'
+            fix = calibrate_time_windows(
+                self, 'calibration_single_ended', time_window, n_jobs=n_jobs,
+                sections=self.sections, st_label=st_label,
+                ast_label=ast_label, st_var=st_var, ast_var=ast_var,
+                store_tmpf=None, method=method, solver=solver,
+                fix_gamma=fix_gamma, fix_dalpha=fix_dalpha, calc_cov='blocks',
+                solver_kwargs=solver_kwargs)
+            if not fix_gamma and not fix_dalpha:
+                fix_cov = fix.get('fix_cov')
+
+            fix_gamma = fix_gamma or fix['fix_gamma']
+            fix_dalpha = fix_dalpha or fix['fix_dalpha']
+
+        solver_info = {}
+
+        if solver == 'lsmr':
+            # The convergence diagnostics are returned in solver_info
+            solver_kwargs = dict(solver_kwargs or {}, info=solver_info)
+
         if method == 'ols' or method == 'wls':
             if method == 'ols':
                 st_var = None     # ols
@@ -1316,53 +1483,31 @@ class DataStore(xr.Dataset):
             else:
                 st_var = np.asarray(st_var, dtype=float)
                 ast_var = np.asarray(ast_var, dtype=float)
-                calc_cov = True
+                assert calc_cov in ('full', 'diag', 'blocks'), \
+                    'Choose a valid calc_cov'
 
             if fix_gamma and fix_dalpha:
-                split = calibration_single_ended_solver(
+                # c is the weighted mean over the reference sections. No
+                # need for a solver
+                out = calibration_single_ended_fixed(
                     self, st_label, ast_label, st_var, ast_var,
-                    calc_cov=calc_cov, solver='external_split')
-
-                # Move the coefficients times the fixed gamma to the
-                # observations
-                y = split['y'] - \
-                    fix_gamma[0] * split['X_gamma'].toarray().flatten() - \
-                    fix_dalpha[0] * split['X_dalpha'].toarray().flatten()
-                # Use only the remaining coefficients
-                X = split['X_c']
-                # variances are added. weight is the inverse of the variance
-                # of the observations
-                if method == 'wls':
-                    w = 1 / (1 / split['w'] +
-                             fix_gamma[1] *
-                             split['X_gamma'].toarray().flatten() +
-                             fix_dalpha[1] *
-                             split['X_dalpha'].toarray().flatten())
-                else:
-                    w = 1.
-
-                p0_est = split['p0_est'][2:]
-
-                if solver == 'sparse':
-                    out = wls_sparse(
-                        X, y, w=w, x0=p0_est,
-                        calc_cov=calc_cov,
-                        verbose=False)
-
-                elif solver == 'stats':
-                    out = wls_stats(
-                        X, y, w=w,
-                        calc_cov=calc_cov,
-                        verbose=False)
+                    fix_gamma=fix_gamma, fix_dalpha=fix_dalpha,
+                    calc_cov=calc_cov, fix_cov=fix_cov)
 
                 # Added fixed gamma and its variance to the solution
                 p_val = np.concatenate(([fix_gamma[0], fix_dalpha[0]], out[0]))
-                p_var = np.concatenate(([fix_gamma[1], fix_dalpha[1]], out[1]))
 
-                if calc_cov:
-                    p_cov = np.eye(p_val.size) * fix_gamma[1]
-                    p_cov[1, 1] = fix_dalpha[1]
-                    p_cov[2:, 2:] = out[2]
+                if fix_cov is not None:
+                    p_var = np.concatenate((np.diag(fix_cov), out[1]))
+                else:
+                    p_var = np.concatenate(
+                        ([fix_gamma[1], fix_dalpha[1]], out[1]))
+
+                if calc_cov and fix_cov is not None:
+                    # Including the covariance of c with gamma and dalpha
+                    p_cov = out[2]
+                elif calc_cov:
+                    p_cov = expand_cov(out[2], p_var, np.arange(2, nt + 2))
 
             elif fix_gamma:
                 split = calibration_single_ended_solver(
@@ -1376,25 +1521,44 @@ class DataStore(xr.Dataset):
                 # Use only the remaining coefficients
                 X = sp.hstack((split['X_dalpha'], split['X_c']))
                 # variances are added. weight is the inverse of the variance
-                # of the observations
+                # of the observations. The variance of gamma enters times its
+                # coefficient squared
                 if method == 'wls':
                     w = 1 / (1 / split['w'] +
                              fix_gamma[1] *
-                             split['X_gamma'].toarray().flatten())
+                             split['X_gamma'].toarray().flatten() ** 2)
                 else:
                     w = 1.
                 p0_est = split['p0_est'][1:]
 
-                if solver == 'sparse':
+                # dalpha couples all parameters
+                cov_rows, cov_blocks = [0], None
+
+                if solver in ('sparse', 'matrix_free', 'lsmr'):
+                    # X is already constructed by the external_split solver
                     out = wls_sparse(
                         X, y, w=w, x0=p0_est,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 elif solver == 'stats':
                     out = wls_stats(
                         X, y, w=w,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
+                        verbose=False)
+
+                elif solver == 'structured':
+                    # Solved from the coefficients per time step
+                    out = wls_structured(
+                        [split['X_dalpha'].toarray().reshape((-1, nt))],
+                        y.reshape((-1, nt)), w=w,
+                        calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 # Added fixed gamma and its variance to the solution
@@ -1402,8 +1566,7 @@ class DataStore(xr.Dataset):
                 p_var = np.concatenate(([fix_gamma[1]], out[1]))
 
                 if calc_cov:
-                    p_cov = np.eye(p_val.size) * fix_gamma[1]
-                    p_cov[1:, 1:] = out[2]
+                    p_cov = expand_cov(out[2], p_var, np.arange(1, nt + 2))
 
             elif fix_dalpha:
                 split = calibration_single_ended_solver(
@@ -1417,27 +1580,46 @@ class DataStore(xr.Dataset):
                 # Use only the remaining coefficients
                 X = sp.hstack((split['X_gamma'], split['X_c']))
                 # variances are added. weight is the inverse of the variance
-                # of the observations
+                # of the observations. The variance of dalpha enters times
+                # its coefficient squared
                 if method == 'wls':
                     w = 1 / (1 / split['w'] +
                              fix_dalpha[1] *
-                             split['X_dalpha'].toarray().flatten())
+                             split['X_dalpha'].toarray().flatten() ** 2)
                 else:
                     w = 1.
 
                 p0_est = np.concatenate((
                     split['p0_est'][[0]], split['p0_est'][2:]))
 
-                if solver == 'sparse':
+                # gamma couples all parameters
+                cov_rows, cov_blocks = [0], None
+
+                if solver in ('sparse', 'matrix_free', 'lsmr'):
+                    # X is already constructed by the external_split solver
                     out = wls_sparse(
                         X, y, w=w, x0=p0_est,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 elif solver == 'stats':
                     out = wls_stats(
                         X, y, w=w,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
+                        verbose=False)
+
+                elif solver == 'structured':
+                    # Solved from the coefficients per time step
+                    out = wls_structured(
+                        [split['X_gamma'].toarray().reshape((-1, nt))],
+                        y.reshape((-1, nt)), w=w,
+                        calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 # Added fixed gamma and its variance to the solution
@@ -1445,16 +1627,19 @@ class DataStore(xr.Dataset):
                 p_var = np.concatenate((out[1][[0]], [fix_dalpha[1]], out[1][1:]))
 
                 if calc_cov:
-                    p_cov = np.eye(p_val.size) * fix_dalpha[1]
-                    p_cov[0, 0] = out[2][0, 0]
-                    p_cov[0, 2:] = out[2][0, 1:]
-                    p_cov[2:, 0] = out[2][1:, 0]
-                    p_cov[2:, 2:] = out[2][1:, 1:]
+                    p_cov = expand_cov(
+                        out[2], p_var,
+                        np.concatenate(([0], np.arange(2, nt + 2))))
 
             else:
+                if p_val is not None:
+                    assert np.size(p_val) == nt + 2, \
+                        'p_val should contain gamma, dalpha and c'
+
                 out = calibration_single_ended_solver(
                     self, st_label, ast_label, st_var, ast_var,
-                    calc_cov=calc_cov, solver=solver)
+                    calc_cov=calc_cov, solver=solver, x0=p_val,
+                    solver_kwargs=solver_kwargs)
 
                 if calc_cov:
                     p_val, p_var, p_cov = out
@@ -1478,6 +1663,8 @@ class DataStore(xr.Dataset):
         c = p_val[2:nt + 2]
 
         self[store_gamma] = (tuple(), gamma)
+        self[store_gamma].attrs.update(
+            {'lsmr_' + k: v for k, v in solver_info.items()})
         self[store_dalpha] = (tuple(), dalpha)
         self[store_alpha] = ((x_dim,), dalpha * self[x_dim].data)
         self[store_c] = ((time_dim,), c)
@@ -1508,7 +1695,7 @@ class DataStore(xr.Dataset):
             pass
 
         if store_p_cov and (method == 'wls' or method == 'external'):
-            self[store_p_cov] = (('params1', 'params2'), p_cov)
+            set_p_cov(self, p_cov, label=store_p_cov)
         else:
             pass
 
@@ -1534,6 +1721,7 @@ class DataStore(xr.Dataset):
             store_tmpb='TMPB',
             store_tmpw='TMPW',
             tmpw_mc_size=50,
+            tmpw_method='mc',
             store_p_cov='p_cov',
             store_p_val='p_val',
             variance_suffix='_var',
@@ -1546,7 +1734,11 @@ class DataStore(xr.Dataset):
             reduce_memory_usage=False,
             transient_asym_att_x=None,
             fix_gamma=None,
-            fix_alpha=None):
+            fix_alpha=None,
+            calc_cov='full',
+            time_window=None,
+            n_jobs=None,
+            solver_kwargs=None):
         """
 
         Parameters
@@ -1556,6 +1748,9 @@ class DataStore(xr.Dataset):
         store_p_val : str
             Key to store the values of the calibrated parameters
         p_val : array-like, optional
+            The calibrated parameters if method is 'external'. Otherwise the
+            initial estimate of the iterative solvers, e.g. `store_p_val` of
+            a previous calibration of the same size.
         p_var : array-like, optional
         p_cov : array-like, optional
         sections : dict, optional
@@ -1602,17 +1797,35 @@ class DataStore(xr.Dataset):
             Label of where to store the calibrated temperature of the
             backward direction
         store_tmpw : str
+            Label of where to store the weighted average of the temperature
+            of the forward and backward direction. The weights are the
+            inverse of their variances, see `conf_int_double_ended`.
         tmpw_mc_size : int
+            Number of Monte Carlo samples used to estimate the variances if
+            `tmpw_method` is 'mc'.
+        tmpw_method : {'delta', 'mc'}
+            Estimate the variances of the forward and backward temperature
+            with the delta method or with Monte Carlo (default). See
+            `method` of `conf_int_double_ended`. 'delta' is faster and does
+            not draw samples, but the resulting TMPW and TMPW_var differ
+            slightly from the Monte Carlo estimates.
         variance_suffix : str, optional
             String appended for storing the variance. Only used when method
             is wls.
         method : {'ols', 'wls', 'external'}
             Use 'ols' for ordinary least squares and 'wls' for weighted least
             squares
-        solver : {'sparse', 'stats'}
-            Either use the homemade weighted sparse solver or the weighted
+        solver : {'sparse', 'stats', 'block', 'matrix_free', 'lsmr'}
+            Either use the homemade weighted sparse solver, the weighted
             dense matrix solver of
-            statsmodels
+            statsmodels, or the block solver that eliminates the integrated
+            differential attenuation analytically from the normal equations.
+            The latter is exact and much faster for large datasets.
+            'matrix_free' is the sparse solver without constructing the
+            coefficient matrix, which reduces the peak memory usage. 'lsmr'
+            solves with lsmr and column equilibration, see
+            `calibrate_utils.wls_lsmr`. With fixed parameters 'matrix_free'
+            and 'lsmr' fall back to 'sparse'.
         transient_asym_att_x : iterable, optional
             Connectors cause assymetrical attenuation. Normal double ended
             calibration assumes symmetrical attenuation. An additional loss
@@ -1634,6 +1847,28 @@ class DataStore(xr.Dataset):
             contains the variance of the estimate of alpha.
             Covariances (in-) between alpha and other parameters are not
             accounted for.
+        calc_cov : {'full', 'diag', 'blocks'}
+            Which part of the covariance matrix of the parameters is computed
+            if method is wls. 'diag' only computes the variances and
+            'blocks' also the covariances of gamma with the other parameters
+            and the covariances among the parameters of each time step.
+            These are stored compactly as a sparse matrix, see
+            `datastore_utils.get_p_cov`.
+        time_window : int, optional
+            Calibrate windows of `time_window` time steps in parallel. Their
+            estimates of gamma and alpha are combined, see
+            `datastore_utils.calibrate_time_windows`, after which D_fw and
+            D_bw are obtained with the combined gamma and alpha fixed.
+            Reduces the size of the system of equations for long measurement
+            records. Only supported for method 'ols', as fixing alpha with
+            its variances only would underestimate the variances of wls.
+        n_jobs : int, optional
+            Number of processes used for the time windows. Defaults to the
+            number of processors.
+        solver_kwargs : dict, optional
+            Passed to the 'lsmr' and 'matrix_free' solvers, e.g. atol, btol
+            and iter_lim. The convergence diagnostics of the 'lsmr' solver
+            are stored as attributes of `store_gamma`.
         matching_sections : List[Tuple[slice, slice, bool]]
             Provide a list of tuples. A tuple per matching section. Each tuple
             has three items. The first two items are the slices of the sections
@@ -1662,6 +1897,30 @@ class DataStore(xr.Dataset):
         check_dims(self, [st_label, ast_label, rst_label, rast_label],
                    correct_dims=(x_dim, time_dim))
 
+        if time_window and time_window < nt and not (
+                fix_gamma and fix_alpha):
+            if method == 'wls':
+                # The errors of alpha are correlated through gamma, D_fw and
+                # D_bw of each window. Fixing alpha with only its variances
+                # underestimates the variances of D_fw, D_bw and the
+                # temperatures
+                raise NotImplementedError(
+                    'Time windows are not supported for double-ended wls '
+                    'calibration. Use method ols or time_window=None')
+            assert method == 'ols', 'Time windows require method ols'
+            fix = calibrate_time_windows(
+                self, 'calibration_double_ended', time_window, n_jobs=n_jobs,
+                sections=self.sections, st_label=st_label,
+                ast_label=ast_label, rst_label=rst_label,
+                rast_label=rast_label, st_var=st_var, ast_var=ast_var,
+                rst_var=rst_var, rast_var=rast_var, store_tmpf=None,
+                store_tmpb=None, store_tmpw=None, method=method,
+                solver=solver, transient_asym_att_x=transient_asym_att_x,
+                fix_gamma=fix_gamma, fix_alpha=fix_alpha,
+                solver_kwargs=solver_kwargs)
+            fix_gamma = fix_gamma or fix['fix_gamma']
+            fix_alpha = fix_alpha or fix['fix_alpha']
+
         # if matching_sections:
         #     matching_indices = match_sections(self, matching_sections)
         # else:
@@ -1674,6 +1933,12 @@ class DataStore(xr.Dataset):
             assert ta_dim not in self.coords, err
             self.coords[ta_dim] = transient_asym_att_x
 
+        solver_info = {}
+
+        if solver == 'lsmr':
+            # The convergence diagnostics are returned in solver_info
+            solver_kwargs = dict(solver_kwargs or {}, info=solver_info)
+
         if method == 'ols' or method == 'wls':
             if method == 'ols':
                 st_var = None     # ols
@@ -1686,20 +1951,36 @@ class DataStore(xr.Dataset):
                 ast_var = np.asarray(ast_var, dtype=float)
                 rst_var = np.asarray(rst_var, dtype=float)
                 rast_var = np.asarray(rast_var, dtype=float)
-                calc_cov = True
+                assert calc_cov in ('full', 'diag', 'blocks'), \
+                    'Choose a valid calc_cov'
+
+            if fix_alpha and fix_gamma and not transient_asym_att_x:
+                # D_fw and D_bw are solved in closed form, see below
+                pass
 
-            if fix_alpha or fix_gamma:
+            elif fix_alpha or fix_gamma:
                 split = calibration_double_ended_solver(
                     self, st_label, ast_label, rst_label, rast_label,
                     st_var, ast_var, rst_var, rast_var,
                     calc_cov=calc_cov, solver='external_split',
                     transient_asym_att_x=transient_asym_att_x)
             else:
+                if p_val is not None:
+                    assert np.size(p_val) == 1 + 2 * nt + nx + 2 * nt * nta, \
+                        'p_val should contain gamma, D_fw, D_bw, alpha and ' \
+                        'the transient attenuation'
+                    # The solver only estimates alpha within the sections
+                    p_val = np.asarray(p_val, dtype=float)
+                    p_val = np.concatenate((
+                        p_val[:1 + 2 * nt], p_val[1 + 2 * nt + ix_sec],
+                        p_val[1 + 2 * nt + nx:]))
+
                 out = calibration_double_ended_solver(
                     self, st_label, ast_label, rst_label, rast_label,
                     st_var, ast_var, rst_var, rast_var,
                     calc_cov=calc_cov, solver=solver,
-                    transient_asym_att_x=transient_asym_att_x)
+                    transient_asym_att_x=transient_asym_att_x, x0=p_val,
+                    solver_kwargs=solver_kwargs)
 
                 if calc_cov:
                     p_val, p_var, p_cov = out
@@ -1722,7 +2003,29 @@ class DataStore(xr.Dataset):
             I_bw = 1/Tref*gamma - D_bw + E - TA_bw
             (I_bw - I_fw) / 2 = D_fw/2 - D_bw/2 + E + TA_fw/2 - TA_bw/2 Eq42
             """
-            if fix_alpha and fix_gamma:
+            if fix_alpha and fix_gamma and not transient_asym_att_x:
+                assert np.size(fix_alpha[0]) == self[x_dim].size, \
+                    'define alpha for each location'
+                assert np.size(fix_alpha[1]) == self[x_dim].size, \
+                    'define var alpha for each location'
+
+                # The normal equations of D_fw and D_bw are a 2x2 system per
+                # time step. No need for a solver
+                out = calibration_double_ended_fixed(
+                    self, st_label, ast_label, rst_label, rast_label,
+                    st_var, ast_var, rst_var, rast_var,
+                    fix_gamma=fix_gamma, fix_alpha=fix_alpha,
+                    calc_cov=calc_cov)
+
+                # Added fixed gamma and alpha and their variance to the
+                # solution
+                p_val = np.concatenate(([fix_gamma[0]], out[0], fix_alpha[0]))
+                p_var = np.concatenate(([fix_gamma[1]], out[1], fix_alpha[1]))
+
+                if calc_cov:
+                    p_cov = expand_cov(out[2], p_var, np.arange(1, 2 * nt + 1))
+
+            elif fix_alpha and fix_gamma:
                 assert np.size(fix_alpha[0]) == self[x_dim].size, \
                     'define alpha for each location'
                 assert np.size(fix_alpha[1]) == self[x_dim].size, \
@@ -1766,14 +2069,15 @@ class DataStore(xr.Dataset):
                 y -= X_E.dot(fix_alpha[0])
                 y -= fix_gamma[0] * X_gamma
                 # variances are added. weight is the inverse of the variance
-                # of the observations
+                # of the observations. The variances of the fixed parameters
+                # enter times their coefficients squared
                 if method == 'wls':
                     w_ = np.concatenate((split['w_F'],
                                          split['w_B'],
                                          split['w_att1'],
                                          split['w_att2']))
-                    w = 1 / (1 / w_ + X_E.dot(fix_alpha[1]) +
-                             fix_gamma[1] * X_gamma)
+                    w = 1 / (1 / w_ + X_E.power(2).dot(fix_alpha[1]) +
+                             fix_gamma[1] * X_gamma ** 2)
 
                 else:
                     w = 1.
@@ -1784,16 +2088,33 @@ class DataStore(xr.Dataset):
                 p0_est = np.concatenate((split['p0_est'][1:1 + 2 * nt],
                                          split['p0_est'][1 + 2 * nt + nx_sec:]))
 
-                if solver == 'sparse':
+                cov_rows = None
+                cov_blocks = cov_blocks_per_time(nt, nta, 0, 2 * nt)
+
+                if solver in ('sparse', 'matrix_free', 'lsmr'):
+                    # X is already constructed by the external_split solver
                     out = wls_sparse(
                         X, y, w=w, x0=p0_est,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 elif solver == 'stats':
                     out = wls_stats(
                         X, y, w=w,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
+                        verbose=False)
+
+                elif solver == 'block':
+                    # The D_fw of different time steps share no observations
+                    out = wls_block(
+                        X, y, w=w, ix_diag=np.arange(nt),
+                        calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 # Added fixed gamma and its variance to the solution
@@ -1807,16 +2128,11 @@ class DataStore(xr.Dataset):
                                         out[1][2 * nt:]))
 
                 if calc_cov:
-                    # whether it returns a copy or a view depends on what
-                    # version of numpy you are using
-                    p_cov = np.diag(p_var).copy()
                     from_i = np.concatenate(
                         (np.arange(1, 2 * nt + 1),
                          np.arange(1 + 2 * nt + nx,
                                    1 + 2 * nt + nx + nta * nt * 2)))
-                    iox_sec1, iox_sec2 = np.meshgrid(
-                        from_i, from_i, indexing='ij')
-                    p_cov[iox_sec1, iox_sec2] = out[2]
+                    p_cov = expand_cov(out[2], p_var, from_i)
 
             elif fix_gamma:
                 X_gamma = sp.vstack((
@@ -1851,28 +2167,46 @@ class DataStore(xr.Dataset):
                                     split['y_att2']))
                 y -= fix_gamma[0] * X_gamma
                 # variances are added. weight is the inverse of the variance
-                # of the observations
+                # of the observations. The variances of the fixed parameters
+                # enter times their coefficients squared
                 if method == 'wls':
                     w_ = np.concatenate((split['w_F'],
                                          split['w_B'],
                                          split['w_att1'],
                                          split['w_att2']))
-                    w = 1 / (1 / w_ + fix_gamma[1] * X_gamma)
+                    w = 1 / (1 / w_ + fix_gamma[1] * X_gamma ** 2)
 
                 else:
                     w = 1.
                 p0_est = split['p0_est'][1:]
 
-                if solver == 'sparse':
+                cov_rows = None
+                cov_blocks = cov_blocks_per_time(
+                    nt, nta, 0, 2 * nt + nx_sec)
+
+                if solver in ('sparse', 'matrix_free', 'lsmr'):
+                    # X is already constructed by the external_split solver
                     out = wls_sparse(
                         X, y, w=w, x0=p0_est,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 elif solver == 'stats':
                     out = wls_stats(
                         X, y, w=w,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
+                        verbose=False)
+
+                elif solver == 'block':
+                    out = wls_block(
+                        X, y, w=w, ix_diag=2 * nt + np.arange(nx_sec),
+                        calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 # put E outside of reference section in solution
@@ -1913,16 +2247,12 @@ class DataStore(xr.Dataset):
                 p_var[1 + 2 * nt + ix_sec] = out[1][2 * nt:2 * nt + nx_sec]
 
                 if calc_cov:
-                    p_cov = np.diag(p_var).copy()
                     from_i = np.concatenate(
                         (np.arange(1, 2 * nt + 1),
                          2 * nt + 1 + ix_sec,
                          np.arange(1 + 2 * nt + nx,
                                    1 + 2 * nt + nx + nta * nt * 2)))
-
-                    iox_sec1, iox_sec2 = np.meshgrid(
-                        from_i, from_i, indexing='ij')
-                    p_cov[iox_sec1, iox_sec2] = out[2]
+                    p_cov = expand_cov(out[2], p_var, from_i)
 
             elif fix_alpha:
                 assert np.size(fix_alpha[0]) == self[x_dim].size, \
@@ -1966,13 +2296,14 @@ class DataStore(xr.Dataset):
                 y -= X_E.dot(fix_alpha[0])
 
                 # variances are added. weight is the inverse of the variance
-                # of the observations
+                # of the observations. The variances of the fixed parameters
+                # enter times their coefficients squared
                 if method == 'wls':
                     w_ = np.concatenate((split['w_F'],
                                          split['w_B'],
                                          split['w_att1'],
                                          split['w_att2']))
-                    w = 1 / (1 / w_ + X_E.dot(fix_alpha[1]))
+                    w = 1 / (1 / w_ + X_E.power(2).dot(fix_alpha[1]))
 
                 else:
                     w = 1.
@@ -1981,16 +2312,34 @@ class DataStore(xr.Dataset):
                     (split['p0_est'][:1 + 2 * nt],
                      split['p0_est'][1 + 2 * nt + nx_sec:]))
 
-                if solver == 'sparse':
+                # gamma couples all parameters
+                cov_rows = [0]
+                cov_blocks = cov_blocks_per_time(nt, nta, 1, 1 + 2 * nt)
+
+                if solver in ('sparse', 'matrix_free', 'lsmr'):
+                    # X is already constructed by the external_split solver
                     out = wls_sparse(
                         X, y, w=w, x0=p0_est,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 elif solver == 'stats':
                     out = wls_stats(
                         X, y, w=w,
                         calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
+                        verbose=False)
+
+                elif solver == 'block':
+                    # The D_fw of different time steps share no observations
+                    out = wls_block(
+                        X, y, w=w, ix_diag=1 + np.arange(nt),
+                        calc_cov=calc_cov,
+                        cov_rows=cov_rows,
+                        cov_blocks=cov_blocks,
                         verbose=False)
 
                 # Added fixed gamma and its variance to the solution
@@ -2002,16 +2351,11 @@ class DataStore(xr.Dataset):
                                         out[1][1 + 2 * nt:]))
 
                 if calc_cov:
-                    p_cov = np.diag(p_var).copy()
-
                     from_i = np.concatenate(
                         (np.arange(1 + 2 * nt),
                          np.arange(1 + 2 * nt + nx,
                                    1 + 2 * nt + nx + nta * nt * 2)))
-
-                    iox_sec1, iox_sec2 = np.meshgrid(
-                        from_i, from_i, indexing='ij')
-                    p_cov[iox_sec1, iox_sec2] = out[2]
+                    p_cov = expand_cov(out[2], p_var, from_i)
 
             else:
                 pass
@@ -2033,6 +2377,8 @@ class DataStore(xr.Dataset):
 
         # store calibration parameters in DataStore
         self[store_gamma] = (tuple(), gamma)
+        self[store_gamma].attrs.update(
+            {'lsmr_' + k: v for k, v in solver_info.items()})
         self[store_alpha] = ((x_dim,), alpha)
         self[store_df] = ((time_dim,), d_fw)
         self[store_db] = ((time_dim,), d_bw)
@@ -2111,7 +2457,8 @@ class DataStore(xr.Dataset):
                 ci_avg_time_flag=False,
                 da_random_state=None,
                 remove_mc_set_flag=remove_mc_set_flag,
-                reduce_memory_usage=reduce_memory_usage)
+                reduce_memory_usage=reduce_memory_usage,
+                method=tmpw_method)
 
         elif store_tmpw and method == 'ols':
             self[store_tmpw] = (self[store_tmpf] + self[store_tmpb]) / 2
@@ -2144,8 +2491,8 @@ class DataStore(xr.Dataset):
                     if 'params2' in self.coords:
                         del self.coords['params2']
 
+            set_p_cov(self, p_cov, label=store_p_cov)
             self[store_p_val] = (('params1',), p_val)
-            self[store_p_cov] = (('params1', 'params2'), p_cov)
         else:
             pass
 
@@ -2167,7 +2514,10 @@ class DataStore(xr.Dataset):
             ci_avg_x_flag=False,
             da_random_state=None,
             remove_mc_set_flag=True,
-            reduce_memory_usage=False):
+            reduce_memory_usage=False,
+            method='mc',
+            mc_batch_size=None,
+            mc_seed=None):
         """
 
         Parameters
@@ -2181,7 +2531,9 @@ class DataStore(xr.Dataset):
             Similar to the spec sheets of the DTS manufacturers. And similar to
             passing an array filled with zeros. If set to string, the p_cov
             is retreived by accessing ds[p_cov] . See p_cov keyword argument in
-            the calibration routine.
+            the calibration routine. A sparse matrix, e.g. stored compactly
+            with `calc_cov='blocks'`, is sampled with its factor, see
+            `get_cov_factor`.
         st_label : str
             Key of the forward Stokes
         ast_label : str
@@ -2225,7 +2577,140 @@ class DataStore(xr.Dataset):
             variance are calculated.
         reduce_memory_usage : bool
             Use less memory but at the expense of longer computation time
+        method : {'mc', 'delta'}
+            'mc' propagates the uncertainty with Monte Carlo realizations of
+            the Stokes signals and the parameters. 'delta' linearizes the
+            temperature around the estimated parameters and Stokes signals
+            (delta method), which requires a single pass over the data
+            instead of `mc_sample_size` passes. The variance and the
+            confidence intervals, assuming a normal distribution, are
+            stored under the same keys. Not available with
+            `ci_avg_time_flag` or `ci_avg_x_flag`.
+        mc_batch_size : int, optional
+            Process the Monte Carlo samples in batches of this size with
+            numpy. Only the running statistics of the temperature are kept,
+            see `datastore_utils.StreamingStatistics`, so the memory usage
+            scales with `mc_batch_size` instead of with `mc_sample_size`.
+            The confidence intervals are estimated from a histogram. Uses
+            numpy's global random state instead of `da_random_state`. Not
+            available with `ci_avg_time_flag` or `ci_avg_x_flag`.
+        mc_seed : int or numpy.random.SeedSequence, optional
+            Draw all Monte Carlo samples from streams of this seed instead
+            of `da_random_state` and numpy's global random state, see
+            `datastore_utils.spawn_generator`. The parameters and the noise
+            of each Stokes measurement per block of locations and time
+            steps, see `datastore_utils.dask_normal_rvs`, have their own
+            stream, so that the results are reproducible and independent of
+            the chunks and of the dask scheduler or workers. With
+            `mc_batch_size`, each batch has its own streams, so the results
+            depend on `mc_batch_size`.
         """
+        def rng(*key):
+            # Numpy's global random state if no seed is given
+            if mc_seed is not None:
+                return spawn_generator(mc_seed, *key)
+
+        time_dim = self.get_time_dim(data_var_key=st_label)
+        x_dim = self.get_x_dim(data_var_key=st_label)
+
+        no, nt = self[st_label].data.shape
+        npar = nt + 2  # number of parameters
+
+        if method == 'delta':
+            assert not ci_avg_time_flag and not ci_avg_x_flag, \
+                'Averaging the confidence intervals requires method mc'
+
+            if isinstance(p_val, str):
+                p_val = self[p_val].values
+            assert p_val.shape == (npar,)
+
+            if isinstance(p_cov, str):
+                p_cov = get_p_cov(self, label=p_cov)
+
+            gamma = p_val[0]
+            dalpha = p_val[1]
+            c = p_val[2:nt + 2]
+
+            st = self[st_label].data
+            ast = self[ast_label].data
+            x = self[x_dim].values[:, None]
+
+            denom = np.log(st / ast) + c + dalpha * x
+            tmpf = gamma / denom - 273.15
+
+            # Derivative of the temperature to log(st / ast), c and dalpha * x
+            dT_dD = -gamma / denom ** 2
+            tmpf_var = dT_dD ** 2 * (st_var / st ** 2 + ast_var / ast ** 2)
+
+            if not (isinstance(p_cov, bool) and not p_cov):
+                assert p_cov.shape == (npar, npar)
+                tmpf_var = tmpf_var + linear_combination_var(
+                    p_cov,
+                    [1 / denom, dT_dD * x, dT_dD],
+                    [np.zeros((1, 1), dtype=int), np.ones((1, 1), dtype=int),
+                     2 + np.arange(nt)[None]])
+
+            self[store_tmpf + '_MC' + store_tempvar] = (
+                (x_dim, time_dim), tmpf_var)
+
+            if conf_ints:
+                self.coords['CI'] = conf_ints
+                z = sst.norm.ppf(np.asarray(conf_ints) / 100)[:, None, None]
+                self[store_tmpf + '_MC'] = (
+                    ('CI', x_dim, time_dim), tmpf + z * tmpf_var ** 0.5)
+
+            return
+
+        elif method != 'mc':
+            raise ValueError('Choose a valid method')
+
+        if mc_batch_size:
+            assert not ci_avg_time_flag and not ci_avg_x_flag, \
+                'Averaging the confidence intervals requires the Monte ' \
+                'Carlo set, set mc_batch_size to None'
+
+            if isinstance(p_val, str):
+                p_val = self[p_val].values
+            assert p_val.shape == (npar,)
+
+            fixed_params = isinstance(p_cov, bool) and not p_cov
+            if not fixed_params:
+                p_cov_factor = self.get_cov_factor(p_cov, cov_rows=[0, 1])
+                assert p_cov_factor.npar == npar
+
+            st = self[st_label].values.astype(float)
+            ast = self[ast_label].values.astype(float)
+            x = self[x_dim].values[:, None]
+
+            stats = StreamingStatistics()
+
+            for ib, i0 in enumerate(range(0, mc_sample_size, mc_batch_size)):
+                size = min(mc_batch_size, mc_sample_size - i0)
+
+                if fixed_params:
+                    p_mc = np.broadcast_to(p_val, (size, npar))
+                else:
+                    p_mc = p_cov_factor.rvs(
+                        p_val, size=size, random_state=rng(0, ib))
+
+                r_st = st + st_var ** 0.5 * standard_normal_rvs(
+                    size, (no, nt), random_state=rng(2, ib))
+                r_ast = ast + ast_var ** 0.5 * standard_normal_rvs(
+                    size, (no, nt), random_state=rng(3, ib))
+
+                stats.update(p_mc[:, 0, None, None] / (
+                    np.log(r_st / r_ast) + p_mc[:, None, 2:nt + 2] +
+                    p_mc[:, 1, None, None] * x) - 273.15)
+
+            self[store_tmpf + '_MC' + store_tempvar] = (
+                (x_dim, time_dim), stats.var())
+
+            if conf_ints:
+                self.coords['CI'] = conf_ints
+                self[store_tmpf + '_MC'] = (
+                    ('CI', x_dim, time_dim), stats.quantile(conf_ints))
+
+            return
 
         assert conf_ints
 
@@ -2234,12 +2719,6 @@ class DataStore(xr.Dataset):
         else:
             state = da.random.RandomState()
 
-        time_dim = self.get_time_dim(data_var_key=st_label)
-        x_dim = self.get_x_dim(data_var_key=st_label)
-
-        no, nt = self[st_label].data.shape
-        npar = nt + 2  # number of parameters
-
         self.coords['MC'] = range(mc_sample_size)
         self.coords['CI'] = conf_ints
 
@@ -2248,7 +2727,8 @@ class DataStore(xr.Dataset):
             p_val = self[p_val].data
         assert p_val.shape == (npar,)
 
-        assert isinstance(p_cov, (str, np.ndarray, np.generic, bool))
+        assert isinstance(p_cov, (str, np.ndarray, np.generic, bool)) or \
+            sp.issparse(p_cov)
         if isinstance(p_cov, bool) and not p_cov:
             gamma = p_val[0]
             dalpha = p_val[1]
@@ -2262,12 +2742,11 @@ class DataStore(xr.Dataset):
                 'Not an implemented option. Check p_cov argument')
 
         else:
-            if isinstance(p_cov, str):
-                p_cov = self[p_cov].data
-            assert p_cov.shape == (npar, npar)
+            p_cov_factor = self.get_cov_factor(p_cov, cov_rows=[0, 1])
+            assert p_cov_factor.npar == npar
 
-            p_mc = sst.multivariate_normal.rvs(
-                mean=p_val, cov=p_cov, size=mc_sample_size)
+            p_mc = p_cov_factor.rvs(
+                p_val, size=mc_sample_size, random_state=rng(0))
 
             gamma = p_mc[:, 0]
             dalpha = p_mc[:, 1]
@@ -2290,19 +2769,25 @@ class DataStore(xr.Dataset):
                 memchunk = da.ones((mc_sample_size, no, nt),
                                    chunks={0: -1, 1: 'auto', 2: -1}).chunks
 
-        for k, st_labeli, st_vari in zip(
+        for ik, k, st_labeli, st_vari in zip(
+            [2, 3],
             ['r_st', 'r_ast'],
             [st_label, ast_label],
                 [st_var, ast_var]):
             loc = da.from_array(self[st_labeli].data, chunks=memchunk[1:])
 
-            self[k] = (
-                ('MC', x_dim, time_dim),
-                state.normal(
+            if mc_seed is None:
+                r_sti = state.normal(
                     loc=loc,  # has chunks=memchunk[1:]
                     scale=st_vari ** 0.5,
                     size=rsize,
-                    chunks=memchunk))
+                    chunks=memchunk)
+            else:
+                r_sti = dask_normal_rvs(
+                    loc, st_vari ** 0.5, mc_sample_size, memchunk,
+                    seed=mc_seed, key=(ik,))
+
+            self[k] = (('MC', x_dim, time_dim), r_sti)
 
         self[store_tmpf + '_MC_set'] = self['gamma_MC'] / (
             np.log(self['r_st'] / self['r_ast']) + self['c_MC'] +
@@ -2390,7 +2875,12 @@ class DataStore(xr.Dataset):
             var_only_sections=False,
             da_random_state=None,
             remove_mc_set_flag=True,
-            reduce_memory_usage=False):
+            reduce_memory_usage=False,
+            method='mc',
+            mc_batch_size=None,
+            mc_sampling='random',
+            mc_rel_tol=None,
+            mc_seed=None):
         """
 
         Parameters
@@ -2404,7 +2894,9 @@ class DataStore(xr.Dataset):
             into the confidence
             intervals. Similar to the spec sheets of the DTS manufacturers.
             And similar to
-            passing an array filled with zeros
+            passing an array filled with zeros. A sparse matrix, e.g. stored
+            compactly with `calc_cov='blocks'`, is sampled with its factor,
+            see `get_cov_factor`.
         st_label : str
             Key of the forward Stokes
         ast_label : str
@@ -2474,6 +2966,59 @@ class DataStore(xr.Dataset):
             variance are calculated.
         reduce_memory_usage : bool
             Use less memory but at the expense of longer computation time
+        method : {'mc', 'delta'}
+            'mc' propagates the uncertainty with Monte Carlo realizations of
+            the Stokes signals and the parameters. 'delta' linearizes the
+            temperatures around the estimated parameters and Stokes signals
+            (delta method), which requires a single pass over the data
+            instead of `mc_sample_size` passes. The variances, the weighted
+            temperature and the confidence intervals, assuming a normal
+            distribution, are stored under the same keys. Not available with
+            `ci_avg_time_flag`, `ci_avg_x_flag` or `var_only_sections`.
+        mc_batch_size : int, optional
+            Process the Monte Carlo samples in batches of this size with
+            numpy. Only the running statistics of the temperatures are kept,
+            see `datastore_utils.StreamingStatistics`, so the memory usage
+            scales with `mc_batch_size` instead of with `mc_sample_size`.
+            The confidence intervals are estimated from a histogram. The
+            weights of the weighted temperature are only known after all
+            samples, therefore its samples are regenerated in a second pass.
+            Uses numpy's global random state instead of `da_random_state`.
+            Not available with `ci_avg_time_flag`, `ci_avg_x_flag` or
+            `var_only_sections`.
+        mc_sampling : {'random', 'antithetic', 'qmc'}
+            Variance reduction of the Monte Carlo samples of the parameters
+            and the Stokes noise, see
+            `datastore_utils.standard_normal_rvs`. 'antithetic' pairs each
+            sample with its mirror image, which mainly improves the centre
+            of the confidence intervals. 'qmc' draws the parameters from a
+            scrambled Sobol sequence and stratifies the noise of each Stokes
+            measurement with a Latin hypercube. This improves the variance
+            and the confidence intervals per location and time, so that
+            fewer samples are needed for the same precision. Other than
+            'random', the samples are drawn with numpy's global random state
+            and the variance is computed with ddof=0. With `mc_batch_size`,
+            each batch is a separate randomization.
+        mc_rel_tol : float, optional
+            Only with `mc_batch_size`. Stop drawing batches once the
+            relative standard error of the variance of the forward and
+            backward temperatures, the root mean square over all locations
+            and times, is below `mc_rel_tol`, with a minimum of three
+            batches. The standard error is estimated from the spread of the
+            variance between the batches. The number of samples used and
+            the standard error are stored as `mc_sample_size` and
+            `mc_rel_se` attributes of the variances.
+        mc_seed : int or numpy.random.SeedSequence, optional
+            Draw all Monte Carlo samples from streams of this seed instead
+            of `da_random_state` and numpy's global random state, see
+            `datastore_utils.spawn_generator`. The parameters, the
+            parameters outside the reference sections and the noise of each
+            Stokes measurement per block of locations and time steps, see
+            `datastore_utils.dask_normal_rvs`, have their own stream, so
+            that the results are reproducible and independent of the chunks
+            and of the dask scheduler or workers. With `mc_batch_size`, each
+            batch has its own streams, so the results depend on
+            `mc_batch_size`.
 
         Returns
         -------
@@ -2541,8 +3086,308 @@ class DataStore(xr.Dataset):
             nta = tax.size
             npar += nt * 2 * nta
         else:
+            tax = []
             nta = 0
 
+        if method == 'delta':
+            assert not (ci_avg_time_flag or ci_avg_x_flag or
+                        var_only_sections), \
+                'Averaging the confidence intervals requires method mc'
+
+            if isinstance(p_val, str):
+                p_val = self[p_val].values
+            assert p_val.shape == (npar,)
+
+            if isinstance(p_cov, str):
+                p_cov = get_p_cov(self, label=p_cov)
+
+            if not (isinstance(p_cov, bool) and not p_cov):
+                assert p_cov.shape == (npar, npar)
+
+            x = self[x_dim].values
+            it = np.arange(nt)[None]
+            ix_alpha = 1 + 2 * nt + np.arange(no)[:, None]
+            alpha = p_val[ix_alpha]
+
+            tmp, tmp_var = dict(), dict()
+
+            for direction, (label, st_labeli, ast_labeli, st_vari, ast_vari,
+                            ix_d, alpha_sign) in enumerate([
+                    (store_tmpf, st_label, ast_label, st_var, ast_var,
+                     1 + it, 1.),
+                    (store_tmpb, rst_label, rast_label, rst_var, rast_var,
+                     1 + nt + it, -1.)]):
+                st = self[st_labeli].data
+                ast = self[ast_labeli].data
+
+                denom = np.log(st / ast) + p_val[ix_d] + alpha_sign * alpha
+
+                # The transient attenuation of each connector
+                ta_masks, ix_tas = [], []
+                for ita, taxi in enumerate(tax):
+                    if direction == 0:
+                        mask = (x >= taxi)[:, None]
+                    else:
+                        mask = (x < taxi)[:, None]
+
+                    ix_ta = 1 + 2 * nt + no + nt * direction + 2 * nt * ita + it
+                    denom = denom + mask * p_val[ix_ta]
+                    ta_masks.append(mask)
+                    ix_tas.append(ix_ta)
+
+                tmp[label] = p_val[0] / denom - 273.15
+
+                # Derivative of the temperature to the terms of denom
+                dT_dD = -p_val[0] / denom ** 2
+                tmp_var[label] = dT_dD ** 2 * (
+                    st_vari / st ** 2 + ast_vari / ast ** 2)
+
+                if not (isinstance(p_cov, bool) and not p_cov):
+                    tmp_var[label] = tmp_var[label] + linear_combination_var(
+                        p_cov,
+                        [1 / denom, dT_dD, alpha_sign * dT_dD] +
+                        [dT_dD * mask for mask in ta_masks],
+                        [np.zeros((1, 1), dtype=int), ix_d, ix_alpha] + ix_tas)
+
+            if store_tmpw:
+                tmp_var[store_tmpw] = 1 / (
+                    1 / tmp_var[store_tmpf] + 1 / tmp_var[store_tmpb])
+                tmp[store_tmpw] = (
+                    tmp[store_tmpf] / tmp_var[store_tmpf] +
+                    tmp[store_tmpb] / tmp_var[store_tmpb]
+                    ) * tmp_var[store_tmpw]
+                self[store_tmpw] = ((x_dim, time_dim), tmp[store_tmpw])
+
+            if conf_ints:
+                self.coords['CI'] = conf_ints
+                z = sst.norm.ppf(np.asarray(conf_ints) / 100)[:, None, None]
+
+            for label, del_label in zip(
+                    [store_tmpf, store_tmpb, store_tmpw],
+                    [del_tmpf_after, del_tmpb_after, False]):
+                if not label or del_label:
+                    continue
+
+                if store_tempvar:
+                    self[label + '_MC' + store_tempvar] = (
+                        (x_dim, time_dim), tmp_var[label])
+
+                if conf_ints:
+                    self[label + '_MC'] = (
+                        ('CI', x_dim, time_dim),
+                        tmp[label] + z * tmp_var[label] ** 0.5)
+
+            return
+
+        elif method != 'mc':
+            raise ValueError('Choose a valid method')
+
+        if mc_sampling not in ('random', 'antithetic', 'qmc'):
+            raise ValueError('Choose a valid sampling method')
+
+        assert not mc_rel_tol or mc_batch_size, \
+            'mc_rel_tol requires mc_batch_size'
+
+        def rng(*key):
+            # Numpy's global random state if no seed is given
+            if mc_seed is not None:
+                return spawn_generator(mc_seed, *key)
+
+        # The Stokes noise of each measurement is stratified separately
+        noise_sampling = 'lhs' if mc_sampling == 'qmc' else mc_sampling
+        ddof = 1 if mc_sampling == 'random' else 0
+
+        if mc_batch_size:
+            assert not (ci_avg_time_flag or ci_avg_x_flag or
+                        var_only_sections), \
+                'Averaging the confidence intervals requires the Monte ' \
+                'Carlo set, set mc_batch_size to None'
+
+            if isinstance(p_val, str):
+                p_val = self[p_val].values
+            assert p_val.shape == (npar,)
+
+            fixed_params = isinstance(p_cov, bool) and not p_cov
+
+            if not fixed_params:
+                p_cov_source = p_cov
+
+                if isinstance(p_cov, str):
+                    p_cov = get_p_cov(self, label=p_cov)
+                assert p_cov.shape == (npar, npar)
+
+                # Only the parameters within the reference sections are
+                # sampled jointly. See below
+                ix_sec = self.ufunc_per_section(x_indices=True, calc_per='all')
+                nx_sec = ix_sec.size
+                not_ix_sec = np.setdiff1d(np.arange(no), ix_sec)
+                from_i = np.concatenate((
+                    np.arange(1 + 2 * nt),
+                    1 + 2 * nt + ix_sec,
+                    np.arange(1 + 2 * nt + no, npar)))
+                po_val = p_val[from_i]
+
+                not_alpha_std = p_cov.diagonal()[
+                    1 + 2 * nt + not_ix_sec] ** 0.5
+                po_cov_factor = self.get_cov_factor(
+                    p_cov_source, cov_rows=[0], subset=from_i)
+
+            x = self[x_dim].values
+            stokes = [self[k].values.astype(float) for k in (
+                st_label, ast_label, rst_label, rast_label)]
+            stokes_std = [
+                v ** 0.5 for v in (st_var, ast_var, rst_var, rast_var)]
+
+            def sample_temperatures(size, ib):
+                if fixed_params:
+                    p_mc = np.broadcast_to(p_val, (size, npar))
+                else:
+                    p_mc = np.empty((size, npar))
+                    p_mc[:, from_i] = po_cov_factor.rvs(
+                        po_val, size=size, method=mc_sampling,
+                        random_state=rng(0, ib))
+                    p_mc[:, 1 + 2 * nt + not_ix_sec] = \
+                        p_val[1 + 2 * nt + not_ix_sec] + not_alpha_std * \
+                        standard_normal_rvs(
+                            size, (not_ix_sec.size,), method=mc_sampling,
+                            random_state=rng(1, ib))
+
+                gamma = p_mc[:, 0, None, None]
+                alpha = p_mc[:, 1 + 2 * nt:1 + 2 * nt + no, None]
+                ta = p_mc[:, 1 + 2 * nt + no:].reshape(
+                    (size, nt, 2, nta), order='F')
+
+                tmp_mc = []
+
+                for direction in range(2):
+                    # In place, to limit the memory usage per batch
+                    r_st, r_ast = [standard_normal_rvs(
+                        size, (no, nt), method=noise_sampling,
+                        random_state=rng(2 + i, ib))
+                        for i in (2 * direction, 2 * direction + 1)]
+                    for r, i in zip((r_st, r_ast),
+                                    (2 * direction, 2 * direction + 1)):
+                        r *= stokes_std[i]
+                        r += stokes[i]
+                    denom = np.log(np.divide(r_st, r_ast, out=r_st), out=r_st)
+                    del r_ast
+
+                    if direction == 0:
+                        denom += p_mc[:, None, 1:nt + 1] + alpha
+                    else:
+                        denom += p_mc[:, None, 1 + nt:2 * nt + 1] - alpha
+
+                    for ita, taxi in enumerate(tax):
+                        if direction == 0:
+                            mask = (x >= taxi)[:, None]
+                        else:
+                            mask = (x < taxi)[:, None]
+
+                        denom += mask * ta[:, None, :, direction, ita]
+
+                    tmp = np.divide(gamma, denom, out=denom)
+                    tmp -= 273.15
+                    tmp_mc.append(tmp)
+
+                return tmp_mc
+
+            batch_sizes = []
+            random_states = []
+            stats = {store_tmpf: StreamingStatistics(),
+                     store_tmpb: StreamingStatistics()}
+
+            # The sum and the sum of squares of the variance per batch, to
+            # estimate the convergence
+            n_batch_var = 0
+            batch_var_sum = np.zeros((2, no, nt))
+            batch_var_sum2 = np.zeros((2, no, nt))
+            mc_rel_se = np.nan
+
+            for ib, i0 in enumerate(range(0, mc_sample_size, mc_batch_size)):
+                size = min(mc_batch_size, mc_sample_size - i0)
+                batch_sizes.append(size)
+                random_states.append(np.random.get_state())
+                tmpf_mc, tmpb_mc = sample_temperatures(size, ib)
+                stats[store_tmpf].update(tmpf_mc)
+                stats[store_tmpb].update(tmpb_mc)
+
+                if size > 1:
+                    for i, tmp_mc in enumerate((tmpf_mc, tmpb_mc)):
+                        var_i = np.var(tmp_mc, axis=0, ddof=ddof)
+                        batch_var_sum[i] += var_i
+                        batch_var_sum2[i] += var_i ** 2
+                    n_batch_var += 1
+                del tmpf_mc, tmpb_mc
+
+                if n_batch_var > 1:
+                    mean_var = batch_var_sum / n_batch_var
+                    var_var = (batch_var_sum2 - n_batch_var * mean_var ** 2
+                               ) / (n_batch_var - 1)
+                    mc_rel_se = np.sqrt(np.mean(
+                        var_var / n_batch_var / mean_var ** 2))
+
+                if mc_rel_tol and n_batch_var >= 3 and \
+                        mc_rel_se < mc_rel_tol:
+                    break
+
+            tmpf_var = stats[store_tmpf].var(ddof=ddof)
+            tmpb_var = stats[store_tmpb].var(ddof=ddof)
+            mc_attrs = dict(
+                mc_sample_size=sum(batch_sizes),
+                mc_rel_se=mc_rel_se,
+                mc_sampling=mc_sampling)
+
+            if conf_ints:
+                self.coords['CI'] = conf_ints
+
+            def store_statistics(label, var, label_stats):
+                if store_tempvar:
+                    self[label + '_MC' + store_tempvar] = (
+                        (x_dim, time_dim), var)
+                    self[label + '_MC' + store_tempvar].attrs.update(
+                        mc_attrs)
+
+                if conf_ints:
+                    self[label + '_MC'] = (
+                        ('CI', x_dim, time_dim),
+                        label_stats.quantile(conf_ints))
+
+            for label, var, del_label in zip(
+                    [store_tmpf, store_tmpb], [tmpf_var, tmpb_var],
+                    [del_tmpf_after, del_tmpb_after]):
+                if label and not del_label:
+                    store_statistics(label, var, stats[label])
+
+            del stats
+
+            if store_tmpw:
+                tmpw_var = 1 / (1 / tmpf_var + 1 / tmpb_var)
+                self[store_tmpw] = (
+                    self[store_tmpf] / tmpf_var +
+                    self[store_tmpb] / tmpb_var) * tmpw_var
+
+                # Regenerate the same samples, now that the weights are known
+                random_state_end = np.random.get_state()
+                tmpw_stats = StreamingStatistics()
+
+                for ib, (size, random_state) in enumerate(
+                        zip(batch_sizes, random_states)):
+                    np.random.set_state(random_state)
+                    tmpf_mc, tmpb_mc = sample_temperatures(size, ib)
+                    tmpw_stats.update(
+                        (tmpf_mc / tmpf_var + tmpb_mc / tmpb_var) * tmpw_var)
+
+                np.random.set_state(random_state_end)
+
+                store_statistics(store_tmpw, tmpw_var, tmpw_stats)
+
+            if del_tmpf_after:
+                del self['TMPF']
+            if del_tmpb_after:
+                del self['TMPB']
+
+            return
+
         rsize = (mc_sample_size, no, nt)
 
         if reduce_memory_usage:
@@ -2568,7 +3413,8 @@ class DataStore(xr.Dataset):
             p_val = self[p_val].values
         assert p_val.shape == (npar,)
 
-        assert isinstance(p_cov, (str, np.ndarray, np.generic, bool))
+        assert isinstance(p_cov, (str, np.ndarray, np.generic, bool)) or \
+            sp.issparse(p_cov)
 
         if isinstance(p_cov, bool) and not p_cov:
             gamma = p_val[0]
@@ -2604,8 +3450,10 @@ class DataStore(xr.Dataset):
                 'Not an implemented option. Check p_cov argument')
 
         else:
+            p_cov_source = p_cov
+
             if isinstance(p_cov, str):
-                p_cov = self[p_cov].values
+                p_cov = get_p_cov(self, label=p_cov)
             assert p_cov.shape == (npar, npar)
 
             ix_sec = self.ufunc_per_section(x_indices=True, calc_per='all')
@@ -2614,13 +3462,12 @@ class DataStore(xr.Dataset):
                                      1 + 2 * nt + ix_sec,
                                      np.arange(1 + 2 * nt + no,
                                                1 + 2 * nt + no + nt * 2 * nta)))
-            iox_sec1, iox_sec2 = np.meshgrid(
-                from_i, from_i, indexing='ij')
             po_val = p_val[from_i]
-            po_cov = p_cov[iox_sec1, iox_sec2]
 
-            po_mc = sst.multivariate_normal.rvs(
-                mean=po_val, cov=po_cov, size=mc_sample_size)
+            po_mc = self.get_cov_factor(
+                p_cov_source, cov_rows=[0], subset=from_i).rvs(
+                    po_val, size=mc_sample_size, method=mc_sampling,
+                    random_state=rng(0))
 
             gamma = po_mc[:, 0]
             d_fw = po_mc[:, 1:nt + 1]
@@ -2638,13 +3485,12 @@ class DataStore(xr.Dataset):
 
             if np.any(not_ix_sec):
                 not_alpha_val = p_val[2 * nt + 1 + not_ix_sec]
-                not_alpha_var = p_cov[2 * nt + 1 + not_ix_sec,
-                                      2 * nt + 1 + not_ix_sec]
+                not_alpha_var = p_cov.diagonal()[2 * nt + 1 + not_ix_sec]
 
-                not_alpha_mc = np.random.normal(
-                    loc=not_alpha_val,
-                    scale=not_alpha_var ** 0.5,
-                    size=(mc_sample_size, not_alpha_val.size))
+                not_alpha_mc = not_alpha_val + not_alpha_var ** 0.5 * \
+                    standard_normal_rvs(
+                        mc_sample_size, (not_alpha_val.size,),
+                        method=mc_sampling, random_state=rng(1))
 
                 alpha[:, not_ix_sec] = not_alpha_mc
 
@@ -2681,7 +3527,8 @@ class DataStore(xr.Dataset):
                 self[store_ta + '_fw_MC'] = (('MC', x_dim, time_dim), ta_fw_arr)
                 self[store_ta + '_bw_MC'] = (('MC', x_dim, time_dim), ta_bw_arr)
 
-        for k, st_labeli, st_vari in zip(
+        for ik, k, st_labeli, st_vari in zip(
+            [2, 3, 4, 5],
             ['r_st', 'r_ast', 'r_rst', 'r_rast'],
             [st_label, ast_label, rst_label, rast_label],
                 [st_var, ast_var, rst_var, rast_var]):
@@ -2690,13 +3537,18 @@ class DataStore(xr.Dataset):
             else:
                 loc = da.from_array(self[st_labeli].data, chunks=memchunk[1:])
 
-            self[k] = (
-                ('MC', x_dim, time_dim),
-                state.normal(
+            if mc_sampling == 'random' and mc_seed is None:
+                r_sti = state.normal(
                     loc=loc,  # has chunks=memchunk[1:]
                     scale=st_vari ** 0.5,
                     size=rsize,
-                    chunks=memchunk))
+                    chunks=memchunk)
+            else:
+                r_sti = dask_normal_rvs(
+                    loc, st_vari ** 0.5, mc_sample_size, memchunk,
+                    method=noise_sampling, seed=mc_seed, key=(ik,))
+
+            self[k] = (('MC', x_dim, time_dim), r_sti)
 
         if ci_avg_time_flag:
             avg_dims = ['MC', time_dim]
@@ -2757,7 +3609,7 @@ class DataStore(xr.Dataset):
                         q = self[label + '_MC_set']
 
                     self[label + '_MC' + store_tempvar] = q.var(
-                        dim=avg_dims, ddof=1)
+                        dim=avg_dims, ddof=ddof)
 
                 if conf_ints and not del_label:
                     if ci_avg_time_flag:
@@ -2804,7 +3656,7 @@ class DataStore(xr.Dataset):
                     # subtract the mean temperature
                     q = self[store_tmpw + '_MC_set'] - self[store_tmpw]
                     self[store_tmpw + '_MC' + store_tempvar] = q.var(
-                            dim=avg2_dims, ddof=1)
+                            dim=avg2_dims, ddof=ddof)
 
             # Calculate the CI of the weighted MC_set
             if conf_ints:
@@ -3203,6 +4055,10 @@ def open_datastore(
     if chunks is None:
         chunks = {}
 
+    if lock is not None:
+        # Not all backends, e.g. zarr, accept the lock argument
+        backend_kwargs = dict(backend_kwargs or {}, lock=lock)
+
     with xr.open_dataset(
             filename_or_obj,
             group=group,
@@ -3213,7 +4069,6 @@ def open_datastore(
             decode_coords=decode_coords,
             engine=engine,
             chunks=chunks,
-            lock=lock,
             cache=cache,
             drop_variables=drop_variables,
             backend_kwargs=backend_kwargs) as ds_xr:
@@ -3279,6 +4134,13 @@ def read_silixa_files(
         timezone_netcdf='UTC',
         silent=False,
         load_in_memory='auto',
+        time_range=None,
+        x_range=None,
+        dtype=None,
+        workers=None,
+        executor=None,
+        cache_dir=None,
+        cache_max_size=2**30,
         **kwargs):
     """Read a folder with measurement files. Each measurement file contains
     values for a
@@ -3300,6 +4162,31 @@ def read_silixa_files(
         If set tot True, some verbose texts are not printed to stdout/screen
     load_in_memory : {'auto', True, False}
         If 'auto' the Stokes data is only loaded to memory for small files
+    time_range : tuple, optional
+        (start, end) of the measurements that are read, e.g.,
+        ('2018-03-28 01:40', '2018-03-28 02:00'). Either can be None. Files
+        with a timestamp in their filename outside this range are skipped
+        before they are parsed. The timestamps are in the timezone of the
+        measurement files.
+    x_range : tuple, optional
+        (x_min, x_max) of the locations along the fiber that are read. Either
+        can be None.
+    dtype : str or np.dtype, optional
+        Data type of the Stokes and anti-Stokes data. Defaults to 'float64'.
+        'float32' is sufficiently precise and halves the memory usage.
+    workers : int, optional
+        Parse the files in parallel using a pool of `workers` processes.
+        Defaults to None, the files are parsed in the current process.
+    executor : concurrent.futures.Executor, optional
+        Parse the files with a user provided executor, e.g. a
+        `ProcessPoolExecutor` that is reused for several calls. Cannot be
+        combined with `workers`.
+    cache_dir : str, Path, optional
+        Opt-in directory in which the parsed measurement files are cached.
+        Reading the same files again only parses new or changed files.
+    cache_max_size : int, optional
+        Maximum size of the cache in bytes. The least recently used files
+        are removed from the cache once exceeded.
     kwargs : dict-like, optional
         keyword-arguments are passed to DataStore initialization
 
@@ -3330,26 +4217,46 @@ def read_silixa_files(
         filepathlist) >= 1, 'No measurement files found in provided ' \
                             'list/directory'
 
+    filepathlist = filepathlist_time_range(filepathlist, time_range)
+    assert len(filepathlist) >= 1, 'No measurement files found within ' \
+                                   'time_range'
+
+    assert zip_handle is None or (workers is None and executor is None), \
+        'Zip handles can not be shared with other processes'
+
     xml_version = silixa_xml_version_check(filepathlist)
 
-    if xml_version == 4:
-        data_vars, coords, attrs = read_silixa_files_routine_v4(
-            filepathlist,
-            timezone_netcdf=timezone_netcdf,
-            silent=silent,
-            load_in_memory=load_in_memory)
+    with open_executor(workers=workers, executor=executor) as ex:
+        if xml_version == 4:
+            data_vars, coords, attrs = read_silixa_files_routine_v4(
+                filepathlist,
+                timezone_netcdf=timezone_netcdf,
+                silent=silent,
+                load_in_memory=load_in_memory,
+                executor=ex,
+                cache_dir=cache_dir,
+                x_range=x_range,
+                dtype=dtype)
+
+        elif xml_version == 6 or 7:
+            data_vars, coords, attrs = read_silixa_files_routine_v6(
+                filepathlist,
+                xml_version=xml_version,
+                timezone_netcdf=timezone_netcdf,
+                silent=silent,
+                load_in_memory=load_in_memory,
+                executor=ex,
+                cache_dir=cache_dir,
+                x_range=x_range,
+                dtype=dtype)
 
-    elif xml_version == 6 or 7:
-        data_vars, coords, attrs = read_silixa_files_routine_v6(
-            filepathlist,
-            xml_version=xml_version,
-            timezone_netcdf=timezone_netcdf,
-            silent=silent,
-            load_in_memory=load_in_memory)
+        else:
+            raise NotImplementedError(
+                'Silixa xml version ' +
+                '{0} not implemented'.format(xml_version))
 
-    else:
-        raise NotImplementedError(
-            'Silixa xml version ' + '{0} not implemented'.format(xml_version))
+    if cache_dir is not None:
+        evict_cache(cache_dir, cache_max_size)
 
     ds = DataStore(data_vars=data_vars, coords=coords, attrs=attrs, **kwargs)
     return ds
@@ -3359,6 +4266,12 @@ def read_sensortran_files(
         directory,
         timezone_netcdf='UTC',
         silent=False,
+        load_in_memory='auto',
+        time_range=None,
+        x_range=None,
+        dtype=None,
+        workers=None,
+        executor=None,
         **kwargs):
     """Read a folder with measurement files. Each measurement file contains
     values for a
@@ -3374,6 +4287,29 @@ def read_sensortran_files(
         Timezone string of the netcdf file. UTC follows CF-conventions.
     silent : bool
         If set tot True, some verbose texts are not printed to stdout/screen
+    load_in_memory : {'auto', True, False}
+        If False, only the file headers are read and the Stokes and
+        temperature traces are read from disk once they are used. Useful
+        for large archives. 'auto' loads the data in memory.
+    time_range : tuple, optional
+        (start, end) of the measurements that are read, e.g.,
+        ('2018-03-28 01:40', '2018-03-28 02:00'). Either can be None. Files
+        with a timestamp in their header outside this range are skipped
+        before they are parsed. The timestamps are in the timezone of the
+        measurement files.
+    x_range : tuple, optional
+        (x_min, x_max) of the locations along the fiber that are read. Either
+        can be None.
+    dtype : str or np.dtype, optional
+        Data type of the Stokes and anti-Stokes data. Defaults to their native
+        data type, 'int32'.
+    workers : int, optional
+        Parse the files in parallel using a pool of `workers` processes.
+        Defaults to None, the files are parsed in the current process.
+    executor : concurrent.futures.Executor, optional
+        Parse the files with a user provided executor, e.g. a
+        `ProcessPoolExecutor` that is reused for several calls. Cannot be
+        combined with `workers`.
     kwargs : dict-like, optional
         keyword-arguments are passed to DataStore initialization
 
@@ -3392,6 +4328,13 @@ def read_sensortran_files(
                                 'in provided directory: \n' + \
                                 str(directory)
 
+    filepathlist_dts = filepathlist_time_range(
+        filepathlist_dts,
+        time_range,
+        get_timestamp=lambda fp: read_sensortran_header(fp)[0]['time'])
+    assert len(filepathlist_dts) >= 1, 'No measurement files found within ' \
+                                       'time_range'
+
     filepathlist_temp = [f.replace('RawDTS', 'Temp') for f in filepathlist_dts]
 
     for ii, fname in enumerate(filepathlist_dts):
@@ -3403,11 +4346,16 @@ def read_sensortran_files(
     version = sensortran_binary_version_check(filepathlist_dts)
 
     if version == 3:
-        data_vars, coords, attrs = read_sensortran_files_routine(
-            filepathlist_dts,
-            filepathlist_temp,
-            timezone_netcdf=timezone_netcdf,
-            silent=silent)
+        with open_executor(workers=workers, executor=executor) as ex:
+            data_vars, coords, attrs = read_sensortran_files_routine(
+                filepathlist_dts,
+                filepathlist_temp,
+                timezone_netcdf=timezone_netcdf,
+                silent=silent,
+                load_in_memory=load_in_memory,
+                executor=ex,
+                x_range=x_range,
+                dtype=dtype)
     else:
         raise NotImplementedError(
                 'Sensortran binary version ' +
@@ -3425,6 +4373,13 @@ def read_apsensing_files(
         timezone_input_files='UTC',
         silent=False,
         load_in_memory='auto',
+        time_range=None,
+        x_range=None,
+        dtype=None,
+        workers=None,
+        executor=None,
+        cache_dir=None,
+        cache_max_size=2**30,
         **kwargs):
     """Read a folder with measurement files. Each measurement file contains
     values for a single timestep. Remember to check which timezone
@@ -3448,6 +4403,31 @@ def read_apsensing_files(
         If set tot True, some verbose texts are not printed to stdout/screen
     load_in_memory : {'auto', True, False}
         If 'auto' the Stokes data is only loaded to memory for small files
+    time_range : tuple, optional
+        (start, end) of the measurements that are read, e.g.,
+        ('2018-03-28 01:40', '2018-03-28 02:00'). Either can be None. Files
+        with a timestamp in their filename outside this range are skipped
+        before they are parsed. The timestamps are in the timezone of the
+        measurement files.
+    x_range : tuple, optional
+        (x_min, x_max) of the locations along the fiber that are read. Either
+        can be None.
+    dtype : str or np.dtype, optional
+        Data type of the Stokes and anti-Stokes data. Defaults to 'float64'.
+        'float32' is sufficiently precise and halves the memory usage.
+    workers : int, optional
+        Parse the files in parallel using a pool of `workers` processes.
+        Defaults to None, the files are parsed in the current process.
+    executor : concurrent.futures.Executor, optional
+        Parse the files with a user provided executor, e.g. a
+        `ProcessPoolExecutor` that is reused for several calls. Cannot be
+        combined with `workers`.
+    cache_dir : str, Path, optional
+        Opt-in directory in which the parsed measurement files are cached.
+        Reading the same files again only parses new or changed files.
+    cache_max_size : int, optional
+        Maximum size of the cache in bytes. The least recently used files
+        are removed from the cache once exceeded.
     kwargs : dict-like, optional
         keyword-arguments are passed to DataStore initialization
 
@@ -3477,11 +4457,23 @@ def read_apsensing_files(
         filepathlist) >= 1, 'No measurement files found in provided ' \
                             'list/directory'
 
-    data_vars, coords, attrs = read_apsensing_files_routine(
-        filepathlist,
-        timezone_netcdf=timezone_netcdf,
-        silent=silent,
-        load_in_memory=load_in_memory)
+    filepathlist = filepathlist_time_range(filepathlist, time_range)
+    assert len(filepathlist) >= 1, 'No measurement files found within ' \
+                                   'time_range'
+
+    with open_executor(workers=workers, executor=executor) as ex:
+        data_vars, coords, attrs = read_apsensing_files_routine(
+            filepathlist,
+            timezone_netcdf=timezone_netcdf,
+            silent=silent,
+            load_in_memory=load_in_memory,
+            executor=ex,
+            cache_dir=cache_dir,
+            x_range=x_range,
+            dtype=dtype)
+
+    if cache_dir is not None:
+        evict_cache(cache_dir, cache_max_size)
 
     ds = DataStore(data_vars=data_vars, coords=coords, attrs=attrs, **kwargs)
     return ds
@@ -3496,6 +4488,11 @@ def read_sensornet_files(
         silent=False,
         manual_fiber_start=None,
         manual_fiber_end=None,
+        time_range=None,
+        x_range=None,
+        dtype=None,
+        workers=None,
+        executor=None,
         **kwargs):
     """Read a folder with measurement files. Each measurement file contains
     values for a single timestep. Remember to check which timezone
@@ -3521,6 +4518,25 @@ def read_sensornet_files(
         If cable is not presented well automatically
     manual_fiber_end: float, optional
         If fiber end is not (well) defined by input files.
+    time_range : tuple, optional
+        (start, end) of the measurements that are read, e.g.,
+        ('2018-03-28 01:40', '2018-03-28 02:00'). Either can be None. Files
+        with a timestamp in their header outside this range are skipped
+        before they are parsed. The timestamps are in the timezone of the
+        measurement files.
+    x_range : tuple, optional
+        (x_min, x_max) of the locations along the fiber that are read. Either
+        can be None.
+    dtype : str or np.dtype, optional
+        Data type of the Stokes and anti-Stokes data. Defaults to 'float64'.
+        'float32' is sufficiently precise and halves the memory usage.
+    workers : int, optional
+        Parse the files in parallel using a pool of `workers` processes.
+        Defaults to None, the files are parsed in the current process.
+    executor : concurrent.futures.Executor, optional
+        Parse the files with a user provided executor, e.g. a
+        `ProcessPoolExecutor` that is reused for several calls. Cannot be
+        combined with `workers`.
     kwargs : dict-like, optional
         keyword-arguments are passed to DataStore initialization
 
@@ -3552,18 +4568,245 @@ def read_sensornet_files(
         filepathlist) >= 1, 'No measurement files found in provided ' \
                             'list/directory'
 
-    data_vars, coords, attrs = read_sensornet_files_routine_v3(
-        filepathlist,
-        timezone_netcdf=timezone_netcdf,
-        timezone_input_files=timezone_input_files,
-        silent=silent,
-        manual_fiber_start=manual_fiber_start,
-        manual_fiber_end=manual_fiber_end)
+    filepathlist = filepathlist_time_range(
+        filepathlist, time_range, get_timestamp=read_sensornet_timestamp)
+    assert len(filepathlist) >= 1, 'No measurement files found within ' \
+                                   'time_range'
+
+    with open_executor(workers=workers, executor=executor) as ex:
+        data_vars, coords, attrs = read_sensornet_files_routine_v3(
+            filepathlist,
+            timezone_netcdf=timezone_netcdf,
+            timezone_input_files=timezone_input_files,
+            silent=silent,
+            manual_fiber_start=manual_fiber_start,
+            manual_fiber_end=manual_fiber_end,
+            executor=ex,
+            x_range=x_range,
+            dtype=dtype)
 
     ds = DataStore(data_vars=data_vars, coords=coords, attrs=attrs, **kwargs)
     return ds
 
 
+def ingest_new_files(
+        store_path,
+        directory,
+        read_files=None,
+        file_ext='*.xml',
+        manifest_path=None,
+        filename_preamble='file_',
+        time_chunk=None,
+        get_timestamp=None,
+        **kwargs):
+    """Append the measurement files in `directory` that have not been ingested
+    before to a datastore on disk. The names of the ingested files are kept in
+    a manifest next to the store, so that only new files are parsed.
+
+    If `store_path` ends with '.zarr', the new measurements are appended
+    along the time dimension of a zarr store. Requires zarr to be installed.
+    Otherwise `store_path` is a folder to which each batch of new files is
+    written as a new netCDF file, which are opened together with
+    `open_mf_datastore(os.path.join(store_path, '*.nc'))`.
+
+    With `time_chunk` the new files are read and written in batches of at
+    most `time_chunk` files, so the peak memory usage is that of a single
+    batch. This allows converting an archive of raw files that does not fit
+    in memory. The data is written with the compression settings of
+    `DataStore.get_default_encoding()`. The manifest is updated after each
+    batch, so an interrupted conversion continues where it stopped.
+
+    In netCDF files the times are stored as integer microseconds, and
+    attribute names that netCDF does not accept are adapted: slashes are
+    replaced by ' per ' and surrounding whitespace is removed.
+
+    The new files are ingested in the order of their timestamps. The time
+    index of the store has to increase monotonically, therefore new files
+    with a timestamp before that of the last ingested file are refused with
+    a ValueError, before anything is written. Such late files have to be
+    added by rebuilding the store. The netCDF files are numbered after the
+    highest existing number, so that files that were removed from the folder
+    are never overwritten.
+
+    Parameters
+    ----------
+    store_path : str, Path
+        Path to the zarr store or to the folder with netCDF files
+    directory : str, Path
+        Path to folder with the measurement files
+    read_files : callable, optional
+        Function used to read the new files. Needs to support the
+        `filepathlist` argument, e.g., `read_silixa_files`,
+        `read_apsensing_files` and `read_sensornet_files`. Defaults to
+        `read_silixa_files`.
+    file_ext : str, optional
+        file extension of the measurement files
+    manifest_path : str, Path, optional
+        Path to the manifest. Defaults to `store_path + '.manifest.json'`.
+    filename_preamble : str
+        Filename of the netCDF files is `filename_preamble + '0000.nc'`
+    time_chunk : int, optional
+        Maximum number of files that are read and written at once. Defaults
+        to all new files at once.
+    get_timestamp : callable, optional
+        Function that returns the timestamp of a measurement file. Defaults
+        to the timestamp in the header for `read_sensornet_files`, see
+        `io.read_sensornet_timestamp`, and otherwise to the timestamp in the
+        filename, see `io.filename_timestamp`. Required if the filenames
+        contain no timestamp.
+    kwargs : dict-like, optional
+        keyword-arguments are passed to `read_files`
+
+    Returns
+    -------
+    filepathlist : list of str
+        The newly ingested files
+
+    Examples
+    --------
+    ingest_new_files('ds_store', directory='raw_data', silent=True)
+    ds = open_mf_datastore(os.path.join('ds_store', '*.nc'))
+
+    Convert a large archive to zarr in batches of 1000 files
+
+    ingest_new_files('ds.zarr', directory='raw_data', time_chunk=1000)
+    ds = open_datastore('ds.zarr', engine='zarr')
+
+    See Also
+    --------
+    dtscalibration.open_mf_datastore
+    """
+    import json
+
+    if read_files is None:
+        read_files = read_silixa_files
+
+    store_path = os.path.normpath(store_path)
+
+    if manifest_path is None:
+        manifest_path = store_path + '.manifest.json'
+
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, 'r') as fh:
+            manifest = json.load(fh)
+    else:
+        manifest = {'files': []}
+
+    ingested = set(manifest['files'])
+    filepathlist = [
+        fp for fp in glob.glob(os.path.join(directory, file_ext))
+        if os.path.basename(fp) not in ingested]
+
+    if not filepathlist:
+        return filepathlist
+
+    if get_timestamp is None and read_files is read_sensornet_files:
+        get_timestamp = read_sensornet_timestamp
+
+    if get_timestamp is None:
+        try:
+            timestamps = {
+                fp: pd.Timestamp(filename_timestamp(fp))
+                for fp in filepathlist}
+        except ValueError as e:
+            raise ValueError(
+                str(e) + '. Provide the `get_timestamp` argument to '
+                'obtain the timestamps of these measurement files') from e
+
+    else:
+        timestamps = {
+            fp: pd.Timestamp(get_timestamp(fp)) for fp in filepathlist}
+
+    filepathlist.sort(key=lambda fp: (timestamps[fp], os.path.basename(fp)))
+
+    if manifest.get('last_timestamp'):
+        last_timestamp = pd.Timestamp(manifest['last_timestamp'])
+        late = [os.path.basename(fp) for fp in filepathlist
+                if timestamps[fp] < last_timestamp]
+
+        if late:
+            raise ValueError(
+                'The timestamps of ' + ', '.join(late) + ' are before that '
+                'of the last ingested file, ' + str(last_timestamp) + '. '
+                'Rebuild the store to include them')
+
+    if time_chunk is None:
+        time_chunk = len(filepathlist)
+
+    for i0 in range(0, len(filepathlist), time_chunk):
+        filepathlist_chunk = filepathlist[i0:i0 + time_chunk]
+
+        ds = read_files(
+            filepathlist=filepathlist_chunk, file_ext=file_ext, **kwargs)
+
+        if store_path.endswith('.zarr'):
+            # netCDF doesn't like None's and neither does zarr
+            for attribute, value in ds.attrs.items():
+                if value is None:
+                    ds.attrs[attribute] = ''
+
+            if os.path.exists(store_path):
+                ds.to_zarr(store_path, mode='a', append_dim='time')
+            else:
+                if 'ST' in ds:
+                    encoding = ds.get_default_encoding(time_chunks_from_key='ST')
+                else:
+                    encoding = ds.get_default_encoding()
+
+                ds.to_zarr(
+                    store_path, mode='w-',
+                    encoding=get_zarr_encoding(ds, encoding))
+
+        else:
+            os.makedirs(store_path, exist_ok=True)
+
+            # After the highest number, also if files were removed
+            ixs = [
+                int(m.group(1)) for m in (
+                    re.fullmatch(re.escape(filename_preamble) + r'(\d+)\.nc',
+                                 fn)
+                    for fn in os.listdir(store_path)) if m]
+            nc_path = os.path.join(
+                store_path,
+                filename_preamble + '{:04d}.nc'.format(max(ixs, default=-1) + 1))
+
+            assert not os.path.exists(nc_path), nc_path + ' already exists'
+
+            # netCDF does not accept slashes and surrounding whitespace in
+            # attribute names, e.g., 'default loss term (dB/km)' of Sensornet
+            ds.attrs = {
+                k.strip().replace('/', ' per '): v
+                for k, v in ds.attrs.items()}
+
+            # The default float32 encoding of the times is lossy. Integer
+            # microseconds since the first day of the batch are decoded
+            # exactly, also by xarray versions that decode via float64.
+            encoding = ds.get_default_encoding()
+
+            for k, v in ds.variables.items():
+                if np.issubdtype(v.dtype, np.datetime64):
+                    t0 = pd.Timestamp(np.nanmin(v.values)).floor('D')
+                    encoding[k] = dict(
+                        encoding.get(k, {}),
+                        dtype='int64',
+                        units='microseconds since ' + t0.isoformat())
+
+            ds.to_netcdf(nc_path, encoding=encoding)
+
+        del ds
+
+        # Only update the manifest after the data is written
+        manifest['files'] += [os.path.basename(fp) for fp in filepathlist_chunk]
+        manifest['last_timestamp'] = str(timestamps[filepathlist_chunk[-1]])
+
+        with open(manifest_path + '.tmp', 'w') as fh:
+            json.dump(manifest, fh, indent=1)
+
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    return filepathlist
+
+
 def plot_dask(arr, file_path=None):
     """
     For debugging the scheduling of the calculation of dask arrays. Requires
@@ -1,6 +1,16 @@
 # coding=utf-8
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse as sp
+import scipy.stats as sst
+from scipy.sparse.csgraph import connected_components
+from scipy.special import ndtri
+
+from .calibrate_utils import calibration_single_ended_solver
 
 
 def check_dims(ds, labels, correct_dims=None):
@@ -59,6 +69,969 @@ def get_netcdf_encoding(ds, zlib=True, complevel=5, **kwargs):
     return encoding
 
 
+def get_zarr_encoding(ds, encoding):
+    """Translate a netCDF encoding, e.g., from `ds.get_default_encoding()`, to
+    an encoding that is understood by `ds.to_zarr()`. The zlib compression
+    level, the chunksizes and the dtypes are kept. The dtype of datetime
+    variables is not converted, as their units are fixed by the first write
+    and appending to a zarr store would lose precision. Requires numcodecs.
+
+    Parameters
+    ----------
+    ds : DataStore
+    encoding : dict
+        netCDF encoding with per variable `zlib`, `complevel`, `chunksizes`
+        and `dtype` keys
+
+    Returns
+    -------
+    zarr_encoding : dict
+    """
+    import numcodecs
+
+    zarr_encoding = {}
+
+    for k, v in encoding.items():
+        enc = {}
+
+        if 'dtype' in v and not np.issubdtype(ds[k].dtype, np.datetime64):
+            enc['dtype'] = v['dtype']
+
+        if v.get('zlib', False):
+            enc['compressor'] = numcodecs.Zlib(level=v.get('complevel', 4))
+
+        if 'chunksizes' in v:
+            enc['chunks'] = v['chunksizes']
+
+        zarr_encoding[k] = enc
+
+    return zarr_encoding
+
+
+def set_p_cov(ds, p_cov, label='p_cov'):
+    """Store the covariance matrix of the calibrated parameters in `ds`. A
+    dense matrix is stored as `(params1, params2)`. A sparse matrix, e.g.
+    from `calc_cov='blocks'`, is stored compactly by its nonzero entries
+    in `label`, `label + '_row'` and `label + '_col'`, so that it stays
+    small in memory and in the netCDF files.
+
+    Parameters
+    ----------
+    ds : DataStore
+    p_cov : array-like or scipy.sparse matrix
+    label : str
+
+    Returns
+    -------
+
+    """
+    for k in [label, label + '_row', label + '_col']:
+        if k in ds:
+            del ds[k]
+
+    if sp.issparse(p_cov):
+        p_cov = p_cov.tocoo()
+        nnz_dim = label + '_nnz'
+
+        ds[label] = ((nnz_dim,), p_cov.data)
+        ds[label + '_row'] = ((nnz_dim,), p_cov.row.astype(np.int32))
+        ds[label + '_col'] = ((nnz_dim,), p_cov.col.astype(np.int32))
+        ds[label].attrs['npar'] = p_cov.shape[0]
+
+    else:
+        ds[label] = (('params1', 'params2'), p_cov)
+
+    pass
+
+
+def get_p_cov(ds, label='p_cov', dense=False):
+    """Retrieve the covariance matrix of the calibrated parameters that is
+    stored with `set_p_cov`.
+
+    Parameters
+    ----------
+    ds : DataStore
+    label : str
+    dense : bool
+        If True, a compactly stored covariance matrix is expanded to a dense
+        array. Otherwise it is returned as a scipy.sparse matrix.
+
+    Returns
+    -------
+    p_cov : ndarray or scipy.sparse.csr_matrix
+    """
+    if label + '_row' not in ds:
+        return ds[label].values
+
+    npar = ds[label].attrs['npar']
+    p_cov = sp.csr_matrix(
+        (ds[label].values,
+         (ds[label + '_row'].values, ds[label + '_col'].values)),
+        shape=(npar, npar))
+
+    if dense:
+        return p_cov.toarray()
+    else:
+        return p_cov
+
+
+def spawn_generator(seed, *key):
+    """The random number generator of an independent stream of the
+    Monte Carlo samples. Each part of the samples, e.g., the parameters, or
+    the noise of a Stokes measurement at a location, is drawn from its own
+    stream, identified by `key`. The samples are then the same, regardless
+    of the order in which the parts are drawn and of the process that draws
+    them.
+
+    Parameters
+    ----------
+    seed : int or numpy.random.SeedSequence
+    key : int
+        Identifies the stream, see the `spawn_key` of
+        `numpy.random.SeedSequence`
+
+    Returns
+    -------
+    rng : numpy.random.Generator
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        entropy = seed.entropy
+        key = tuple(seed.spawn_key) + key
+    else:
+        entropy = seed
+
+    return np.random.default_rng(
+        np.random.SeedSequence(entropy, spawn_key=key))
+
+
+_sobol_max_dim = 21201
+
+
+def standard_normal_rvs(size, shape=(), method='random', random_state=None):
+    """Draw samples from the standard normal distribution, with optional
+    variance reduction along the first axis.
+
+    'antithetic' pairs the samples: the second half of the samples are the
+    negated first half. The error in the mean of a symmetric statistic
+    cancels, e.g., in the centre of a confidence interval.
+
+    'lhs' stratifies the samples of each element with a Latin hypercube:
+    each element has exactly one sample in each of the `size` equiprobable
+    intervals, and the intervals of the elements are randomly paired. The
+    errors in the variance and the quantiles of the samples of each element
+    are smaller than for random samples.
+
+    'qmc' draws a scrambled Sobol sequence, which also stratifies the
+    projections on pairs, triples, etc. of elements. A power of two is the
+    best `size`. Above 21201 elements a Latin hypercube is drawn instead.
+
+    With 'antithetic', 'lhs' and 'qmc', the mean of the samples is close to
+    zero, therefore the variance of a function of the samples is estimated
+    best without the correction for the degrees of freedom (ddof=0).
+
+    Parameters
+    ----------
+    size : int
+        Number of samples
+    shape : tuple of int
+        Shape of each sample
+    method : {'random', 'antithetic', 'lhs', 'qmc'}
+    random_state : numpy.random.RandomState or numpy.random.Generator
+        Defaults to numpy's global random state
+
+    Returns
+    -------
+    out : ndarray
+        Of shape (size,) + shape
+    """
+    rs = np.random if random_state is None else random_state
+    shape = (size,) + tuple(shape)
+
+    if method == 'random':
+        return rs.normal(size=shape)
+
+    elif method == 'antithetic':
+        half = size // 2
+        out = np.empty(shape)
+        out[:half] = rs.normal(size=(half,) + shape[1:])
+        np.negative(out[:half], out=out[half:2 * half])
+
+        # An unpaired sample if size is odd
+        out[2 * half:] = rs.normal(size=(size - 2 * half,) + shape[1:])
+        return out
+
+    elif method in ('lhs', 'qmc'):
+        d = int(np.prod(shape[1:]))
+
+        if method == 'qmc' and 0 < d <= _sobol_max_dim and size > 1:
+            if not hasattr(sst, 'qmc'):
+                raise ImportError("method='qmc' requires scipy >= 1.7")
+
+            if isinstance(rs, np.random.Generator):
+                sobol_seed = rs.integers(2 ** 31)
+            else:
+                sobol_seed = rs.randint(2 ** 31)
+
+            sobol = sst.qmc.Sobol(d, scramble=True, seed=sobol_seed)
+            u = sobol.random_base2(int(np.ceil(np.log2(size))))[:size]
+
+        else:
+            # Latin hypercube
+            u = np.argsort(rs.random((size, d)), axis=0).astype(float)
+            u += rs.random((size, d))
+            u /= size
+
+        np.clip(u, 1e-12, 1. - 1e-12, out=u)
+        return ndtri(u, out=u).reshape(shape)
+
+    else:
+        raise ValueError('Choose a valid sampling method')
+
+
+_rvs_x_block = 128
+_rvs_time_block = 128
+
+
+def dask_normal_rvs(loc, scale, size, chunks, method='random', seed=None,
+                    key=()):
+    """Draw a dask array of normally distributed samples, `size` per
+    element of `loc`, with the variance reduction of `standard_normal_rvs`.
+    The chunks along the first axis must span all samples.
+
+    Without `seed`, the chunks are drawn with their own random states,
+    seeded from numpy's global random state. With `seed`, the samples of
+    each block of `_rvs_x_block` locations, the second axis, by
+    `_rvs_time_block` time steps, the third axis, are drawn from their own
+    stream, see `spawn_generator`. The samples are then the same for any
+    chunks and on any worker, and a chunk only draws the blocks it
+    overlaps.
+
+    Parameters
+    ----------
+    loc : dask.array.Array
+        Mean of the samples, of shape (nx, nt) and chunked as `chunks[1:]`
+    scale : float or array-like
+        Standard deviation of the samples
+    size : int
+        Number of samples per element
+    chunks : tuple of tuple of int
+        Chunks of the result, of shape (size,) + loc.shape
+    method : {'random', 'antithetic', 'lhs', 'qmc'}
+    seed : int or numpy.random.SeedSequence, optional
+    key : tuple of int
+        Identifies the stream of `loc`, see `spawn_generator`
+
+    Returns
+    -------
+    out : dask.array.Array
+    """
+    import dask.array as da
+
+    assert len(chunks[0]) == 1, 'A chunk should contain all samples'
+
+    loc = da.asarray(loc).rechunk(chunks[1:])
+    nx, nt = loc.shape
+
+    if seed is None:
+        seeds = np.random.randint(
+            2 ** 31, size=tuple(len(c) for c in chunks[1:]))
+
+    def draw(loc_block, block_id=None, block_info=None):
+        if seed is None:
+            rs = np.random.RandomState(seeds[block_id[1:]])
+            out = standard_normal_rvs(
+                size, loc_block.shape, method=method, random_state=rs)
+
+        else:
+            (x0, x1), (t0, t1) = block_info[None]['array-location'][1:]
+            out = np.empty((size,) + loc_block.shape)
+            nbx, nbt = _rvs_x_block, _rvs_time_block
+
+            # Draw the entire blocks that overlap with the chunk
+            for jb in range(x0 // nbx, (x1 - 1) // nbx + 1):
+                a0, a1 = jb * nbx, min(jb * nbx + nbx, nx)
+                d0, d1 = max(a0, x0), min(a1, x1)
+
+                for ib in range(t0 // nbt, (t1 - 1) // nbt + 1):
+                    b0, b1 = ib * nbt, min(ib * nbt + nbt, nt)
+                    c0, c1 = max(b0, t0), min(b1, t1)
+
+                    rs = spawn_generator(seed, *key, jb, ib)
+                    out[:, d0 - x0:d1 - x0, c0 - t0:c1 - t0] = \
+                        standard_normal_rvs(
+                            size, (a1 - a0, b1 - b0), method=method,
+                            random_state=rs)[
+                                :, d0 - a0:d1 - a0, c0 - b0:c1 - b0]
+
+        out *= scale
+        out += loc_block
+        return out
+
+    return da.map_blocks(
+        draw, loc, new_axis=0, chunks=chunks, dtype=float)
+
+
+def multivariate_normal_rvs(mean, cov, size=1, cov_rows=None,
+                            method='random', random_state=None):
+    """Draw random samples from a multivariate normal distribution with a
+    dense or a sparse covariance matrix. The covariance matrix is factorized
+    at every call. Use `DataStore.get_cov_factor` to reuse the factor of the
+    covariance matrix of a DataStore.
+
+    Parameters
+    ----------
+    mean : array-like
+        Of size npar
+    cov : array-like or scipy.sparse matrix
+        Of shape (npar, npar)
+    size : int
+        Number of samples
+    cov_rows : array-like of int, optional
+        Indices of the coupling parameters of a sparse covariance matrix.
+        See `CovarianceFactor`.
+    method : {'random', 'antithetic', 'lhs', 'qmc'}
+        See `standard_normal_rvs`
+    random_state : numpy.random.RandomState or numpy.random.Generator
+        Defaults to numpy's global random state
+
+    Returns
+    -------
+    out : ndarray
+        Of shape (size, npar)
+    """
+    return CovarianceFactor(cov, cov_rows=cov_rows).rvs(
+        mean, size=size, method=method, random_state=random_state)
+
+
+def psd_factor(cov):
+    """Lower triangular factor L of a covariance matrix, cov = L L^T.
+    Covariance matrices that are not exactly positive definite, and stacks
+    thereof, are factorized with their eigendecomposition instead.
+
+    Parameters
+    ----------
+    cov : array-like
+        Of shape (..., n, n)
+
+    Returns
+    -------
+    L : ndarray
+        Of shape (..., n, n)
+    """
+    try:
+        return np.linalg.cholesky(cov)
+
+    except np.linalg.LinAlgError:
+        eig_val, eig_vec = np.linalg.eigh(cov)
+        return eig_vec * np.sqrt(np.clip(eig_val, 0., None))[..., None, :]
+
+
+class CovarianceFactor:
+    """
+    Factor of the covariance matrix of the calibrated parameters, to draw
+    random samples of the parameters without factorizing the covariance
+    matrix again for every draw.
+
+    A dense covariance matrix is factorized with a Cholesky decomposition.
+    A sparse covariance matrix, e.g., from `calc_cov='blocks'`, is thought to
+    consist of full coupling rows (e.g., gamma), and for the other
+    parameters a block-diagonal structure (e.g., the parameters per time
+    step). The coupling parameters are drawn from their marginal
+    distribution. The other parameters are then drawn per block from their
+    distribution conditional on the coupling parameters: a low-rank
+    regression on the coupling parameters plus a block-diagonal conditional
+    covariance, which is factorized per block. Blocks of equal size are
+    factorized together. Covariances that are not stored are thus
+    neglected, but the coupling rows are preserved exactly.
+
+    Parameters
+    ----------
+    cov : array-like or scipy.sparse matrix
+        Of shape (npar, npar)
+    cov_rows : array-like of int, optional
+        Indices of the coupling parameters of a sparse covariance matrix.
+        Defaults to the parameters of which the rows in `cov` are full.
+    """
+
+    def __init__(self, cov, cov_rows=None):
+        self.npar = cov.shape[0]
+
+        if not sp.issparse(cov):
+            self.L = psd_factor(np.asarray(cov, dtype=float))
+            return
+
+        self.L = None
+        npar = self.npar
+        cov = sp.csr_matrix(cov)
+
+        if cov_rows is None:
+            ig = np.flatnonzero(np.diff(cov.indptr) == npar)
+        else:
+            ig = np.asarray(cov_rows, dtype=int)
+
+        ir = np.setdiff1d(np.arange(npar), ig)
+
+        C_gg = cov[ig][:, ig].toarray()
+        C_rg = cov[ir][:, ig].toarray()
+
+        if ig.size:
+            self.L_gg = psd_factor(C_gg)
+
+            # Regression of the other parameters on the coupling parameters
+            H = np.linalg.lstsq(C_gg, C_rg.T, rcond=None)[0].T
+        else:
+            self.L_gg = np.zeros((0, 0))
+            H = np.zeros((ir.size, 0))
+
+        self.ig = ig
+        self.ir = ir
+        self.H = H
+
+        # Block-diagonal conditional covariance of the other parameters
+        C_rr = cov[ir][:, ir].tocoo()
+        L_data = C_rr.data - np.sum(H[C_rr.row] * C_rg[C_rr.col], axis=1)
+        n_blocks, block_of = connected_components(
+            C_rr, directed=False, return_labels=True)
+
+        block_size = np.bincount(block_of, minlength=n_blocks)
+        order = np.argsort(block_of, kind='stable')
+        block_start = np.concatenate(([0], np.cumsum(block_size)[:-1]))
+        pos = np.empty(ir.size, dtype=int)
+        pos[order] = np.arange(ir.size) - block_start[block_of[order]]
+
+        # Per block size, the parameter indices and the factors of the blocks
+        self.blocks = []
+
+        for size_i in np.unique(block_size):
+            blocks = np.flatnonzero(block_size == size_i)
+            iblock = np.full(n_blocks, -1, dtype=int)
+            iblock[blocks] = np.arange(blocks.size)
+
+            members = order[block_start[blocks][:, None] + np.arange(size_i)]
+
+            mask = iblock[block_of[C_rr.row]] >= 0
+            L = np.zeros((blocks.size, size_i, size_i))
+            L[iblock[block_of[C_rr.row[mask]]],
+              pos[C_rr.row[mask]],
+              pos[C_rr.col[mask]]] = L_data[mask]
+
+            self.blocks.append((ir[members], psd_factor(L)))
+
+    def rvs(self, mean, size=1, method='random', random_state=None):
+        """
+        Draw random samples.
+
+        Parameters
+        ----------
+        mean : array-like
+            Of size npar
+        size : int
+            Number of samples
+        method : {'random', 'antithetic', 'lhs', 'qmc'}
+            See `standard_normal_rvs`
+        random_state : numpy.random.RandomState or numpy.random.Generator
+            Defaults to numpy's global random state
+
+        Returns
+        -------
+        out : ndarray
+            Of shape (size, npar)
+        """
+        mean = np.asarray(mean, dtype=float)
+        assert mean.shape == (self.npar,)
+
+        z = standard_normal_rvs(
+            size, (self.npar,), method=method, random_state=random_state)
+
+        if self.L is not None:
+            return mean + np.dot(z, self.L.T)
+
+        ig, ir = self.ig, self.ir
+        out = np.empty((size, self.npar))
+
+        out[:, ig] = mean[ig] + np.dot(z[:, ig], self.L_gg.T)
+        out[:, ir] = mean[ir] + np.dot(out[:, ig] - mean[ig], self.H.T)
+
+        for members, L in self.blocks:
+            out[:, members] += np.matmul(
+                L, z[:, members][..., None])[..., 0]
+
+        return out
+
+
+class StreamingStatistics:
+    """
+    Mean, variance and quantiles of samples that arrive in batches, e.g.,
+    Monte Carlo realizations of the temperature. The statistics are
+    computed along the first axis of each batch, separately for all other
+    elements, e.g. per location and time step. Only the statistics are kept
+    in memory, not the samples.
+
+    The mean and variance are updated with the pairwise update of Welford's
+    algorithm (Chan et al.). The quantiles are estimated with a histogram
+    per element. Its bins are fixed after the first batch: `n_bins` bins
+    between `width` standard deviations below and above the mean of the
+    first batch, plus two bins for the samples outside. The quantiles are
+    interpolated linearly within the bins, with the smallest and largest
+    sample as outer edges. Statistics with the same bins can be merged.
+
+    The counts are stored as 16-bit unsigned integers, and are upcast once
+    more than 65535 samples are added. The histogram takes
+    2 * (`n_bins` + 2) bytes per element.
+
+    Parameters
+    ----------
+    n_bins : int
+        Number of bins of the histogram
+    width : float
+        Half-width of the histogram in standard deviations
+    dtype : numpy dtype
+        Unsigned integer type of the counts
+    """
+
+    def __init__(self, n_bins=50, width=5., dtype=np.uint16):
+        self.n_bins = n_bins
+        self.width = width
+        self.dtype = dtype
+
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+
+        self.center = None
+        self.scale = None
+        self.counts = None
+
+    def update(self, batch):
+        """
+        Add a batch of samples.
+
+        Parameters
+        ----------
+        batch : array-like
+            The samples along the first axis
+        """
+        batch = np.asarray(batch, dtype=float)
+        nb = batch.shape[0]
+
+        if nb == 0:
+            return
+
+        batch_mean = batch.mean(axis=0)
+        batch_m2 = np.sum(np.square(batch - batch_mean), axis=0)
+
+        if self.n == 0:
+            self.mean = batch_mean
+            self.m2 = batch_m2
+            self.min = batch.min(axis=0)
+            self.max = batch.max(axis=0)
+
+        else:
+            self._merge_moments(nb, batch_mean, batch_m2)
+            self.min = np.minimum(self.min, batch.min(axis=0))
+            self.max = np.maximum(self.max, batch.max(axis=0))
+
+        if self.counts is None:
+            # Fix the bins of the histogram
+            scale = np.sqrt(batch_m2 / max(nb - 1, 1))
+            self.center = batch_mean
+            self.scale = np.where(scale > 0., scale, 1.)
+            self.counts = np.zeros(
+                (self.n_bins + 2,) + batch_mean.shape, dtype=self.dtype)
+
+        self._reserve_counts(self.n + nb)
+        self.n += nb
+
+        # Bin 0 and n_bins + 1 contain the samples outside the histogram
+        z = (batch - self.center) / self.scale
+        z += self.width
+        z *= self.n_bins / (2 * self.width)
+        np.clip(z, -1., self.n_bins, out=z)
+        ibin = np.floor(z).astype(np.int32) + 1
+        del z
+
+        # Count the samples per bin and element with bincount, in chunks of
+        # elements such that the temporary counts are not larger than the
+        # batch
+        nbin = self.n_bins + 2
+        ncell = self.mean.size
+        ibin = ibin.reshape(nb, ncell)
+        counts = self.counts.reshape(nbin, ncell)
+        step = max(1, nb * ncell // nbin)
+
+        for i0 in range(0, ncell, step):
+            ibin_i = ibin[:, i0:i0 + step]
+            ni = ibin_i.shape[1]
+            flat = (ibin_i.astype(np.intp) * ni + np.arange(ni)).ravel()
+            counts[:, i0:i0 + ni] += np.bincount(
+                flat, minlength=nbin * ni).reshape(nbin, ni).astype(
+                    counts.dtype)
+
+    def _reserve_counts(self, n):
+        """Upcast the counts if they could overflow with `n` samples"""
+        for dtype in (self.counts.dtype, np.uint32, np.uint64):
+            if n <= np.iinfo(dtype).max:
+                break
+
+        if dtype != self.counts.dtype:
+            self.counts = self.counts.astype(dtype)
+
+    def empty_like(self):
+        """
+        Statistics without samples but with the same bins, to which samples
+        can be added that are later merged.
+
+        Returns
+        -------
+        StreamingStatistics
+        """
+        assert self.counts is not None, 'The bins are not yet fixed'
+
+        other = StreamingStatistics(
+            n_bins=self.n_bins, width=self.width, dtype=self.dtype)
+        other.center = self.center
+        other.scale = self.scale
+        other.counts = np.zeros_like(self.counts, dtype=self.dtype)
+        return other
+
+    def _merge_moments(self, n, mean, m2):
+        n_new = self.n + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * n / n_new
+        self.m2 = self.m2 + m2 + delta ** 2 * self.n * n / n_new
+
+    def merge(self, other):
+        """
+        Add the samples of statistics with the same bins, e.g., of the
+        samples computed by another process.
+
+        Parameters
+        ----------
+        other : StreamingStatistics
+        """
+        if other.n == 0:
+            return
+
+        assert self.counts is not None and \
+            np.array_equal(self.center, other.center) and \
+            np.array_equal(self.scale, other.scale), \
+            'Only statistics with the same bins can be merged'
+
+        if self.n == 0:
+            self.mean, self.m2 = other.mean, other.m2
+            self.min, self.max = other.min, other.max
+
+        else:
+            self._merge_moments(other.n, other.mean, other.m2)
+            self.min = np.minimum(self.min, other.min)
+            self.max = np.maximum(self.max, other.max)
+
+        self._reserve_counts(self.n + other.n)
+        self.n += other.n
+        self.counts += other.counts
+
+    def var(self, ddof=1):
+        """The variance of the samples"""
+        return self.m2 / (self.n - ddof)
+
+    def quantile(self, q):
+        """
+        Estimate quantiles of the samples.
+
+        Parameters
+        ----------
+        q : array-like of float
+            Percentiles between 0 and 100, as for `numpy.percentile`
+
+        Returns
+        -------
+        out : ndarray
+            Of shape (len(q), ...)
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        target = q.reshape(q.shape + (1,) * self.mean.ndim) / 100 * self.n
+        inner = np.linspace(-self.width, self.width, self.n_bins + 1)
+
+        def edge(i):
+            # The outer bins extend to the smallest and largest sample
+            if i == 0:
+                return np.minimum(self.min, edge(1))
+            elif i == self.n_bins + 2:
+                return np.maximum(self.max, edge(self.n_bins + 1))
+            else:
+                return self.center + self.scale * inner[i - 1]
+
+        # Walk through the bins with a running cumulative count, to not
+        # store the cumulative counts of all bins
+        out = np.zeros(q.shape + self.mean.shape)
+        found = np.zeros(out.shape, dtype=bool)
+        cum_prev = np.zeros(self.mean.shape, dtype=np.int64)
+
+        for ibin in range(self.n_bins + 2):
+            count = self.counts[ibin]
+            cum = cum_prev + count
+            hit = ~found & (cum >= target)
+
+            if hit.any():
+                lower, upper = edge(ibin), edge(ibin + 1)
+                frac = (target - cum_prev) / np.where(count > 0, count, 1)
+                np.copyto(out, lower + frac * (upper - lower), where=hit)
+                found |= hit
+
+            cum_prev = cum
+
+        return np.clip(out, self.min, self.max)
+
+
+def linear_combination_var(cov, coefs, ixs):
+    """Variance of a linear combination of parameters,
+    sum_i coefs[i] * p[ixs[i]], where p has covariance matrix `cov`.
+
+    The coefficients and the parameter indices are evaluated for many
+    combinations at once, e.g., per location and time step. The indices
+    broadcast against the coefficients, e.g., an index of shape (1, nt) for
+    a parameter per time step. The covariances are gathered per pair of
+    terms, thus the memory usage is of the order of the size of the
+    coefficients. Covariances that are not stored in a sparse `cov` are
+    neglected.
+
+    Parameters
+    ----------
+    cov : array-like or scipy.sparse matrix
+        Of shape (npar, npar)
+    coefs : list of array-like
+        The coefficients of each term. Numpy or dask arrays.
+    ixs : list of array-like of int
+        The indices of the parameters of each term
+
+    Returns
+    -------
+    var : array-like
+        Of the broadcasted shape of the coefficients
+    """
+    if sp.issparse(cov):
+        cov = sp.csr_matrix(cov)
+
+    def cov_entries(ix1, ix2):
+        ix1, ix2 = np.broadcast_arrays(ix1, ix2)
+
+        if sp.issparse(cov):
+            return np.asarray(
+                cov[ix1.ravel(), ix2.ravel()]).reshape(ix1.shape)
+        else:
+            return cov[ix1, ix2]
+
+    var = 0.
+
+    for i in range(len(coefs)):
+        for j in range(i, len(coefs)):
+            # The covariance of different terms appears twice
+            factor = 1. if i == j else 2.
+            var = var + factor * coefs[i] * coefs[j] * cov_entries(
+                ixs[i], ixs[j])
+
+    return var
+
+
+def calibrate_time_windows(
+        ds, calibration, time_window, n_jobs=None, **kwargs):
+    """
+    Calibrate windows of `time_window` time steps in parallel and combine
+    the estimates of the parameters that are constant in time: gamma and
+    dalpha for single-ended setups and gamma and alpha for double-ended
+    setups. Parameters that are fixed with `fix_*` arguments are not
+    combined and returned unchanged.
+
+    With wls, only supported for single-ended setups, the windows share no
+    observations, thus the estimates are combined weighted with their
+    normal matrices. These are the inverse of the covariance of each window
+    without its residual variance. The combined estimate equals that of
+    calibrating all time steps at once, and its covariance is scaled with
+    the pooled residual variance. With ols the windows are weighted with
+    their number of time steps and the variances are zero.
+
+    The combined parameters are returned as `fix_*` arguments, with which
+    the per time step parameters of the complete DataStore are obtained.
+
+    Parameters
+    ----------
+    ds : DataStore
+    calibration : {'calibration_single_ended', 'calibration_double_ended'}
+        Name of the calibration method
+    time_window : int
+        Number of time steps per window
+    n_jobs : int, optional
+        Number of processes. Defaults to the number of processors. If 1,
+        the windows are calibrated sequentially in this process. The
+        processes are spawned, so scripts should be guarded with
+        `if __name__ == '__main__':`.
+    kwargs
+        Passed to the calibration method of each window. Variances of the
+        Stokes signals with a time dimension are split as well.
+
+    Returns
+    -------
+    fix : dict
+        Contains `fix_gamma` and either `fix_dalpha` or `fix_alpha`. Tuples
+        of the combined values and their variances. For single-ended wls
+        without fixed parameters also `fix_cov`, the combined covariance
+        matrix of gamma and dalpha, see
+        `calibrate_utils.calibration_single_ended_fixed`.
+    """
+    time_dim = ds.get_time_dim()
+    nt = ds[time_dim].size
+
+    # Only keep what is needed for the calibration
+    labels = [v for k, v in kwargs.items() if k.endswith('_label')]
+    labels += list(kwargs.get('sections') or ds.sections)
+
+    windows, window_kwargs = [], []
+
+    for i0 in range(0, nt, time_window):
+        i1 = min(i0 + time_window, nt)
+        windows.append(ds[labels].isel({time_dim: slice(i0, i1)}))
+        window_kwargs.append({
+            k: v[..., i0:i1] if (
+                k.endswith('_var') and np.ndim(v) and np.shape(v)[-1] == nt)
+            else v for k, v in kwargs.items()})
+
+    if n_jobs == 1:
+        out = list(map(
+            calibrate_time_window, windows, repeat(calibration),
+            window_kwargs))
+
+    else:
+        # Forking a process with running dask threads may deadlock
+        with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                mp_context=multiprocessing.get_context('spawn')) as executor:
+            out = list(executor.map(
+                calibrate_time_window, windows, repeat(calibration),
+                window_kwargs))
+
+    p_win = np.array([o['p_val'] for o in out])
+
+    if calibration == 'calibration_single_ended':
+        fix_keys = ['fix_gamma', 'fix_dalpha']
+        sizes = [1, 1]
+    else:
+        fix_keys = ['fix_gamma', 'fix_alpha']
+        sizes = [1, p_win.shape[1] - 1]
+
+    # Only the parameters that are not fixed are combined. The fixed
+    # parameters are returned as they are passed.
+    free = np.flatnonzero(np.repeat(
+        [not kwargs.get(k) for k in fix_keys], sizes))
+
+    if kwargs.get('method') == 'ols':
+        nt_win = np.array([o['nt'] for o in out], dtype=float)
+        p_val = np.dot(nt_win, p_win) / nt_win.sum()
+        p_var = np.zeros(p_val.size)
+
+    else:
+        assert calibration == 'calibration_single_ended', \
+            'Time windows with wls are only supported for single-ended setups'
+
+        # The normal matrices of the free parameters, with c eliminated. The
+        # covariance of each window is scaled with its own residual variance
+        p_norm = np.array([
+            np.linalg.inv(o['p_cov'][np.ix_(free, free)]) * o['ssr'] / o['dof']
+            for o in out])
+        p_norm_inv = np.linalg.inv(p_norm.sum(axis=0))
+
+        p_val = p_win[0].copy()
+        p_val[free] = np.dot(
+            p_norm_inv, np.einsum('kij,kj->i', p_norm, p_win[:, free]))
+
+        # The residuals of all time steps at the combined estimate. The
+        # parameters of each window are counted once
+        p_diff = p_win[:, free] - p_val[free]
+        ssr = sum(o['ssr'] for o in out) + np.einsum(
+            'ki,kij,kj->', p_diff, p_norm, p_diff)
+        dof = sum(o['dof'] for o in out) + (len(out) - 1) * free.size
+
+        p_cov = np.zeros((2, 2))
+        p_cov[np.ix_(free, free)] = p_norm_inv * ssr / dof
+        p_var = np.diag(p_cov)
+
+    if calibration == 'calibration_single_ended':
+        fix = dict(
+            fix_gamma=kwargs.get('fix_gamma') or (p_val[0], p_var[0]),
+            fix_dalpha=kwargs.get('fix_dalpha') or (p_val[1], p_var[1]))
+
+        if kwargs.get('method') != 'ols' and free.size == 2:
+            fix['fix_cov'] = p_cov
+
+        return fix
+
+    else:
+        return dict(
+            fix_gamma=kwargs.get('fix_gamma') or (p_val[0], p_var[0]),
+            fix_alpha=kwargs.get('fix_alpha') or (p_val[1:], p_var[1:]))
+
+
+def calibrate_time_window(ds, calibration, kwargs):
+    """
+    Calibrate a single time window and return the estimates of the
+    parameters that are constant in time. Used by `calibrate_time_windows`.
+
+    Parameters
+    ----------
+    ds : DataStore
+    calibration : {'calibration_single_ended', 'calibration_double_ended'}
+        Name of the calibration method
+    kwargs : dict
+        Passed to the calibration method
+
+    Returns
+    -------
+    out : dict
+        With the number of time steps, `nt`, and `p_val`. For single-ended
+        wls also `p_cov` of gamma and dalpha, the weighted sum of squared
+        residuals, `ssr`, and its degrees of freedom, `dof`.
+    """
+    getattr(ds, calibration)(**kwargs)
+
+    nt = ds[ds.get_time_dim()].size
+    out = dict(nt=nt)
+
+    if calibration == 'calibration_single_ended':
+        out['p_val'] = np.array([ds['gamma'].values, ds['dalpha'].values])
+
+        if kwargs.get('method') == 'wls':
+            out['p_cov'] = sp.csr_matrix(get_p_cov(ds))[:2, :2].toarray()
+
+            # The weights of the observations as used by the calibration,
+            # including the variances of the fixed parameters
+            split = calibration_single_ended_solver(
+                ds, kwargs['st_label'], kwargs['ast_label'],
+                np.asarray(kwargs['st_var'], dtype=float),
+                np.asarray(kwargs['ast_var'], dtype=float),
+                calc_cov=False, solver='external_split')
+            X = sp.hstack(
+                (split['X_gamma'], split['X_dalpha'], split['X_c'])).tocsr()
+            w_inv = 1 / split['w']
+
+            for key, X_fix in [('fix_gamma', split['X_gamma']),
+                               ('fix_dalpha', split['X_dalpha'])]:
+                if kwargs.get(key):
+                    w_inv = w_inv + \
+                        kwargs[key][1] * X_fix.toarray().flatten() ** 2
+
+            resid = split['y'] - X.dot(ds['p_val'].values)
+            out['ssr'] = np.sum(resid ** 2 / w_inv)
+            out['dof'] = resid.size - nt - sum(
+                not kwargs.get(k) for k in ('fix_gamma', 'fix_dalpha'))
+
+    else:
+        out['p_val'] = np.concatenate(
+            ([ds['gamma'].values], ds['alpha'].values))
+
+    return out
+
+
 def check_timestep_allclose(ds, eps=0.01):
     """
     Check if all timesteps are of equal size. For now it is not possible to calibrate over timesteps
@@ -1,5 +1,7 @@
 # coding=utf-8
+import itertools
 import os
+import warnings
 from contextlib import contextmanager
 
 import dask.array as da
@@ -62,6 +64,27 @@ dim_attrs_apsensing.pop('acquisitionTime')
 dim_attrs_apsensing.pop('userAcquisitionTimeFW')
 dim_attrs_apsensing.pop('userAcquisitionTimeBW')
 
+# Labels of the Stokes and anti-Stokes data
+stokes_labels = ('ST', 'AST', 'REV-ST', 'REV-AST')
+
+# Header of the Sensortran binary files. Followed by two traces of
+# num_points values each
+sensortran_header_dtype = np.dtype([
+    ('survey_type', '<i2'),
+    ('hdr_version', '<i2'),
+    ('x_units', '<i4'),
+    ('y_units', '<i4'),
+    ('num_points', '<i4'),
+    ('num_pulses', '<i4'),
+    ('channel_id', '<i4'),
+    ('num_subtraces', '<i4'),
+    ('num_skipped', '<i4'),
+    ('reference_temperature', '<f4'),
+    ('time', '<i4'),
+    ('probe_name', 'V128'),
+    ('hdr_size', '<i4'),
+    ('hw_config', '<i4')])
+
 
 @contextmanager
 def open_file(path, **kwargs):
@@ -78,6 +101,316 @@ def open_file(path, **kwargs):
     pass
 
 
+@contextmanager
+def open_executor(workers=None, executor=None):
+    """Provides the executor that is used to parse the raw files.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of processes. If defined, a new
+        `concurrent.futures.ProcessPoolExecutor` is opened and shut down
+        afterwards.
+    executor : concurrent.futures.Executor, optional
+        An already running executor. It is not shut down afterwards.
+
+    Returns
+    -------
+    executor : concurrent.futures.Executor or None
+        None if neither `workers` nor `executor` are defined, in which case
+        the files are parsed in the current process or with the default dask
+        scheduler.
+    """
+    if executor is not None:
+        assert workers is None, 'Define either workers or executor'
+        yield executor
+
+    elif workers:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Forking while dask threads are running can deadlock the workers
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')) as pool:
+            yield pool
+
+    else:
+        yield None
+
+
+def read_with_cache(cache_dir, func, file_handle, *args):
+    """
+    Returns `func(file_handle, *args)`. The returned arrays are stored in
+    `cache_dir` and are reused by later calls with the same file and
+    arguments. The cache is keyed by the path, size and modification time of
+    the file, so changed files are parsed again.
+
+    Parameters
+    ----------
+    cache_dir : str or None
+        Directory to store the parsed files in. If None, no cache is used.
+    func : callable
+        Function that parses a single file and returns an array or a tuple of
+        arrays
+    file_handle : str or tuple
+        Path to the file. Files in zip archives are not cached.
+    args
+        Additional arguments passed to `func`
+
+    Returns
+    -------
+    out : np.ndarray or tuple of np.ndarray
+    """
+    import hashlib
+
+    if cache_dir is None or isinstance(file_handle, tuple):
+        return func(file_handle, *args)
+
+    stat = os.stat(file_handle)
+    key = repr((
+        func.__name__, os.path.abspath(file_handle), stat.st_size,
+        stat.st_mtime_ns, args))
+    cache_fn = os.path.join(
+        cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npz')
+
+    try:
+        with np.load(cache_fn) as npz:
+            is_tuple = bool(npz['is_tuple'])
+            out = tuple(
+                npz['arr_{}'.format(i)] for i in range(len(npz.files) - 1))
+
+        # The modification time of the cached file is its last access time
+        os.utime(cache_fn)
+        return out if is_tuple else out[0]
+
+    except (OSError, KeyError, ValueError):
+        # Not in cache or unreadable
+        pass
+
+    out = func(file_handle, *args)
+    arrs = out if isinstance(out, tuple) else (out,)
+
+    # Write to a temporary file first, files can be parsed concurrently
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_fn = cache_fn + '.{}.tmp'.format(os.getpid())
+
+    with open(tmp_fn, 'wb') as fh:
+        np.savez(fh, *arrs, is_tuple=isinstance(out, tuple))
+
+    os.replace(tmp_fn, cache_fn)
+    return out
+
+
+def read_files_with_cache(executor, cache_dir, func, filepathlist, *args):
+    """
+    Parses the files in parallel with `executor`, see `read_with_cache`.
+    The workers send back the parsed arrays, which are returned in the order
+    of `filepathlist`.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+    cache_dir : str or None
+    func : callable
+        Module-level function, so that it can be sent to other processes
+    filepathlist : list of str
+    args
+        Passed to `func` after the file path
+
+    Returns
+    -------
+    out : list
+        The output of `func` per file
+    """
+    return list(
+        executor.map(
+            read_with_cache,
+            itertools.repeat(cache_dir),
+            itertools.repeat(func),
+            filepathlist,
+            *map(itertools.repeat, args)))
+
+
+def evict_cache(cache_dir, max_size):
+    """
+    Removes the least recently used files from the cache created by
+    `read_with_cache` until its size is below `max_size`.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory
+    max_size : int
+        Maximum size of the cache in bytes
+    """
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = [e for e in os.scandir(cache_dir) if e.name.endswith('.npz')]
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+
+    size = 0
+    for entry in entries:
+        size += entry.stat().st_size
+
+        if size > max_size:
+            os.remove(entry.path)
+
+    pass
+
+
+def filename_timestamp(filename):
+    """
+    Obtain the timestamp from a filename, e.g.,
+    'channel 1_20180328014052498.xml' or
+    'channel 2_UTC_20191010_145850.340.xml'. Fractions of seconds are ignored.
+
+    Parameters
+    ----------
+    filename : str or tuple
+        Path to the file, or a tuple with the file name and the zip handle
+
+    Returns
+    -------
+    timestamp : pd.Timestamp
+    """
+    import re
+
+    if isinstance(filename, tuple):
+        filename = filename[0]
+
+    match = re.search(r'(\d{8})[_ ]?(\d{6})', os.path.split(filename)[-1])
+
+    if match is None:
+        raise ValueError('No timestamp found in filename ' + str(filename))
+
+    return pd.to_datetime(''.join(match.groups()), format='%Y%m%d%H%M%S')
+
+
+def filepathlist_time_range(
+        filepathlist, time_range, get_timestamp=filename_timestamp):
+    """
+    Select the files of which the timestamp is within `time_range`.
+
+    Parameters
+    ----------
+    filepathlist : list
+        List with paths to the files
+    time_range : tuple or None
+        (start, end) of the selection, inclusive. Either can be None. If None,
+        all files are selected.
+    get_timestamp : callable
+        Function that returns the timestamp of a file. Defaults to the
+        timestamp in the filename.
+
+    Returns
+    -------
+    filepathlist : list
+    """
+    if time_range is None:
+        return filepathlist
+
+    t_start, t_end = [None if t is None else pd.Timestamp(t)
+                      for t in time_range]
+
+    out = []
+    for fp in filepathlist:
+        t = get_timestamp(fp)
+
+        if (t_start is None or t >= t_start) and (t_end is None or t <= t_end):
+            out.append(fp)
+
+    return out
+
+
+def x_range_slice(x, x_range):
+    """
+    Slice that selects the locations of `x` within `x_range`.
+
+    Parameters
+    ----------
+    x : array-like
+        Monotonically increasing locations along the fiber
+    x_range : tuple or None
+        (x_min, x_max) of the selection, inclusive. Either can be None. If
+        None, all locations are selected.
+
+    Returns
+    -------
+    ix : slice
+    """
+    if x_range is None:
+        return slice(None)
+
+    x_min, x_max = x_range
+    i_start = 0 if x_min is None else int(
+        np.searchsorted(x, x_min, side='left'))
+    i_end = len(x) if x_max is None else int(
+        np.searchsorted(x, x_max, side='right'))
+
+    return slice(i_start, i_end)
+
+
+def parse_data_rows(rows, delimiter, ncol=None, decimal='.'):
+    """
+    Parse rows of delimited numbers at once with `np.fromstring`.
+
+    The cells of each row are counted first, so that a row with a missing
+    or an additional cell raises instead of shifting the values of the
+    following rows to other columns.
+
+    Parameters
+    ----------
+    rows : list of str
+        The rows, without line breaks
+    delimiter : str
+        Separator of the cells within a row
+    ncol : int, optional
+        Number of cells per row. Defaults to that of the first row.
+    decimal : str
+        Decimal separator, replaced by a decimal point
+
+    Returns
+    -------
+    data : np.ndarray
+        Array of shape (len(rows), ncol)
+    """
+    if ncol is None:
+        ncol = rows[0].count(delimiter) + 1 if rows else 0
+
+    ncell = np.fromiter(
+        map(str.count, rows, itertools.repeat(delimiter)),
+        dtype=int,
+        count=len(rows)) + 1
+    bad = np.flatnonzero(ncell != ncol)
+
+    if bad.size:
+        raise ValueError(
+            'Data row {} contains {} instead of {} values'.format(
+                bad[0], ncell[bad[0]], ncol))
+
+    block = delimiter.join(rows)
+
+    if decimal != '.':
+        block = block.replace(decimal, '.')
+
+    # Depending on the numpy version, np.fromstring stops at the first
+    # invalid value with a DeprecationWarning, or raises
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+
+        try:
+            data = np.fromstring(block, dtype=float, sep=delimiter)
+        except ValueError:
+            data = None
+
+    if data is None or data.size != len(rows) * ncol:
+        raise ValueError('Unable to parse all values of the data rows')
+
+    return data.reshape((len(rows), ncol))
+
+
 def silixa_xml_version_check(filepathlist):
     """Function which tests which version of xml files have to be read.
 
@@ -128,7 +461,11 @@ def read_silixa_files_routine_v6(
         xml_version=6,
         timezone_netcdf='UTC',
         silent=False,
-        load_in_memory='auto'):
+        load_in_memory='auto',
+        executor=None,
+        cache_dir=None,
+        x_range=None,
+        dtype=None):
     """
     Internal routine that reads Silixa files.
     Use dtscalibration.read_silixa_files function instead.
@@ -141,6 +478,15 @@ def read_silixa_files_routine_v6(
     filepathlist
     timezone_netcdf
     silent
+    executor : concurrent.futures.Executor, optional
+        Used to parse the files in parallel. The data is then always read
+        in memory.
+    cache_dir : str, optional
+        Directory in which the parsed files are cached
+    x_range : tuple, optional
+        (x_min, x_max) of the locations that are read
+    dtype : np.dtype, optional
+        Data type of the Stokes and anti-Stokes data
 
     Returns
     -------
@@ -163,8 +509,15 @@ def read_silixa_files_routine_v6(
     #  the mnemonic list and unit list
     nx = len(logdata_tree) - 2
 
+    # Select the locations within x_range using the first file. Only these
+    # rows are parsed.
+    ix = slice(*x_range_slice(
+        [float(el.text.split(',', 1)[0])
+         for el in logdata_tree if el.tag.endswith('data')],
+        x_range).indices(nx))
+    nx_sel = ix.stop - ix.start
+
     sep = ':'
-    ns = {'s': namespace[1:-1]}
 
     # Obtain metadata from the first file
     attrs = read_silixa_attrs_singlefile(filepathlist[0], sep)
@@ -242,57 +595,67 @@ def read_silixa_files_routine_v6(
         else:
             item['uom'] = ''
 
-    # Gather data
-    arr_path = 's:' + '/s:'.join(['log', 'logData', 'data'])
-
-    @dask.delayed
-    def grab_data_per_file(file_handle):
-        """
-
-        Parameters
-        ----------
-        file_handle
-
-        Returns
-        -------
-
-        """
-        with open_file(file_handle, mode='r') as f_h:
-            eltree = ElementTree.parse(f_h)
-            arr_el = eltree.findall(arr_path, namespaces=ns)
-
-            # remove the breaks on both sides of the string
-            # split the string on the comma
-            arr_str = [arr_eli.text[1:-1].split(',') for arr_eli in arr_el]
-
-        return np.array(arr_str, dtype=np.float)
+    # Obtaining the timeseries data (reference temperature etc)
+    _ts_dtype = [(k, np.float32) for k in timeseries]
+    _time_dtype = [
+        ('filename_tstamp', np.int64), ('minDateTimeIndex', '<U29'),
+        ('maxDateTimeIndex', '<U29')]
+    ts_dtype = np.dtype(_ts_dtype + _time_dtype)
 
-    data_lst_dly = [grab_data_per_file(fp) for fp in filepathlist]
-    data_lst = [
-        da.from_delayed(x, shape=(nx, nitem), dtype=np.float)
-        for x in data_lst_dly]
-    data_arr = da.stack(data_lst).T  # .compute()
+    # Gather data and timeseries in a single pass per file
+    timeseries_loc = [(k, v['loc']) for k, v in timeseries.items()]
 
-    # Check whether to compute data_arr (if possible 25% faster)
-    data_arr_cnk = data_arr.rechunk({0: -1, 1: -1, 2: 'auto'})
-    if load_in_memory == 'auto' and data_arr_cnk.npartitions <= 5:
-        if not silent:
-            print('Reading the data from disk')
-        data_arr = data_arr_cnk.compute()
-    elif load_in_memory:
+    if executor is not None:
         if not silent:
             print('Reading the data from disk')
-        data_arr = data_arr_cnk.compute()
+        out_lst = read_files_with_cache(
+            executor, cache_dir, read_silixa_data_singlefile_v6,
+            filepathlist, timeseries_loc, chFW, chBW, xml_version, ts_dtype,
+            ix)
+        data_arr = np.stack([x for x, _ in out_lst]).T
+        ts_arr = np.stack([x for _, x in out_lst])
+
     else:
-        if not silent:
-            print('Not reading the data from disk')
-        data_arr = data_arr_cnk
+        out_lst_dly = [
+            dask.delayed(read_with_cache, nout=2)(
+                cache_dir, read_silixa_data_singlefile_v6,
+                fp, timeseries_loc, chFW, chBW, xml_version, ts_dtype, ix)
+            for fp in filepathlist]
+        data_lst = [
+            da.from_delayed(x, shape=(nx_sel, nitem), dtype=float)
+            for x, _ in out_lst_dly]
+        ts_lst = [
+            da.from_delayed(x, shape=tuple(), dtype=ts_dtype)
+            for _, x in out_lst_dly]
+        data_arr = da.stack(data_lst).T  # .compute()
+        ts_arr = da.stack(ts_lst)
+
+        # Check whether to compute data_arr (if possible 25% faster)
+        # The data and the timeseries are computed together, so that each
+        # file is only parsed once.
+        data_arr_cnk = data_arr.rechunk({0: -1, 1: -1, 2: 'auto'})
+        if load_in_memory == 'auto' and data_arr_cnk.npartitions <= 5:
+            if not silent:
+                print('Reading the data from disk')
+            data_arr, ts_arr = dask.compute(data_arr_cnk, ts_arr)
+        elif load_in_memory:
+            if not silent:
+                print('Reading the data from disk')
+            data_arr, ts_arr = dask.compute(data_arr_cnk, ts_arr)
+        else:
+            if not silent:
+                print('Not reading the data from disk')
+            data_arr = data_arr_cnk
+            ts_arr = ts_arr.compute()
 
     data_vars = {}
     for name, data_arri in zip(data_item_names, data_arr):
         if name == 'LAF':
             continue
 
+        if dtype is not None and name in stokes_labels:
+            data_arri = data_arri.astype(dtype)
+
         if name in dim_attrs:
             data_vars[name] = (['x', 'time'], data_arri, dim_attrs[name])
 
@@ -301,80 +664,6 @@ def read_silixa_files_routine_v6(
                 'Dont know what to do with the' +
                 ' {} data column'.format(name))
 
-    # Obtaining the timeseries data (reference temperature etc)
-    _ts_dtype = [(k, np.float32) for k in timeseries]
-    _time_dtype = [
-        ('filename_tstamp', np.int64), ('minDateTimeIndex', '<U29'),
-        ('maxDateTimeIndex', '<U29')]
-    ts_dtype = np.dtype(_ts_dtype + _time_dtype)
-
-    @dask.delayed
-    def grab_timeseries_per_file(file_handle, xml_version):
-        """
-
-        Parameters
-        ----------
-        file_handle
-
-        Returns
-        -------
-
-        """
-        with open_file(file_handle, mode='r') as f_h:
-            eltree = ElementTree.parse(f_h)
-
-            out = []
-            for k, v in timeseries.items():
-                # Get all the timeseries data
-                if 'userAcquisitionTimeFW' in v['loc']:
-                    # requires two namespace searches
-                    path1 = 's:' + '/s:'.join(v['loc'][:4])
-                    val1 = eltree.findall(path1, namespaces=ns)
-                    path2 = 's:' + '/s:'.join(v['loc'][4:6])
-                    val2 = val1[chFW].find(path2, namespaces=ns)
-                    out.append(val2.text)
-
-                elif 'userAcquisitionTimeBW' in v['loc']:
-                    # requires two namespace searches
-                    path1 = 's:' + '/s:'.join(v['loc'][:4])
-                    val1 = eltree.findall(path1, namespaces=ns)
-                    path2 = 's:' + '/s:'.join(v['loc'][4:6])
-                    val2 = val1[chBW].find(path2, namespaces=ns)
-                    out.append(val2.text)
-
-                else:
-                    path = 's:' + '/s:'.join(v['loc'])
-                    val = eltree.find(path, namespaces=ns)
-                    out.append(val.text)
-
-            # get all the time related data
-            startDateTimeIndex = eltree.find(
-                's:log/s:startDateTimeIndex', namespaces=ns).text
-            endDateTimeIndex = eltree.find(
-                's:log/s:endDateTimeIndex', namespaces=ns).text
-
-            if isinstance(file_handle, tuple):
-                file_name = os.path.split(file_handle[0])[-1]
-            else:
-                file_name = os.path.split(file_handle)[-1]
-
-            if xml_version == 6:
-                tstamp = np.int64(file_name[10:27])
-            elif xml_version == 7:
-                tstamp = np.int64(file_name[15:27])
-            else:
-                raise ValueError('Unknown version number: {}'.format(
-                                                                xml_version))
-
-            out += [tstamp, startDateTimeIndex, endDateTimeIndex]
-        return np.array(tuple(out), dtype=ts_dtype)
-
-    ts_lst_dly = [
-            grab_timeseries_per_file(fp, xml_version) for fp in filepathlist]
-    ts_lst = [
-        da.from_delayed(x, shape=tuple(), dtype=ts_dtype) for x in ts_lst_dly]
-    ts_arr = da.stack(ts_lst).compute()
-
     for name in timeseries:
         if name in dim_attrs:
             data_vars[name] = (('time',), ts_arr[name], dim_attrs[name])
@@ -416,11 +705,154 @@ def read_silixa_files_routine_v6(
     return data_vars, coords, attrs
 
 
+def read_silixa_data_singlefile_v6(
+        file_handle,
+        timeseries_loc,
+        chFW,
+        chBW,
+        xml_version,
+        ts_dtype,
+        ix=slice(None)):
+    """
+    Internal routine that reads the Stokes data and the timeseries of a
+    single Silixa v6 or v7 file in a single pass.
+    Use dtscalibration.read_silixa_files function instead.
+
+    The file is scanned once with `ElementTree.iterparse` and every
+    `logData/data` element is cleared after its text is read, so the full
+    document tree is never held in memory.
+
+    Parameters
+    ----------
+    file_handle : str or tuple
+        Path to the file, or a tuple with the file name and the zip handle
+    timeseries_loc : list of tuple
+        List with (key, loc) pairs of the timeseries, where loc is the
+        location of the value in the xml hierarchy
+    chFW : int
+        Zero-based index of the forward channel
+    chBW : int
+        Zero-based index of the backward channel. Negative if single ended
+    xml_version : int
+    ts_dtype : np.dtype
+        Structured dtype of the returned timeseries
+    ix : slice, optional
+        Rows of the `logData` block that are parsed. Others are skipped.
+
+    Returns
+    -------
+    data : np.ndarray
+        Array of shape (nx, nitem) with the selected rows of the `logData`
+        block
+    ts : np.ndarray
+        Zero-dimensional array with dtype `ts_dtype`
+    """
+    from xml.etree import ElementTree
+
+    # The per-channel acquisition times are located in the n-th
+    # ChannelConfiguration element
+    channel_loc = (
+        'log', 'customData', 'UserConfiguration', 'ChannelConfiguration')
+    ts_simple = {}
+    ts_channel = {}
+    for k, loc in timeseries_loc:
+        if 'userAcquisitionTimeFW' in loc:
+            ts_channel[(chFW,) + tuple(loc[4:6])] = k
+        elif 'userAcquisitionTimeBW' in loc:
+            ts_channel[(chBW,) + tuple(loc[4:6])] = k
+        else:
+            ts_simple[tuple(loc)] = k
+
+    logdata_path = ('log', 'logData')
+    logdata = None
+    ts_val = {}
+    rows = []
+    i_row = 0
+    i_start, i_stop, _ = ix.indices(np.iinfo(np.int64).max)
+    path = []
+    i_channel = -1
+
+    with open_file(file_handle, mode='r') as f_h:
+        for event, elem in ElementTree.iterparse(
+                f_h, events=('start', 'end')):
+            if logdata is not None and elem is not logdata:
+                # The data rows make up most of the file, so the children
+                # of logData skip the path tracking
+                if event == 'end' and elem.tag == data_tag:
+                    if i_start <= i_row < i_stop:
+                        # remove the breaks on both sides of the string
+                        rows.append(elem.text.strip())
+
+                    i_row += 1
+
+                    # release the data elements that are already read
+                    logdata.clear()
+                continue
+
+            if event == 'start':
+                # strip the namespace
+                path.append(elem.tag.rpartition('}')[2])
+                loc = tuple(path[1:])
+
+                if loc == channel_loc:
+                    i_channel += 1
+                elif loc == logdata_path:
+                    logdata = elem
+                    # with the namespace
+                    data_tag = elem.tag[:-len('logData')] + 'data'
+                continue
+
+            loc = tuple(path[1:])
+
+            if loc == logdata_path:
+                logdata = None
+
+            elif loc in ts_simple:
+                ts_val[ts_simple[loc]] = elem.text
+
+            elif loc[:4] == channel_loc and \
+                    (i_channel,) + loc[4:] in ts_channel:
+                ts_val[ts_channel[(i_channel,) + loc[4:]]] = elem.text
+
+            elif loc == ('log', 'startDateTimeIndex'):
+                startDateTimeIndex = elem.text
+
+            elif loc == ('log', 'endDateTimeIndex'):
+                endDateTimeIndex = elem.text
+
+            path.pop()
+
+    # Parse all data rows at once
+    data = parse_data_rows(rows, delimiter=',')
+
+    if isinstance(file_handle, tuple):
+        file_name = os.path.split(file_handle[0])[-1]
+    else:
+        file_name = os.path.split(file_handle)[-1]
+
+    if xml_version == 6:
+        tstamp = np.int64(file_name[10:27])
+    elif xml_version == 7:
+        tstamp = np.int64(file_name[15:27])
+    else:
+        raise ValueError('Unknown version number: {}'.format(xml_version))
+
+    out = [ts_val[k] for k, _ in timeseries_loc]
+    out += [tstamp, startDateTimeIndex, endDateTimeIndex]
+    ts = np.array(tuple(out), dtype=ts_dtype)
+
+    return data, ts
+
+
 def read_silixa_files_routine_v4(
         filepathlist,
         timezone_netcdf='UTC',
         silent=False,
-        load_in_memory='auto'):
+        load_in_memory='auto',
+        executor=None,
+        cache_dir=None,
+        x_range=None,
+        dtype=None):
     """
     Internal routine that reads Silixa files.
     Use dtscalibration.read_silixa_files function instead.
@@ -433,6 +865,15 @@ def read_silixa_files_routine_v4(
     filepathlist
     timezone_netcdf
     silent
+    executor : concurrent.futures.Executor, optional
+        Used to parse the files in parallel. The data is then always read
+        in memory.
+    cache_dir : str, optional
+        Directory in which the parsed files are cached
+    x_range : tuple, optional
+        (x_min, x_max) of the locations that are read
+    dtype : np.dtype, optional
+        Data type of the Stokes and anti-Stokes data
 
     Returns
     -------
@@ -451,6 +892,13 @@ def read_silixa_files_routine_v4(
     # Amount of datapoints is the size of the logdata tree
     nx = len(logdata_tree)
 
+    # Select the locations within x_range using the first file. Only these
+    # rows are parsed.
+    ix = slice(*x_range_slice(
+        [float(el.text.split(',', 1)[0]) for el in logdata_tree],
+        x_range).indices(nx))
+    nx_sel = ix.stop - ix.start
+
     sep = ':'
     ns = {'s': namespace[1:-1]}
 
@@ -537,53 +985,48 @@ def read_silixa_files_routine_v4(
     # Gather data
     arr_path = 's:' + '/s:'.join(['wellLog', 'logData', 'data'])
 
-    @dask.delayed
-    def grab_data_per_file(file_handle):
-        """
-
-        Parameters
-        ----------
-        file_handle
-
-        Returns
-        -------
-
-        """
-        with open_file(file_handle, mode='r') as f_h:
-            eltree = ElementTree.parse(f_h)
-            arr_el = eltree.findall(arr_path, namespaces=ns)
-
-            # remove the breaks on both sides of the string
-            # split the string on the comma
-            arr_str = [arr_eli.text.split(',') for arr_eli in arr_el]
-        return np.array(arr_str, dtype=float)
-
-    data_lst_dly = [grab_data_per_file(fp) for fp in filepathlist]
-    data_lst = [
-        da.from_delayed(x, shape=(nx, nitem), dtype=np.float)
-        for x in data_lst_dly]
-    data_arr = da.stack(data_lst).T  # .compute()
-
-    # Check whether to compute data_arr (if possible 25% faster)
-    data_arr_cnk = data_arr.rechunk({0: -1, 1: -1, 2: 'auto'})
-    if load_in_memory == 'auto' and data_arr_cnk.npartitions <= 5:
-        if not silent:
-            print('Reading the data from disk')
-        data_arr = data_arr_cnk.compute()
-    elif load_in_memory:
+    if executor is not None:
         if not silent:
             print('Reading the data from disk')
-        data_arr = data_arr_cnk.compute()
+        data_arr = np.stack(
+            read_files_with_cache(
+                executor, cache_dir, read_silixa_data_singlefile_v4,
+                filepathlist, arr_path, ns, ix)).T
+
     else:
-        if not silent:
-            print('Not reading the data from disk')
-        data_arr = data_arr_cnk
+        data_lst_dly = [
+            dask.delayed(read_with_cache)(
+                cache_dir, read_silixa_data_singlefile_v4,
+                fp, arr_path, ns, ix)
+            for fp in filepathlist]
+        data_lst = [
+            da.from_delayed(x, shape=(nx_sel, nitem), dtype=float)
+            for x in data_lst_dly]
+        data_arr = da.stack(data_lst).T  # .compute()
+
+        # Check whether to compute data_arr (if possible 25% faster)
+        data_arr_cnk = data_arr.rechunk({0: -1, 1: -1, 2: 'auto'})
+        if load_in_memory == 'auto' and data_arr_cnk.npartitions <= 5:
+            if not silent:
+                print('Reading the data from disk')
+            data_arr = data_arr_cnk.compute()
+        elif load_in_memory:
+            if not silent:
+                print('Reading the data from disk')
+            data_arr = data_arr_cnk.compute()
+        else:
+            if not silent:
+                print('Not reading the data from disk')
+            data_arr = data_arr_cnk
 
     data_vars = {}
     for name, data_arri in zip(data_item_names, data_arr):
         if name == 'LAF':
             continue
 
+        if dtype is not None and name in stokes_labels:
+            data_arri = data_arri.astype(dtype)
+
         if name in dim_attrs:
             data_vars[name] = (['x', 'time'], data_arri, dim_attrs[name])
 
@@ -599,65 +1042,24 @@ def read_silixa_files_routine_v4(
         ('maxDateTimeIndex', '<U29')]
     ts_dtype = np.dtype(_ts_dtype + _time_dtype)
 
-    @dask.delayed
-    def grab_timeseries_per_file(file_handle):
-        """
-
-        Parameters
-        ----------
-        file_handle
-
-        Returns
-        -------
-
-        """
-        with open_file(file_handle, mode='r') as f_h:
-            eltree = ElementTree.parse(f_h)
-
-            out = []
-            for k, v in timeseries.items():
-                # Get all the timeseries data
-                if 'userAcquisitionTimeFW' in v['loc']:
-                    # requires two namespace searches
-                    path1 = 's:' + '/s:'.join(v['loc'][:4])
-                    val1 = eltree.findall(path1, namespaces=ns)
-                    path2 = 's:' + '/s:'.join(v['loc'][4:6])
-                    val2 = val1[chFW].find(path2, namespaces=ns)
-                    out.append(val2.text)
-
-                elif 'userAcquisitionTimeBW' in v['loc']:
-                    # requires two namespace searches
-                    path1 = 's:' + '/s:'.join(v['loc'][:4])
-                    val1 = eltree.findall(path1, namespaces=ns)
-                    path2 = 's:' + '/s:'.join(v['loc'][4:6])
-                    val2 = val1[chBW].find(path2, namespaces=ns)
-                    out.append(val2.text)
-
-                else:
-                    path = 's:' + '/s:'.join(v['loc'])
-                    val = eltree.find(path, namespaces=ns)
-                    out.append(val.text)
-
-            # get all the time related data
-            startDateTimeIndex = eltree.find(
-                's:wellLog/s:minDateTimeIndex', namespaces=ns).text
-            endDateTimeIndex = eltree.find(
-                's:wellLog/s:maxDateTimeIndex', namespaces=ns).text
-
-            if isinstance(file_handle, tuple):
-                file_name = os.path.split(file_handle[0])[-1]
-            else:
-                file_name = os.path.split(file_handle)[-1]
+    timeseries_loc = [(k, v['loc']) for k, v in timeseries.items()]
 
-            tstamp = np.int64(file_name[10:-4])
+    if executor is not None:
+        ts_arr = np.stack(
+            read_files_with_cache(
+                executor, cache_dir, read_silixa_timeseries_singlefile_v4,
+                filepathlist, timeseries_loc, ns, chFW, chBW, ts_dtype))
 
-            out += [tstamp, startDateTimeIndex, endDateTimeIndex]
-        return np.array(tuple(out), dtype=ts_dtype)
-
-    ts_lst_dly = [grab_timeseries_per_file(fp) for fp in filepathlist]
-    ts_lst = [
-        da.from_delayed(x, shape=tuple(), dtype=ts_dtype) for x in ts_lst_dly]
-    ts_arr = da.stack(ts_lst).compute()
+    else:
+        ts_lst_dly = [
+            dask.delayed(read_with_cache)(
+                cache_dir, read_silixa_timeseries_singlefile_v4,
+                fp, timeseries_loc, ns, chFW, chBW, ts_dtype)
+            for fp in filepathlist]
+        ts_lst = [
+            da.from_delayed(x, shape=tuple(), dtype=ts_dtype)
+            for x in ts_lst_dly]
+        ts_arr = da.stack(ts_lst).compute()
 
     for name in timeseries:
         if name in dim_attrs:
@@ -695,13 +1097,128 @@ def read_silixa_files_routine_v4(
     return data_vars, coords, attrs
 
 
+def read_silixa_data_singlefile_v4(
+        file_handle, arr_path, ns, ix=slice(None)):
+    """
+    Internal routine that reads the Stokes data of a single Silixa v4 file.
+    Use dtscalibration.read_silixa_files function instead.
+
+    Parameters
+    ----------
+    file_handle : str or tuple
+        Path to the file, or a tuple with the file name and the zip handle
+    arr_path : str
+        Path to the data elements in the xml hierarchy
+    ns : dict
+        Namespace mapping used with `arr_path`
+    ix : slice, optional
+        Rows that are parsed. Others are skipped.
+
+    Returns
+    -------
+    data : np.ndarray
+        Array of shape (nx, nitem) with the selected rows
+    """
+    from xml.etree import ElementTree
+
+    with open_file(file_handle, mode='r') as f_h:
+        eltree = ElementTree.parse(f_h)
+        arr_el = eltree.findall(arr_path, namespaces=ns)[ix]
+
+        # remove the breaks on both sides of the string
+        # split the string on the comma
+        arr_str = [arr_eli.text.split(',') for arr_eli in arr_el]
+    return np.array(arr_str, dtype=float)
+
+
+def read_silixa_timeseries_singlefile_v4(
+        file_handle,
+        timeseries_loc,
+        ns,
+        chFW,
+        chBW,
+        ts_dtype):
+    """
+    Internal routine that reads the timeseries of a single Silixa v4 file.
+    Use dtscalibration.read_silixa_files function instead.
+
+    Parameters
+    ----------
+    file_handle : str or tuple
+        Path to the file, or a tuple with the file name and the zip handle
+    timeseries_loc : list of tuple
+        List with (key, loc) pairs of the timeseries, where loc is the
+        location of the value in the xml hierarchy
+    ns : dict
+        Namespace mapping
+    chFW : int
+        Zero-based index of the forward channel
+    chBW : int
+        Zero-based index of the backward channel. Negative if single ended
+    ts_dtype : np.dtype
+        Structured dtype of the returned timeseries
+
+    Returns
+    -------
+    ts : np.ndarray
+        Zero-dimensional array with dtype `ts_dtype`
+    """
+    from xml.etree import ElementTree
+
+    with open_file(file_handle, mode='r') as f_h:
+        eltree = ElementTree.parse(f_h)
+
+        out = []
+        for k, loc in timeseries_loc:
+            # Get all the timeseries data
+            if 'userAcquisitionTimeFW' in loc:
+                # requires two namespace searches
+                path1 = 's:' + '/s:'.join(loc[:4])
+                val1 = eltree.findall(path1, namespaces=ns)
+                path2 = 's:' + '/s:'.join(loc[4:6])
+                val2 = val1[chFW].find(path2, namespaces=ns)
+                out.append(val2.text)
+
+            elif 'userAcquisitionTimeBW' in loc:
+                # requires two namespace searches
+                path1 = 's:' + '/s:'.join(loc[:4])
+                val1 = eltree.findall(path1, namespaces=ns)
+                path2 = 's:' + '/s:'.join(loc[4:6])
+                val2 = val1[chBW].find(path2, namespaces=ns)
+                out.append(val2.text)
+
+            else:
+                path = 's:' + '/s:'.join(loc)
+                val = eltree.find(path, namespaces=ns)
+                out.append(val.text)
+
+        # get all the time related data
+        startDateTimeIndex = eltree.find(
+            's:wellLog/s:minDateTimeIndex', namespaces=ns).text
+        endDateTimeIndex = eltree.find(
+            's:wellLog/s:maxDateTimeIndex', namespaces=ns).text
+
+        if isinstance(file_handle, tuple):
+            file_name = os.path.split(file_handle[0])[-1]
+        else:
+            file_name = os.path.split(file_handle)[-1]
+
+        tstamp = np.int64(file_name[10:-4])
+
+        out += [tstamp, startDateTimeIndex, endDateTimeIndex]
+    return np.array(tuple(out), dtype=ts_dtype)
+
+
 def read_sensornet_files_routine_v3(
         filepathlist,
         timezone_netcdf='UTC',
         timezone_input_files='UTC',
         silent=False,
         manual_fiber_start=None,
-        manual_fiber_end=None):
+        manual_fiber_end=None,
+        executor=None,
+        x_range=None,
+        dtype=None):
     """
     Internal routine that reads Sensor files.
     Use dtscalibration.read_sensornet_files function instead.
@@ -717,11 +1234,18 @@ def read_sensornet_files_routine_v3(
     manual_fiber_end : float
         If defined, overwrites the fiber end, read from the first file. It is
         the fiber length between the two connector entering the DTS device.
+    executor : concurrent.futures.Executor, optional
+        Used to parse the files in parallel
+    x_range : tuple, optional
+        (x_min, x_max) of the locations that are read
+    dtype : np.dtype, optional
+        Data type of the Stokes and anti-Stokes data
 
     Returns
     -------
 
     """
+    from functools import partial
 
     # Obtain metadata from the first file
     data, meta = read_sensornet_single(filepathlist[0])
@@ -775,6 +1299,49 @@ def read_sensornet_files_routine_v3(
     # x has already been read. should not change over time
     x = data['x']
 
+    # The rows of the forward and the reversed backward channel
+    if double_ended_flag:
+        # Get fiber length, and starting point for reverse channel reversal
+        if manual_fiber_start:
+            fiber_start = manual_fiber_start
+        else:
+            fiber_start = -50
+
+        if manual_fiber_end:
+            fiber_end = manual_fiber_end
+        else:
+            fiber_end = float(meta['fibre end'])
+
+        assert fiber_end > 0., 'Fiber end is not defined. Use key word ' \
+                               'argument in read function.'
+
+        fiber_start_index = (np.abs(x - fiber_start)).argmin()
+        fiber_end_index = (np.abs(x - fiber_end)).argmin()
+
+        ix_fw = np.arange(fiber_start_index, fiber_end_index)
+        ix_bw = np.arange(fiber_end_index, fiber_start_index, -1)
+
+    else:
+        ix_fw = np.arange(nx)
+
+    # Select the locations within x_range. Only the rows that are used by
+    # either channel are parsed.
+    ix = x_range_slice(x[ix_fw], x_range)
+    ix_fw = ix_fw[ix]
+    ix_rows = ix_fw
+
+    if double_ended_flag:
+        ix_bw = ix_bw[ix]
+        ix_rows = np.concatenate((ix_fw, ix_bw))
+
+    if ix_rows.size:
+        rows = slice(int(ix_rows.min()), int(ix_rows.max()) + 1)
+    else:
+        rows = slice(0, 0)
+
+    x = x[ix_fw]
+    nx_sel = x.size
+
     # Define all variables
     referenceTemperature = np.zeros(ntime)
     probe1temperature = np.zeros(ntime)
@@ -786,16 +1353,22 @@ def read_sensornet_files_routine_v3(
     acquisitiontimeBW = np.zeros(ntime)
 
     timestamp = [''] * ntime
-    ST = np.zeros((nx, ntime))
-    AST = np.zeros((nx, ntime))
-    TMP = np.zeros((nx, ntime))
+    if dtype is None:
+        dtype = float
+
+    ST = np.zeros((nx_sel, ntime), dtype=dtype)
+    AST = np.zeros((nx_sel, ntime), dtype=dtype)
+    TMP = np.zeros((nx_sel, ntime))
 
     if double_ended_flag:
-        REV_ST = np.zeros((nx, ntime))
-        REV_AST = np.zeros((nx, ntime))
+        REV_ST = np.zeros((nx_sel, ntime), dtype=dtype)
+        REV_AST = np.zeros((nx_sel, ntime), dtype=dtype)
 
-    for ii in range(ntime):
-        data, meta = read_sensornet_single(filepathlist[ii])
+    mapper = executor.map if executor is not None else map
+    read_single = partial(read_sensornet_single, rows=rows)
+
+    for ii, (data, meta) in enumerate(
+            mapper(read_single, filepathlist)):
 
         timestamp[ii] = pd.DatetimeIndex([
             meta['date'] + ' ' + meta['time']])[0]
@@ -808,38 +1381,13 @@ def read_sensornet_files_routine_v3(
         acquisitiontimeFW[ii] = float(meta['forward acquisition time'])
         acquisitiontimeBW[ii] = float(meta['reverse acquisition time'])
 
-        ST[:, ii] = data['ST']
-        AST[:, ii] = data['AST']
-        TMP[:, ii] = data['TMP']
+        ST[:, ii] = data['ST'][ix_fw - rows.start]
+        AST[:, ii] = data['AST'][ix_fw - rows.start]
+        TMP[:, ii] = data['TMP'][ix_fw - rows.start]
 
         if double_ended_flag:
-            REV_ST[:, ii] = data['REV-ST']
-            REV_AST[:, ii] = data['REV-AST']
-
-    if double_ended_flag:
-        # Get fiber length, and starting point for reverse channel reversal
-        if manual_fiber_start:
-            fiber_start = manual_fiber_start
-        else:
-            fiber_start = -50
-
-        if manual_fiber_end:
-            fiber_end = manual_fiber_end
-        else:
-            fiber_end = float(meta['fibre end'])
-
-        assert fiber_end > 0., 'Fiber end is not defined. Use key word ' \
-                               'argument in read function.'
-
-        fiber_start_index = (np.abs(x - fiber_start)).argmin()
-        fiber_end_index = (np.abs(x - fiber_end)).argmin()
-
-        x = x[fiber_start_index:fiber_end_index]
-        TMP = TMP[fiber_start_index:fiber_end_index]
-        ST = ST[fiber_start_index:fiber_end_index]
-        AST = AST[fiber_start_index:fiber_end_index]
-        REV_ST = REV_ST[fiber_end_index:fiber_start_index:-1]
-        REV_AST = REV_AST[fiber_end_index:fiber_start_index:-1]
+            REV_ST[:, ii] = data['REV-ST'][ix_bw - rows.start]
+            REV_AST[:, ii] = data['REV-AST'][ix_bw - rows.start]
 
     data_vars = {
         'ST': (['x', 'time'], ST, dim_attrs['ST']),
@@ -925,6 +1473,42 @@ def read_sensornet_files_routine_v3(
     return data_vars, coords, attrs
 
 
+def xml_strip_logdata(xml):
+    """
+    Removes all but the first data element from the logData block of an
+    xml string. The logData block contains the measurements and can be
+    orders of magnitude larger than the metadata. The metadata that is
+    located after the logData block is kept.
+
+    Parameters
+    ----------
+    xml : str
+        Content of the xml file
+
+    Returns
+    -------
+    xml : str
+        Content of the xml file with a single data element in logData
+    """
+    import re
+
+    i_log = xml.find('<logData')
+    if i_log < 0:
+        return xml
+
+    i_log_end = xml.find('</logData>', i_log)
+    match = re.compile(r'<data[\s>]').search(xml, i_log, i_log_end)
+    if match is None:
+        return xml
+
+    i_keep = xml.find('</data>', match.start(), i_log_end) + len('</data>')
+    i_cut = xml.rfind('</data>', i_keep, i_log_end)
+    if i_cut < 0:
+        return xml
+
+    return xml[:i_keep] + xml[i_cut + len('</data>'):]
+
+
 def read_silixa_attrs_singlefile(filename, sep):
     """
 
@@ -988,7 +1572,7 @@ def read_silixa_attrs_singlefile(filename, sep):
         return meta
 
     with open_file(filename) as fh:
-        doc_ = xmltodict.parse(fh.read())
+        doc_ = xmltodict.parse(xml_strip_logdata(fh.read()))
 
     if u'wellLogs' in doc_.keys():
         doc = doc_[u'wellLogs'][u'wellLog']
@@ -1002,7 +1586,11 @@ def read_sensortran_files_routine(
         filepathlist_dts,
         filepathlist_temp,
         timezone_netcdf='UTC',
-        silent=False):
+        silent=False,
+        load_in_memory='auto',
+        executor=None,
+        x_range=None,
+        dtype=None):
     """
     Internal routine that reads sensortran files.
     Use dtscalibration.read_sensortran_files function instead.
@@ -1015,14 +1603,28 @@ def read_sensortran_files_routine(
     filepathlist_temp
     timezone_netcdf
     silent
+    load_in_memory : {'auto', True, False}
+        If False, only the headers are read and the traces are read lazily
+        with dask once they are used. Otherwise, the traces are read in
+        memory.
+    executor : concurrent.futures.Executor, optional
+        Used to parse the files in parallel
+    x_range : tuple, optional
+        (x_min, x_max) of the locations that are read
+    dtype : np.dtype, optional
+        Data type of the Stokes and anti-Stokes data
 
     Returns
     -------
 
     """
 
+    from functools import partial
+
+    import dask
+
     # Obtain metadata from the first file
-    data_dts, meta_dts = read_sensortran_single(filepathlist_dts[0])
+    data_dts, meta_dts = read_sensortran_header(filepathlist_dts[0])
     data_temp, meta_temp = read_sensortran_single(filepathlist_temp[0])
 
     attrs = meta_dts
@@ -1051,34 +1653,97 @@ def read_sensortran_files_routine(
     # x has already been read. should not change over time
     x = data_temp['x']
 
+    ix = x_range_slice(x, x_range)
+    x = x[ix]
+
     # Define all variables
     referenceTemperature = np.zeros(ntime)
     acquisitiontimeFW = np.ones(ntime)
 
     timestamp = [''] * ntime
-    ST = np.zeros((nx, ntime), dtype=np.int32)
-    AST = np.zeros((nx, ntime), dtype=np.int32)
-    TMP = np.zeros((nx, ntime))
 
-    ST_zero = np.zeros((ntime))
-    AST_zero = np.zeros((ntime))
+    if dtype is None:
+        # The native data type of the Stokes data
+        dtype = np.int32
+
+    mapper = executor.map if executor is not None else map
 
-    for ii in range(ntime):
-        data_dts, meta_dts = read_sensortran_single(filepathlist_dts[ii])
-        data_temp, meta_temp = read_sensortran_single(filepathlist_temp[ii])
+    if load_in_memory:
+        ST = np.zeros((x.size, ntime), dtype=dtype)
+        AST = np.zeros((x.size, ntime), dtype=dtype)
+        TMP = np.zeros((x.size, ntime))
 
-        timestamp[ii] = data_dts['time']
+        ST_zero = np.zeros((ntime))
+        AST_zero = np.zeros((ntime))
 
-        referenceTemperature[ii] = data_temp['reference_temperature']-273.15
+        # Only the pages of the selected locations are read from disk
+        read_single = partial(read_sensortran_single, mmap=True)
 
-        ST[:, ii] = data_dts['ST'][:nx]
-        AST[:, ii] = data_dts['AST'][:nx]
-        # The TMP can vary by 1 or 2 datapoints, dynamically assign the values
-        TMP[:meta_temp['num_points'], ii] = data_temp['TMP'][:nx]
+        for ii, ((data_dts, meta_dts), (data_temp, meta_temp)) in enumerate(
+                zip(mapper(read_single, filepathlist_dts),
+                    mapper(read_single, filepathlist_temp))):
 
-        zero_index = (meta_dts['num_points']-nx) // 2
-        ST_zero[ii] = np.mean(data_dts['ST'][nx+zero_index:])
-        AST_zero[ii] = np.mean(data_dts['AST'][nx+zero_index:])
+            timestamp[ii] = data_dts['time']
+
+            referenceTemperature[ii] = \
+                data_temp['reference_temperature'] - 273.15
+
+            ST[:, ii] = data_dts['ST'][:nx][ix]
+            AST[:, ii] = data_dts['AST'][:nx][ix]
+            # The TMP can vary by 1 or 2 datapoints, dynamically assign the
+            # values
+            tmp = data_temp['TMP'][:nx][ix]
+            TMP[:tmp.size, ii] = tmp
+
+            zero_index = (meta_dts['num_points']-nx) // 2
+            ST_zero[ii] = np.mean(data_dts['ST'][nx+zero_index:])
+            AST_zero[ii] = np.mean(data_dts['AST'][nx+zero_index:])
+
+    else:
+        # Only the headers are read. The traces are read once used
+        ST, AST, TMP, ST_zero, AST_zero = [], [], [], [], []
+
+        for ii, (fp_dts, fp_temp, (data_dts, meta_dts),
+                 (data_temp, meta_temp)) in enumerate(zip(
+                    filepathlist_dts,
+                    filepathlist_temp,
+                    mapper(read_sensortran_header, filepathlist_dts),
+                    mapper(read_sensortran_header, filepathlist_temp))):
+
+            timestamp[ii] = data_dts['time']
+
+            referenceTemperature[ii] = \
+                data_temp['reference_temperature'] - 273.15
+
+            # Memory-mapped, so that only the selected locations are read
+            dly_dts = dask.delayed(read_sensortran_single)(
+                fp_dts, mmap=True)[0]
+            dly_temp = dask.delayed(read_sensortran_single)(
+                fp_temp, mmap=True)[0]
+
+            st, ast = [
+                da.from_delayed(
+                    dly_dts[k], shape=(meta_dts['num_points'],),
+                    dtype=np.int32)
+                for k in ['ST', 'AST']]
+            tmp = da.from_delayed(
+                dly_temp['TMP'], shape=(meta_temp['num_points'],),
+                dtype=np.float32)[:nx].astype(float)
+
+            # The TMP can vary by 1 or 2 datapoints, pad with zeros
+            if tmp.size < nx:
+                tmp = da.concatenate([tmp, da.zeros(nx - tmp.size)])
+
+            zero_index = (meta_dts['num_points']-nx) // 2
+
+            ST.append(st[:nx][ix].astype(dtype))
+            AST.append(ast[:nx][ix].astype(dtype))
+            TMP.append(tmp[ix])
+            ST_zero.append(st[nx+zero_index:].mean())
+            AST_zero.append(ast[nx+zero_index:].mean())
+
+        ST, AST, TMP = [da.stack(v, axis=1) for v in (ST, AST, TMP)]
+        ST_zero, AST_zero = [da.stack(v) for v in (ST_zero, AST_zero)]
 
     data_vars = {
         'ST': (['x', 'time'], ST, dim_attrs['ST']),
@@ -1133,69 +1798,82 @@ def read_sensortran_files_routine(
     return data_vars, coords, attrs
 
 
-def read_sensortran_single(fname):
+def read_sensortran_header(fname):
     """
-    Internal routine that reads a single sensortran file.
+    Internal routine that reads the header of a single sensortran file.
     Use dtscalibration.read_sensortran_files function instead.
 
     Parameters
     ----------
-    fname
+    fname : str
+        Path to the file
 
     Returns
     -------
     data, metadata
+        The data only contains the reference temperature and time
     """
-    import struct
     from datetime import datetime
-    import numpy as np
 
-    meta = {}
-    data = {}
-    with open(fname, 'rb') as f:
-        meta['survey_type'] = struct.unpack('<h', f.read(2))[0]
-        meta['hdr_version'] = struct.unpack('<h', f.read(2))[0]
-        meta['x_units'] = struct.unpack('<i', f.read(4))[0]
-        meta['y_units'] = struct.unpack('<i', f.read(4))[0]
-        meta['num_points'] = struct.unpack('<i', f.read(4))[0]
-        meta['num_pulses'] = struct.unpack('<i', f.read(4))[0]
-        meta['channel_id'] = struct.unpack('<i', f.read(4))[0]
-        meta['num_subtraces'] = struct.unpack('<i', f.read(4))[0]
-        meta['num_skipped'] = struct.unpack('<i', f.read(4))[0]
-
-        data['reference_temperature'] = struct.unpack('<f', f.read(4))[0]
-        data['time'] = datetime.fromtimestamp(
-                        struct.unpack('<i', f.read(4))[0])
-
-        meta['probe_name'] = f.read(128).decode('utf-16').split('\x00')[0]
-
-        meta['hdr_size'] = struct.unpack('<i', f.read(4))[0]
-        meta['hw_config'] = struct.unpack('<i', f.read(4))[0]
-
-        data_1 = f.read(meta['num_points']*4)
-        data_2 = f.read(meta['num_points']*4)
-
-        if meta['survey_type'] == 0:
-            distance = np.frombuffer(data_1,
-                                     dtype=np.float32)
-            temperature = np.frombuffer(data_2,
-                                        dtype=np.float32)
-            data['x'] = distance
-            data['TMP'] = temperature
-
-        if meta['survey_type'] == 2:
-            ST = np.frombuffer(data_1,
-                               dtype=np.int32)
-            AST = np.frombuffer(data_2,
-                                dtype=np.int32)
-            data['ST'] = ST
-            data['AST'] = AST
+    hdr = np.fromfile(fname, dtype=sensortran_header_dtype, count=1)[0]
+
+    meta = {
+        k: int(hdr[k]) for k in sensortran_header_dtype.names
+        if k not in ('reference_temperature', 'time', 'probe_name')}
+    meta['probe_name'] = hdr['probe_name'].tobytes().decode(
+        'utf-16').split('\x00')[0]
 
     x_units_map = {0: 'm', 1: 'ft', 2: 'n/a'}
     meta['x_units'] = x_units_map[meta['x_units']]
     y_units_map = {0: 'K', 1: 'degC', 2: 'degF', 3: 'counts'}
     meta['y_units'] = y_units_map[meta['y_units']]
 
+    data = {
+        'reference_temperature': float(hdr['reference_temperature']),
+        'time': datetime.fromtimestamp(int(hdr['time']))}
+
+    return data, meta
+
+
+def read_sensortran_single(fname, mmap=False):
+    """
+    Internal routine that reads a single sensortran file.
+    Use dtscalibration.read_sensortran_files function instead.
+
+    Parameters
+    ----------
+    fname : str
+        Path to the file
+    mmap : bool
+        If True, the traces are memory-mapped views of the file instead of
+        arrays in memory
+
+    Returns
+    -------
+    data, metadata
+    """
+    data, meta = read_sensortran_header(fname)
+
+    if meta['survey_type'] == 0:
+        names, dtype = ('x', 'TMP'), np.float32
+    elif meta['survey_type'] == 2:
+        names, dtype = ('ST', 'AST'), np.int32
+    else:
+        return data, meta
+
+    shape = (2, meta['num_points'])
+    offset = sensortran_header_dtype.itemsize
+
+    if mmap:
+        traces = np.memmap(
+            fname, dtype=dtype, mode='r', offset=offset, shape=shape)
+    else:
+        traces = np.fromfile(
+            fname, dtype=dtype, count=shape[0] * shape[1],
+            offset=offset).reshape(shape)
+
+    data.update(zip(names, traces))
+
     return data, meta
 
 
@@ -1203,7 +1881,11 @@ def read_apsensing_files_routine(
         filepathlist,
         timezone_netcdf='UTC',
         silent=False,
-        load_in_memory='auto'):
+        load_in_memory='auto',
+        executor=None,
+        cache_dir=None,
+        x_range=None,
+        dtype=None):
     """
     Internal routine that reads AP Sensing files.
     Use dtscalibration.read_apsensing_files function instead.
@@ -1216,6 +1898,15 @@ def read_apsensing_files_routine(
     timezone_netcdf
     silent
     load_in_memory
+    executor : concurrent.futures.Executor, optional
+        Used to parse the files in parallel. The data is then always read
+        in memory.
+    cache_dir : str, optional
+        Directory in which the parsed files are cached
+    x_range : tuple, optional
+        (x_min, x_max) of the locations that are read
+    dtype : np.dtype, optional
+        Data type of the Stokes and anti-Stokes data
 
     Returns
     -------
@@ -1235,6 +1926,13 @@ def read_apsensing_files_routine(
     # Amount of datapoints is the size of the logdata tree
     nx = len(logdata_tree)
 
+    # Select the locations within x_range using the first file. Only these
+    # rows are parsed.
+    ix = slice(*x_range_slice(
+        [float(el.text.split(',', 1)[0]) for el in logdata_tree],
+        x_range).indices(nx))
+    nx_sel = ix.stop - ix.start
+
     sep = ':'
     ns = {'s': namespace[1:-1]}
 
@@ -1276,57 +1974,49 @@ def read_apsensing_files_routine(
     arr_path = 's:' + '/s:'.join(['wellSet', 'well', 'wellboreSet', 'wellbore',
                                   'wellLogSet', 'wellLog', 'logData', 'data'])
 
-    @dask.delayed
-    def grab_data_per_file(file_handle):
-        """
-
-        Parameters
-        ----------
-        file_handle
-
-        Returns
-        -------
-
-        """
-
-        with open_file(file_handle, mode='r') as f_h:
-            if skip_chars:
-                f_h.read(3)
-            eltree = ElementTree.parse(f_h)
-            arr_el = eltree.findall(arr_path, namespaces=ns)
-
-            # remove the breaks on both sides of the string
-            # split the string on the comma
-            arr_str = [arr_eli.text.split(',') for arr_eli in arr_el]
-        return np.array(arr_str, dtype=float)
-
-    data_lst_dly = [grab_data_per_file(fp) for fp in filepathlist]
-
-    data_lst = [
-        da.from_delayed(x, shape=(nx, nitem), dtype=np.float)
-        for x in data_lst_dly]
-    data_arr = da.stack(data_lst).T  # .compute()
-
-    # Check whether to compute data_arr (if possible 25% faster)
-    data_arr_cnk = data_arr.rechunk({0: -1, 1: -1, 2: 'auto'})
-    if load_in_memory == 'auto' and data_arr_cnk.npartitions <= 5:
+    if executor is not None:
         if not silent:
             print('Reading the data from disk')
-        data_arr = data_arr_cnk.compute()
-    elif load_in_memory:
-        if not silent:
-            print('Reading the data from disk')
-        data_arr = data_arr_cnk.compute()
+        data_arr = np.stack(
+            read_files_with_cache(
+                executor, cache_dir, read_apsensing_data_singlefile,
+                filepathlist, arr_path, ns, skip_chars, ix)).T
+
     else:
-        if not silent:
-            print('Not reading the data from disk')
-        data_arr = data_arr_cnk
+        data_lst_dly = [
+            dask.delayed(read_with_cache)(
+                cache_dir, read_apsensing_data_singlefile,
+                fp, arr_path, ns, skip_chars, ix)
+            for fp in filepathlist]
+
+        data_lst = [
+            da.from_delayed(x, shape=(nx_sel, nitem), dtype=float)
+            for x in data_lst_dly]
+        data_arr = da.stack(data_lst).T  # .compute()
+
+        # Check whether to compute data_arr (if possible 25% faster)
+        data_arr_cnk = data_arr.rechunk({0: -1, 1: -1, 2: 'auto'})
+        if load_in_memory == 'auto' and data_arr_cnk.npartitions <= 5:
+            if not silent:
+                print('Reading the data from disk')
+            data_arr = data_arr_cnk.compute()
+        elif load_in_memory:
+            if not silent:
+                print('Reading the data from disk')
+            data_arr = data_arr_cnk.compute()
+        else:
+            if not silent:
+                print('Not reading the data from disk')
+            data_arr = data_arr_cnk
 
     data_vars = {}
     for name, data_arri in zip(data_item_names, data_arr):
         if name == 'LAF':
             continue
 
+        if dtype is not None and name in stokes_labels:
+            data_arri = data_arri.astype(dtype)
+
         if name in dim_attrs_apsensing:
             data_vars[name] = (['x', 'time'],
                                data_arri,
@@ -1342,46 +2032,22 @@ def read_apsensing_files_routine(
      ('acquisitionTime', '<U29')]
     ts_dtype = np.dtype(_time_dtype)
 
-    @dask.delayed
-    def grab_timeseries_per_file(file_handle):
-        """
-
-        Parameters
-        ----------
-        file_handle
-
-        Returns
-        -------
-
-        """
-        with open_file(file_handle, mode='r') as f_h:
-            if skip_chars:
-                f_h.read(3)
-            eltree = ElementTree.parse(f_h)
-
-            out = []
-
-            # get all the time related data
-            creationDate = eltree.find(('{0}wellSet/{0}well/{0}wellboreSet' +
-                                        '/{0}wellbore/{0}wellLogSet' +
-                                        '/{0}wellLog/{0}creationDate'
-                                        ).format(namespace)
-                                       ).text
-
-            if isinstance(file_handle, tuple):
-                file_name = os.path.split(file_handle[0])[-1]
-            else:
-                file_name = os.path.split(file_handle)[-1]
-
-            tstamp = np.int64(file_name[-20:-4])
+    if executor is not None:
+        ts_arr = np.stack(
+            read_files_with_cache(
+                executor, cache_dir, read_apsensing_timeseries_singlefile,
+                filepathlist, namespace, skip_chars, ts_dtype))
 
-            out += [tstamp, creationDate]
-        return np.array(tuple(out), dtype=ts_dtype)
-
-    ts_lst_dly = [grab_timeseries_per_file(fp) for fp in filepathlist]
-    ts_lst = [
-        da.from_delayed(x, shape=tuple(), dtype=ts_dtype) for x in ts_lst_dly]
-    ts_arr = da.stack(ts_lst).compute()
+    else:
+        ts_lst_dly = [
+            dask.delayed(read_with_cache)(
+                cache_dir, read_apsensing_timeseries_singlefile,
+                fp, namespace, skip_chars, ts_dtype)
+            for fp in filepathlist]
+        ts_lst = [
+            da.from_delayed(x, shape=tuple(), dtype=ts_dtype)
+            for x in ts_lst_dly]
+        ts_arr = da.stack(ts_lst).compute()
 
     data_vars['creationDate'] = (
         ('time',),
@@ -1397,6 +2063,96 @@ def read_apsensing_files_routine(
     return data_vars, coords, attrs
 
 
+def read_apsensing_data_singlefile(
+        file_handle, arr_path, ns, skip_chars, ix=slice(None)):
+    """
+    Internal routine that reads the data of a single AP Sensing file.
+    Use dtscalibration.read_apsensing_files function instead.
+
+    Parameters
+    ----------
+    file_handle : str or tuple
+        Path to the file, or a tuple with the file name and the zip handle
+    arr_path : str
+        Path to the data elements in the xml hierarchy
+    ns : dict
+        Namespace mapping used with `arr_path`
+    skip_chars : bool
+        Skip the first three characters of the file
+    ix : slice, optional
+        Rows that are parsed. Others are skipped.
+
+    Returns
+    -------
+    data : np.ndarray
+        Array of shape (nx, nitem) with the selected rows
+    """
+    from xml.etree import ElementTree
+
+    with open_file(file_handle, mode='r') as f_h:
+        if skip_chars:
+            f_h.read(3)
+        eltree = ElementTree.parse(f_h)
+        arr_el = eltree.findall(arr_path, namespaces=ns)[ix]
+
+        # remove the breaks on both sides of the string
+        # split the string on the comma
+        arr_str = [arr_eli.text.split(',') for arr_eli in arr_el]
+    return np.array(arr_str, dtype=float)
+
+
+def read_apsensing_timeseries_singlefile(
+        file_handle,
+        namespace,
+        skip_chars,
+        ts_dtype):
+    """
+    Internal routine that reads the timeseries of a single AP Sensing file.
+    Use dtscalibration.read_apsensing_files function instead.
+
+    Parameters
+    ----------
+    file_handle : str or tuple
+        Path to the file, or a tuple with the file name and the zip handle
+    namespace : str
+        Xml namespace, including the curly braces
+    skip_chars : bool
+        Skip the first three characters of the file
+    ts_dtype : np.dtype
+        Structured dtype of the returned timeseries
+
+    Returns
+    -------
+    ts : np.ndarray
+        Zero-dimensional array with dtype `ts_dtype`
+    """
+    from xml.etree import ElementTree
+
+    with open_file(file_handle, mode='r') as f_h:
+        if skip_chars:
+            f_h.read(3)
+        eltree = ElementTree.parse(f_h)
+
+        out = []
+
+        # get all the time related data
+        creationDate = eltree.find(('{0}wellSet/{0}well/{0}wellboreSet' +
+                                    '/{0}wellbore/{0}wellLogSet' +
+                                    '/{0}wellLog/{0}creationDate'
+                                    ).format(namespace)
+                                   ).text
+
+        if isinstance(file_handle, tuple):
+            file_name = os.path.split(file_handle[0])[-1]
+        else:
+            file_name = os.path.split(file_handle)[-1]
+
+        tstamp = np.int64(file_name[-20:-4])
+
+        out += [tstamp, creationDate]
+    return np.array(tuple(out), dtype=ts_dtype)
+
+
 def read_apsensing_attrs_singlefile(filename, sep):
     """
 
@@ -1462,7 +2218,7 @@ def read_apsensing_attrs_singlefile(filename, sep):
         return meta
 
     with open_file(filename) as fh:
-        data = fh.read()
+        data = xml_strip_logdata(fh.read())
         try:
             doc_ = xmltodict.parse(data)
             skip_chars = False
@@ -1476,25 +2232,32 @@ def read_apsensing_attrs_singlefile(filename, sep):
     return metakey(dict(), doc, ''), skip_chars
 
 
-def read_sensornet_single(filename):
+def read_sensornet_single(filename, rows=None):
     """
+    Read a single Sensornet .ddf file. The header is parsed line by line and
+    the numeric block is parsed at once, see `parse_data_rows`.
 
     Parameters
     ----------
-    filename
+    filename : str
+        Path to the .ddf file
+    rows : slice, optional
+        Rows of the numeric block that are parsed. Others are skipped.
+        Defaults to all rows.
 
     Returns
     -------
-
+    data : dict
+        Contains the arrays 'x', 'TMP', 'ST', 'AST' and, for double-ended
+        measurements, 'REV-ST' and 'REV-AST'
+    meta : dict
+        Header of the file. Decimal commas are replaced by decimal points.
     """
     headerlength = 26
 
-    # The $\circ$ Celsius symbol is unreadable in utf8
-    with open_file(filename, encoding='windows-1252') as fileobject:
-        filelength = sum([1 for _ in fileobject])
-    datalength = filelength - headerlength
-
     meta = {}
+
+    # The $\circ$ Celsius symbol is unreadable in utf8
     with open_file(filename, encoding='windows-1252') as fileobject:
         for ii in range(0, headerlength - 1):
             fileline = fileobject.readline().split('\t')
@@ -1505,47 +2268,62 @@ def read_sensornet_single(filename):
         fileobject.readline().split('\t')
 
         if meta['differential loss correction'] == 'single-ended':
-            data = {
-                'x': np.zeros(datalength),
-                'TMP': np.zeros(datalength),
-                'ST': np.zeros(datalength),
-                'AST': np.zeros(datalength)}
-
-            for ii in range(0, datalength):
-                fileline = fileobject.readline().replace(',', '.').split('\t')
-
-                data['x'][ii] = float(fileline[0])
-                data['TMP'][ii] = float(fileline[1])
-                data['ST'][ii] = float(fileline[2])
-                data['AST'][ii] = float(fileline[3])
+            data_names = ['x', 'TMP', 'ST', 'AST']
 
         elif meta['differential loss correction'] == 'combined':
-            data = {
-                'x': np.zeros(datalength),
-                'TMP': np.zeros(datalength),
-                'ST': np.zeros(datalength),
-                'AST': np.zeros(datalength),
-                'REV-ST': np.zeros(datalength),
-                'REV-AST': np.zeros(datalength)}
-
-            for ii in range(0, datalength):
-                fileline = fileobject.readline().replace(',', '.').split('\t')
-
-                data['x'][ii] = float(fileline[0])
-                data['TMP'][ii] = float(fileline[1])
-                data['ST'][ii] = float(fileline[2])
-                data['AST'][ii] = float(fileline[3])
-                data['REV-ST'][ii] = float(fileline[4])
-                data['REV-AST'][ii] = float(fileline[5])
+            data_names = ['x', 'TMP', 'ST', 'AST', 'REV-ST', 'REV-AST']
 
         else:
             raise ValueError(
                 'unknown differential loss correction: "' +
                 meta['differential loss correction']+'"')
 
+        if rows is None:
+            data_str = fileobject.read()
+        else:
+            data_str = ''.join(
+                itertools.islice(fileobject, rows.start, rows.stop))
+
+    data_arr = parse_data_rows(
+        data_str.rstrip('\r\n').splitlines(),
+        delimiter='\t',
+        ncol=len(data_names),
+        decimal=',')
+
+    data = {
+        name: np.ascontiguousarray(data_arr[:, ii])
+        for ii, name in enumerate(data_names)}
+
     return data, meta
 
 
+def read_sensornet_timestamp(filename):
+    """
+    Read the timestamp from the header of a single Sensornet .ddf file,
+    without parsing the data.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the .ddf file
+
+    Returns
+    -------
+    timestamp : pd.Timestamp
+    """
+    meta = {}
+
+    with open_file(filename, encoding='windows-1252') as fileobject:
+        for fileline in fileobject:
+            key, value = fileline.split('\t')[:2]
+            meta[key] = value.strip()
+
+            if 'date' in meta and 'time' in meta:
+                break
+
+    return pd.Timestamp(meta['date'] + ' ' + meta['time'])
+
+
 def get_xml_namespace(element):
     """
 
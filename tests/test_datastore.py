@@ -317,6 +317,99 @@ def test_read_silixa_files_double_loadinmemory():
     pass
 
 
+def test_read_silixa_files_time_x_range():
+    filepath = data_dir_double_ended2
+    ds = read_silixa_files(directory=filepath, silent=True)
+
+    ds_sel = read_silixa_files(
+        directory=filepath,
+        silent=True,
+        time_range=('2018-03-28 01:40:55', '2018-03-28 01:41:07'),
+        x_range=(0., 100.))
+
+    assert list(ds_sel.filename.values) == list(ds.filename.values[1:4])
+
+    ds = ds.sel(x=slice(0., 100.)).isel(time=slice(1, 4))
+    np.testing.assert_array_equal(ds.x.values, ds_sel.x.values)
+    np.testing.assert_array_equal(ds.ST.values, ds_sel.ST.values)
+    np.testing.assert_array_equal(ds['REV-AST'].values,
+                                  ds_sel['REV-AST'].values)
+    pass
+
+
+def test_read_sensornet_files_x_range():
+    # The backward channel is stored in reverse
+    filepath = data_dir_sensornet_double_ended
+    ds = read_sensornet_files(directory=filepath, silent=True)
+    ds_sel = read_sensornet_files(
+        directory=filepath, silent=True, x_range=(100., 300.))
+
+    ds = ds.sel(x=slice(100., 300.))
+    np.testing.assert_array_equal(ds.x.values, ds_sel.x.values)
+
+    for k in ['ST', 'AST', 'TMP', 'REV-ST', 'REV-AST']:
+        np.testing.assert_array_equal(ds[k].values, ds_sel[k].values)
+    pass
+
+
+def test_read_files_workers():
+    from concurrent.futures import ProcessPoolExecutor
+
+    ds = read_silixa_files(
+        directory=data_dir_double_ended2, silent=True)
+    ds_w = read_silixa_files(
+        directory=data_dir_double_ended2, silent=True, workers=2)
+    assert ds.identical(ds_w)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        for filepath, read_files in [
+                (data_dir_single_silixa_v45, read_silixa_files),
+                (data_dir_ap_sensing, read_apsensing_files)]:
+            ds = read_files(directory=filepath, silent=True)
+            ds_w = read_files(
+                directory=filepath, silent=True, executor=executor)
+            assert ds.identical(ds_w)
+
+    ds = read_sensornet_files(
+        directory=data_dir_sensornet_single_ended, silent=True)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        ds_w = read_sensornet_files(
+            directory=data_dir_sensornet_single_ended,
+            silent=True,
+            executor=executor)
+    assert ds.identical(ds_w)
+    pass
+
+
+def test_read_files_cache():
+    from dtscalibration.io import evict_cache
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for filepath, ncache in [(data_dir_double_ended2, 6),
+                                 (data_dir_single_silixa_v45, 20),
+                                 (data_dir_ap_sensing, 26)]:
+            read_files = read_apsensing_files \
+                if filepath == data_dir_ap_sensing else read_silixa_files
+
+            ds = read_files(directory=filepath, silent=True)
+            ds_cold = read_files(
+                directory=filepath, silent=True, cache_dir=cache_dir)
+            assert len(os.listdir(cache_dir)) == ncache
+
+            # Read from cache
+            ds_warm = read_files(
+                directory=filepath, silent=True, cache_dir=cache_dir)
+            assert len(os.listdir(cache_dir)) == ncache
+
+            assert ds.identical(ds_cold)
+            assert ds.identical(ds_warm)
+
+        evict_cache(cache_dir, max_size=0)
+        assert len(os.listdir(cache_dir)) == 0
+    pass
+
+
 def test_read_single_silixa_v45():
     filepath = data_dir_single_silixa_v45
     ds = read_silixa_files(
@@ -354,6 +447,70 @@ def test_read_single_silixa_v7():
 
     pass
 
+def test_read_silixa_data_singlefile_v6():
+    from dtscalibration.io import read_silixa_attrs_singlefile
+    from dtscalibration.io import read_silixa_data_singlefile_v6
+
+    filepath = os.path.join(data_dir_double_ended2,
+                            'channel 1_20180328014052498.xml')
+    attrs = read_silixa_attrs_singlefile(filepath, ':')
+
+    timeseries_loc = [
+        ('referenceTemperature',
+         ('log', 'customData', 'referenceTemperature')),
+        ('userAcquisitionTimeFW',
+         ('log', 'customData', 'UserConfiguration', 'ChannelConfiguration',
+          'AcquisitionConfiguration', 'AcquisitionTime',
+          'userAcquisitionTimeFW')),
+        ('userAcquisitionTimeBW',
+         ('log', 'customData', 'UserConfiguration', 'ChannelConfiguration',
+          'AcquisitionConfiguration', 'AcquisitionTime',
+          'userAcquisitionTimeBW'))]
+    ts_dtype = np.dtype(
+        [(k, np.float32) for k, _ in timeseries_loc] +
+        [('filename_tstamp', np.int64), ('minDateTimeIndex', '<U29'),
+         ('maxDateTimeIndex', '<U29')])
+
+    data, ts = read_silixa_data_singlefile_v6(
+        filepath, timeseries_loc, 0, 1, 6, ts_dtype)
+
+    np.testing.assert_equal(data, read_data_from_fp_numpy(filepath))
+    np.testing.assert_almost_equal(
+        ts['referenceTemperature'],
+        float(attrs['customData:referenceTemperature:#text']), decimal=4)
+    np.testing.assert_equal(
+        ts['userAcquisitionTimeFW'],
+        float(attrs['customData:UserConfiguration:ChannelConfiguration_0:'
+                    'AcquisitionConfiguration:AcquisitionTime']))
+    np.testing.assert_equal(
+        ts['userAcquisitionTimeBW'],
+        float(attrs['customData:UserConfiguration:ChannelConfiguration_1:'
+                    'AcquisitionConfiguration:AcquisitionTime']))
+    assert ts['maxDateTimeIndex'] == attrs['endDateTimeIndex']
+    pass
+
+
+def test_xml_strip_logdata():
+    import xmltodict
+
+    from dtscalibration.io import xml_strip_logdata
+
+    filepath = os.path.join(
+        data_dir_single_silixa_v7, 'channel 2_UTC_20191010_145850.340.xml')
+
+    with open(filepath) as fh:
+        xml = fh.read()
+
+    xml_stripped = xml_strip_logdata(xml)
+    assert xml_stripped.count('</data>') == 1
+
+    doc = xmltodict.parse(xml)['logs']['log']
+    doc_stripped = xmltodict.parse(xml_stripped)['logs']['log']
+    assert doc_stripped['customData'] == doc['customData']
+    assert doc_stripped['logData']['data'] == doc['logData']['data'][0]
+    pass
+
+
 @pytest.mark.skip(reason="Randomly fails. Has to do with delayed reading"
                          "out of zips with dask.")
 def test_read_silixa_zipped():
@@ -406,6 +563,57 @@ def test_read_sensornet_files_double_ended():
     pass
 
 
+def test_read_sensornet_single():
+    from dtscalibration.io import read_sensornet_single
+
+    # Single-ended file with decimal commas
+    fp = os.path.join(
+        data_dir_sensornet_single_ended, 'channel 1 20180107 202119 00001.ddf')
+    data, meta = read_sensornet_single(fp)
+
+    assert list(data.keys()) == ['x', 'TMP', 'ST', 'AST']
+    assert meta['gamma'] == '498.7988'
+    np.testing.assert_array_equal(
+        [data[k][0] for k in data], [-747., -64.757, 0.675, -0.228])
+
+    # Combined file with decimal points
+    fp = os.path.join(
+        data_dir_sensornet_double_ended, 'channel 1 20030111 002 00001.ddf')
+    data, meta = read_sensornet_single(fp)
+
+    assert list(data.keys()) == [
+        'x', 'TMP', 'ST', 'AST', 'REV-ST', 'REV-AST']
+    assert data['x'].size == 978
+    np.testing.assert_array_equal(
+        [data[k][-1] for k in data],
+        [1397.535, 101.366, -0.353, -0.578, -0.426, -0.560])
+
+    # A row with a missing cell raises instead of shifting the columns
+    with open(fp, encoding='windows-1252') as fh:
+        lines = fh.readlines()
+
+    lines[-1] = '\t'.join(lines[-1].split('\t')[:-1]) + '\n'
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        fp_bad = os.path.join(tmpdirname, 'bad.ddf')
+
+        with open(fp_bad, 'w', encoding='windows-1252') as fh:
+            fh.writelines(lines)
+
+        with pytest.raises(ValueError):
+            read_sensornet_single(fp_bad)
+
+        # As does a cell that is not a number
+        lines[-1] = 'abc\t' + lines[-2].split('\t', 1)[1]
+
+        with open(fp_bad, 'w', encoding='windows-1252') as fh:
+            fh.writelines(lines)
+
+        with pytest.raises(ValueError, match='Unable to parse'):
+            read_sensornet_single(fp_bad)
+    pass
+
+
 def test_read_apsensing_files():
     filepath = data_dir_ap_sensing
     ds = read_apsensing_files(
@@ -461,6 +669,24 @@ def test_read_sensortran_files():
     pass
 
 
+def test_read_sensortran_files_loadinmemory():
+    filepath = data_dir_sensortran_binary
+    ds = read_sensortran_files(
+        directory=filepath,
+        timezone_netcdf='UTC',
+        load_in_memory=True)
+    ds_lazy = read_sensortran_files(
+        directory=filepath,
+        timezone_netcdf='UTC',
+        load_in_memory=False)
+
+    for k in ['ST', 'AST', 'TMP', 'ST_zero', 'AST_zero']:
+        assert isinstance(ds[k].data, np.ndarray)
+        assert isinstance(ds_lazy[k].data, da.Array)
+        np.testing.assert_array_equal(ds[k].values, ds_lazy[k].values)
+    pass
+
+
 def test_to_mf_netcdf_open_mf_datastore():
     filepath = data_dir_single_ended
     ds = read_silixa_files(directory=filepath, file_ext='*.xml')
@@ -494,6 +720,142 @@ def test_to_mf_netcdf_open_mf_datastore():
     pass
 
 
+def test_ingest_new_files():
+    import shutil
+
+    from dtscalibration import ingest_new_files
+
+    filepath = data_dir_double_ended2
+    ds = read_silixa_files(directory=filepath, silent=True)
+    fns = sorted(os.listdir(filepath))
+    fns = [fn for fn in fns if fn.endswith('.xml')]
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        raw_dir = os.path.join(tmpdirname, 'raw')
+        store_path = os.path.join(tmpdirname, 'store')
+        os.makedirs(raw_dir)
+
+        for ingest in [fns[:4], fns[4:], []]:
+            for fn in ingest:
+                shutil.copy(os.path.join(filepath, fn), raw_dir)
+
+            new_files = ingest_new_files(store_path, raw_dir, silent=True)
+            assert [os.path.basename(fp) for fp in new_files] == ingest
+
+        assert os.path.isfile(store_path + '.manifest.json')
+        assert len(os.listdir(store_path)) == 2
+
+        ds2 = open_mf_datastore(
+            path=os.path.join(store_path, '*.nc'), load_in_memory=True)
+        np.testing.assert_array_equal(ds.time.values, ds2.time.values)
+        # The default encoding stores the Stokes data as float32
+        np.testing.assert_allclose(ds.ST.values, ds2.ST.values, rtol=1e-6)
+        np.testing.assert_allclose(ds['REV-AST'].values,
+                                   ds2['REV-AST'].values, rtol=1e-6)
+        ds2.close()
+
+    pass
+
+
+def test_ingest_new_files_time_chunk():
+    pytest.importorskip('zarr')
+
+    from dtscalibration import ingest_new_files
+
+    filepath = data_dir_double_ended2
+    ds = read_silixa_files(directory=filepath, silent=True)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        store_path = os.path.join(tmpdirname, 'store')
+        zarr_path = os.path.join(tmpdirname, 'store.zarr')
+
+        new_files = ingest_new_files(
+            store_path, filepath, time_chunk=3, silent=True)
+        ingest_new_files(zarr_path, filepath, time_chunk=3, silent=True)
+        assert len(new_files) == ds.time.size
+        assert len(os.listdir(store_path)) == -(-ds.time.size // 3)
+
+        ds_nc = open_mf_datastore(
+            path=os.path.join(store_path, '*.nc'), load_in_memory=True)
+        ds_zarr = open_datastore(zarr_path, engine='zarr')
+
+        for ds2 in [ds_nc, ds_zarr]:
+            np.testing.assert_array_equal(ds.time.values, ds2.time.values)
+            np.testing.assert_allclose(ds.ST.values, ds2.ST.values, rtol=1e-6)
+            np.testing.assert_allclose(ds['REV-AST'].values,
+                                       ds2['REV-AST'].values, rtol=1e-6)
+            ds2.close()
+
+    pass
+
+
+def test_ingest_new_files_order():
+    import shutil
+
+    from dtscalibration import ingest_new_files
+
+    filepath = data_dir_double_ended2
+    fns = sorted(fn for fn in os.listdir(filepath) if fn.endswith('.xml'))
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        raw_dir = os.path.join(tmpdirname, 'raw')
+        store_path = os.path.join(tmpdirname, 'store')
+        os.makedirs(raw_dir)
+
+        for fn in fns[:2] + fns[3:5]:
+            shutil.copy(os.path.join(filepath, fn), raw_dir)
+
+        ingest_new_files(store_path, raw_dir, time_chunk=2, silent=True)
+        assert sorted(os.listdir(store_path)) == [
+            'file_0000.nc', 'file_0001.nc']
+
+        # A file that arrives late is refused
+        shutil.copy(os.path.join(filepath, fns[2]), raw_dir)
+
+        with pytest.raises(ValueError):
+            ingest_new_files(store_path, raw_dir, silent=True)
+
+        # A removed file is not overwritten
+        os.remove(os.path.join(raw_dir, fns[2]))
+        os.remove(os.path.join(store_path, 'file_0000.nc'))
+        shutil.copy(os.path.join(filepath, fns[5]), raw_dir)
+        new_files = ingest_new_files(store_path, raw_dir, silent=True)
+
+        assert [os.path.basename(fp) for fp in new_files] == [fns[5]]
+        assert sorted(os.listdir(store_path)) == [
+            'file_0001.nc', 'file_0002.nc']
+
+    pass
+
+
+def test_ingest_new_files_sensornet():
+    from dtscalibration import ingest_new_files
+
+    # The filenames of these files contain no timestamp
+    filepath = data_dir_sensornet_double_ended
+    ds = read_sensornet_files(directory=filepath, silent=True)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        store_path = os.path.join(tmpdirname, 'store')
+
+        # The timestamps are read from the headers by default
+        ingest_new_files(
+            store_path, filepath, read_files=read_sensornet_files,
+            file_ext='*.ddf', silent=True)
+
+        ds2 = open_mf_datastore(
+            path=os.path.join(store_path, '*.nc'), load_in_memory=True)
+        np.testing.assert_array_equal(ds.time.values, ds2.time.values)
+        ds2.close()
+
+        with pytest.raises(ValueError, match='get_timestamp'):
+            ingest_new_files(
+                os.path.join(tmpdirname, 'store2'), filepath,
+                file_ext='*.ddf', silent=True)
+
+    pass
+
+
 def read_data_from_fp_numpy(fp):
     """
     Read the data from a single Silixa xml file. Using a simple approach
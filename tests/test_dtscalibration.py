@@ -1,12 +1,15 @@
 # coding=utf-8
 import os
+import tempfile
 
 import numpy as np
 import pytest
 import scipy.sparse as sp
 from scipy import stats
 
+from dtscalibration import CalibrationModel
 from dtscalibration import DataStore
+from dtscalibration import OnlineCalibrationSingleEnded
 from dtscalibration import read_silixa_files
 from dtscalibration.calibrate_utils import wls_sparse
 from dtscalibration.calibrate_utils import wls_stats
@@ -948,6 +951,381 @@ def test_double_ended_ols_wls_fix_alpha_fix_gamma_estimate_synthetic():
     pass
 
 
+def test_double_ended_wls_block_solver():
+    """The block solver should give the same parameters and covariance
+    as the dense solver of statsmodels"""
+    from dtscalibration import DataStore
+    import numpy as np
+
+    np.random.seed(0)
+
+    cable_len = 100.
+    nt = 50
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'rst':                   (['x', 'time'], rst),
+        'rast':                  (['x', 'time'], rast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '1'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    ds.calibration_double_ended(sections=sections,
+                                st_label='st',
+                                ast_label='ast',
+                                rst_label='rst',
+                                rast_label='rast',
+                                st_var=stokes_var,
+                                ast_var=stokes_var,
+                                rst_var=stokes_var,
+                                rast_var=stokes_var,
+                                store_tmpw=None,
+                                method='wls',
+                                solver='stats')
+    fix_alpha = ds.alpha.values.copy(), ds.alpha_var.values.copy()
+
+    for fix in [dict(),
+                dict(fix_gamma=(gamma, 1.)),
+                dict(fix_alpha=fix_alpha),
+                dict(fix_gamma=(gamma, 1.), fix_alpha=fix_alpha)]:
+        out = dict()
+
+        for solver in ['stats', 'block']:
+            ds.calibration_double_ended(sections=sections,
+                                        st_label='st',
+                                        ast_label='ast',
+                                        rst_label='rst',
+                                        rast_label='rast',
+                                        st_var=stokes_var,
+                                        ast_var=stokes_var,
+                                        rst_var=stokes_var,
+                                        rast_var=stokes_var,
+                                        store_tmpw=None,
+                                        method='wls',
+                                        solver=solver,
+                                        **fix)
+            out[solver] = ds.p_val.values.copy(), ds.p_cov.values.copy()
+
+        np.testing.assert_allclose(out['block'][0], out['stats'][0],
+                                   rtol=1e-7)
+        np.testing.assert_allclose(out['block'][1], out['stats'][1],
+                                   rtol=1e-6, atol=1e-15)
+
+    pass
+
+
+def test_calibrate_wls_matrix_free_solver():
+    """The matrix-free solver should give the same parameters and
+    covariance as the sparse solver, both single- and double-ended"""
+    from dtscalibration import DataStore
+    from dtscalibration.calibrate_utils import design_operator
+    from dtscalibration.calibrate_utils import normal_matrix
+    import numpy as np
+
+    np.random.seed(0)
+
+    cable_len = 100.
+    nt = 20
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'rst':                   (['x', 'time'], rst),
+        'rast':                  (['x', 'time'], rast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '1'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    ds_single = ds.copy()
+    out = dict()
+
+    # Compared with the exact solvers. The stopping tolerances of lsqr
+    # bound the error of the matrix-free solution.
+    tol = 1e-12
+    solvers = dict(
+        double=('block', 'matrix_free'), single=('structured', 'matrix_free'))
+    solver_kwargs = dict(
+        block=None, structured=None,
+        matrix_free=dict(atol=tol, btol=tol, iter_lim=10000))
+
+    for solver_double, solver_single in zip(*solvers.values()):
+        ds.calibration_double_ended(sections=sections,
+                                    st_label='st',
+                                    ast_label='ast',
+                                    rst_label='rst',
+                                    rast_label='rast',
+                                    st_var=stokes_var,
+                                    ast_var=stokes_var,
+                                    rst_var=stokes_var,
+                                    rast_var=stokes_var,
+                                    store_tmpw=None,
+                                    method='wls',
+                                    solver=solver_double,
+                                    solver_kwargs=solver_kwargs[solver_double])
+        out['double', solver_double] = ds.p_val.values.copy(), \
+            ds.p_cov.values.copy()
+
+        ds_single.calibration_single_ended(sections=sections,
+                                           st_label='st',
+                                           ast_label='ast',
+                                           st_var=stokes_var,
+                                           ast_var=stokes_var,
+                                           method='wls',
+                                           solver=solver_single,
+                                           solver_kwargs=solver_kwargs[
+                                               solver_single])
+        out['single', solver_single] = ds_single.p_val.values.copy(), \
+            ds_single.p_cov.values.copy()
+
+    for setup, (exact, _) in solvers.items():
+        # Relative to the standard errors, as the parameters differ in scale
+        p_std = np.sqrt(np.diag(out[setup, exact][1]))
+        np.testing.assert_array_less(
+            np.abs(out[setup, 'matrix_free'][0] - out[setup, exact][0]),
+            1e4 * tol * p_std)
+        np.testing.assert_allclose(out[setup, 'matrix_free'][1],
+                                   out[setup, exact][1],
+                                   rtol=1e-6, atol=1e-15)
+
+    # The operator, its adjoint and the normal matrix are consistent
+    nxb, ntb = 7, 5
+    blocks = [
+        dict(shape=(nxb, ntb), w=np.random.rand(nxb, ntb),
+             terms=[(0, None, np.random.rand(nxb, ntb)),
+                    (1, 1, -1.),
+                    (1 + ntb, 0, -1.),
+                    (1 + ntb + nxb, 1,
+                     -(np.arange(nxb) >= 3)[:, None].astype(float))]),
+        dict(shape=(1, ntb), w=np.random.rand(1, ntb),
+             terms=[(1, 1, 0.5)])]
+    npar = 1 + 2 * ntb + nxb
+    wX = design_operator(blocks, npar)
+    wX_dense = wX.matmat(np.eye(npar))
+
+    np.testing.assert_allclose(
+        wX.rmatmat(np.eye(wX.shape[0])), wX_dense.T, atol=1e-15)
+    np.testing.assert_allclose(
+        normal_matrix(blocks, npar).toarray(), wX_dense.T.dot(wX_dense),
+        atol=1e-12)
+
+    pass
+
+
+def test_double_ended_wls_compact_p_cov():
+    """With calc_cov='blocks' p_cov is stored compactly. The stored entries
+    should equal those of the full covariance matrix, survive a round trip
+    to netCDF, and be usable for the confidence intervals"""
+    import tempfile
+
+    from dtscalibration import DataStore
+    from dtscalibration import open_datastore
+    from dtscalibration.datastore_utils import get_p_cov
+    import numpy as np
+
+    np.random.seed(0)
+
+    cable_len = 100.
+    nt = 50
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'rst':                   (['x', 'time'], rst),
+        'rast':                  (['x', 'time'], rast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '1'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    kwargs = dict(sections=sections,
+                  st_label='st',
+                  ast_label='ast',
+                  rst_label='rst',
+                  rast_label='rast',
+                  st_var=stokes_var,
+                  ast_var=stokes_var,
+                  rst_var=stokes_var,
+                  rast_var=stokes_var,
+                  method='wls',
+                  solver='sparse',
+                  tmpw_mc_size=500)
+
+    ds.calibration_double_ended(calc_cov='full', **kwargs)
+    p_cov_full = ds.p_cov.values
+    tmpw_var_full = ds.TMPW_MC_var.values
+
+    ds.calibration_double_ended(calc_cov='blocks', **kwargs)
+    assert ds.p_cov.dims == ('p_cov_nnz',)
+    # diagonal, gamma row and column, and the pair of D_fw and D_bw per time
+    assert ds.p_cov.size == 201 + 2 * 200 + 2 * nt
+
+    p_cov = get_p_cov(ds).tocoo()
+    np.testing.assert_allclose(
+        p_cov.data, p_cov_full[p_cov.row, p_cov.col], rtol=1e-6, atol=1e-15)
+    np.testing.assert_allclose(
+        ds.TMPW_MC_var.values.mean(), tmpw_var_full.mean(), rtol=0.2)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        temp_file = os.path.join(tmpdirname, 'ds.nc')
+        ds.to_netcdf(path=temp_file)
+
+        ds2 = open_datastore(temp_file, load_in_memory=True)
+        np.testing.assert_array_equal(get_p_cov(ds2, dense=True),
+                                      get_p_cov(ds, dense=True))
+
+        ds2.conf_int_double_ended(
+            p_val='p_val',
+            p_cov='p_cov',
+            st_label='st',
+            ast_label='ast',
+            rst_label='rst',
+            rast_label='rast',
+            st_var=stokes_var,
+            ast_var=stokes_var,
+            rst_var=stokes_var,
+            rast_var=stokes_var,
+            store_tmpw='TMPW',
+            conf_ints=[2.5, 97.5],
+            mc_sample_size=500)
+        np.testing.assert_allclose(
+            ds2.TMPW_MC_var.values.mean(), tmpw_var_full.mean(), rtol=0.2)
+        ds2.close()
+
+    pass
+
+
 def test_double_ended_exponential_variance_estimate_synthetic():
     import dask.array as da
     from dtscalibration import DataStore
@@ -1484,6 +1862,84 @@ def test_single_ended_ols_wls_fix_gamma_fix_dalpha_synthetic():
     pass
 
 
+def test_single_ended_wls_structured_solver():
+    """The structured solver should give the same parameters and covariance
+    as the dense solver of statsmodels"""
+
+    from dtscalibration import DataStore
+    import numpy as np
+
+    np.random.seed(0)
+
+    cable_len = 100.
+    nt = 50
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 500)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+
+    st_var = 25.
+    ast_var = 25.
+    st += np.random.normal(scale=st_var ** 0.5, size=st.shape)
+    ast += np.random.normal(scale=ast_var ** 0.5, size=ast.shape)
+
+    ds = DataStore({
+        'st':    (['x', 'time'], st),
+        'ast':   (['x', 'time'], ast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'cold':  (['time'], ts_cold),
+        'warm':  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '0'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    for fix_gamma in [None, (gamma, 1.)]:
+        out = dict()
+
+        for solver in ['stats', 'structured']:
+            ds.calibration_single_ended(sections=sections,
+                                        st_label='st',
+                                        ast_label='ast',
+                                        st_var=st_var,
+                                        ast_var=ast_var,
+                                        method='wls',
+                                        solver=solver,
+                                        fix_gamma=fix_gamma)
+            out[solver] = ds.p_val.values.copy(), ds.p_cov.values.copy()
+
+        np.testing.assert_allclose(out['structured'][0], out['stats'][0],
+                                   rtol=1e-7)
+        np.testing.assert_allclose(out['structured'][1], out['stats'][1],
+                                   rtol=1e-6, atol=1e-15)
+
+    pass
+
+
 def test_single_ended_exponential_variance_estimate_synthetic():
     """Checks whether the coefficients are correctly defined by creating a
     synthetic measurement set, and derive the parameters from this set.
@@ -1714,6 +2170,51 @@ def test_calibration_ols():
     pass
 
 
+def test_double_ended_wls_float32_stokes():
+    """The Stokes data is stored in float32. The calibration promotes the
+    Stokes data to float64 where needed, and should return the same
+    temperatures."""
+    filepath = data_dir_double_ended2
+    sections = {
+        'probe1Temperature': [slice(7.5, 17.), slice(70., 80.)],  # cold bath
+        'probe2Temperature': [slice(24., 34.), slice(85., 95.)],  # warm bath
+        }
+
+    ds_list = []
+    for dtype in [None, 'float32']:
+        ds = read_silixa_files(
+            directory=filepath,
+            timezone_netcdf='UTC',
+            file_ext='*.xml',
+            dtype=dtype)
+        ds = ds.sel(x=slice(0., 100.))
+        ds.sections = sections
+
+        st_var, ast_var, rst_var, rast_var = [
+            ds.variance_stokes_exponential(st_label=label)[0]
+            for label in ['ST', 'AST', 'REV-ST', 'REV-AST']]
+
+        ds.calibration_double_ended(
+            st_var=st_var,
+            ast_var=ast_var,
+            rst_var=rst_var,
+            rast_var=rast_var,
+            method='wls',
+            solver='sparse')
+        ds_list.append(ds)
+
+    ds64, ds32 = ds_list
+    assert ds32.ST.dtype == np.float32
+    assert ds32.TMPF.dtype == np.float64
+
+    np.testing.assert_allclose(ds32.gamma, ds64.gamma, rtol=1e-7)
+    np.testing.assert_array_almost_equal(
+        ds32.TMPF.data, ds64.TMPF.data, decimal=3)
+    np.testing.assert_array_almost_equal(
+        ds32.TMPB.data, ds64.TMPB.data, decimal=3)
+    pass
+
+
 def test_calibrate_wls_procedures():
     x = np.linspace(0, 10, 25 * 4)
     np.random.shuffle(x)
@@ -1753,3 +2254,1237 @@ def test_calibrate_wls_procedures():
     np.testing.assert_array_almost_equal(p_cov, psp_cov, decimal=dec)
 
     pass
+
+
+def test_calibrate_wls_cov_subset():
+    """The sparse factorization of the normal matrix should give the same
+    covariance as statsmodels, also if only a subset of it is computed"""
+    nx, nt = 30, 8
+    X = sp.hstack((
+        sp.coo_matrix(np.random.uniform(size=(nx * nt, 2))),
+        sp.coo_matrix((-np.ones(nx * nt), (np.arange(nx * nt),
+                                           np.tile(np.arange(nt), nx))),
+                      shape=(nx * nt, nt))))
+    beta = np.concatenate(([480., 0.01], np.random.uniform(size=nt)))
+    y_meas = X.dot(beta) + np.random.normal(size=nx * nt)
+    w = np.random.uniform(0.5, 1.5, size=nx * nt)
+    blocks = [[2, 3], [4, 5, 6]]
+
+    ps_sol, ps_var, ps_cov = wls_stats(X, y_meas, w=w, calc_cov=True)
+
+    for calc_cov in ['full', 'diag', 'blocks']:
+        p_sol, p_var, p_cov = wls_sparse(
+            X, y_meas, w=w, calc_cov=calc_cov, x0=beta, atol=1e-12,
+            btol=1e-12, cov_rows=[0], cov_blocks=blocks)
+
+        np.testing.assert_allclose(p_var, ps_var, rtol=1e-6)
+
+        if calc_cov == 'full':
+            np.testing.assert_allclose(p_cov, ps_cov, rtol=1e-6, atol=1e-12)
+            continue
+
+        assert sp.issparse(p_cov)
+        p_cov = p_cov.tocoo()
+        np.testing.assert_allclose(
+            p_cov.data, ps_cov[p_cov.row, p_cov.col], rtol=1e-6, atol=1e-12)
+
+        if calc_cov == 'diag':
+            assert p_cov.nnz == nt + 2
+        else:
+            # diagonal, gamma row and column, and two blocks
+            assert p_cov.nnz == nt + 2 + 2 * (nt + 1) + 2 + 6
+
+    pass
+
+
+def test_calibrate_time_windows():
+    """Calibrating windows of time steps in parallel with a combined
+    gamma should be close to calibrating all time steps at once"""
+    cable_len = 100.
+    nt = 50
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    np.random.seed(0)
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    def make_ds():
+        return DataStore({
+            'st':                    (['x', 'time'], st),
+            'ast':                   (['x', 'time'], ast),
+            'rst':                   (['x', 'time'], rst),
+            'rast':                  (['x', 'time'], rast),
+            'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+            'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+            'cold':                  (['time'], ts_cold),
+            'warm':                  (['time'], ts_warm)
+            },
+            coords={
+                'x':    x,
+                'time': time},
+            attrs={
+                'isDoubleEnded': '1'})
+
+    # Single-ended, windows calibrated in two processes
+    out = dict()
+
+    for time_window in [None, 10]:
+        ds = make_ds()
+        ds.calibration_single_ended(sections=sections,
+                                    st_label='st',
+                                    ast_label='ast',
+                                    st_var=stokes_var,
+                                    ast_var=stokes_var,
+                                    method='wls',
+                                    solver='structured',
+                                    time_window=time_window,
+                                    n_jobs=2)
+        ds.conf_int_single_ended(st_label='st',
+                                 ast_label='ast',
+                                 st_var=stokes_var,
+                                 ast_var=stokes_var,
+                                 method='delta')
+        out[time_window] = ds
+
+    # The combined estimate equals that of all time steps at once
+    assert out[10]['c'].size == nt
+    np.testing.assert_allclose(out[10].gamma, out[None].gamma, rtol=1e-10)
+    np.testing.assert_allclose(out[10].dalpha, out[None].dalpha, rtol=1e-8)
+    np.testing.assert_allclose(
+        out[10].gamma_var, out[None].gamma_var, rtol=1e-8)
+    np.testing.assert_allclose(
+        out[10].dalpha_var, out[None].dalpha_var, rtol=1e-8)
+    np.testing.assert_allclose(out[10].c, out[None].c, atol=1e-3)
+    np.testing.assert_allclose(out[10].TMPF, out[None].TMPF, atol=0.05)
+    np.testing.assert_allclose(
+        out[10].TMPF_MC_var, out[None].TMPF_MC_var, rtol=1e-3)
+
+    # Only the free parameter is combined if gamma is fixed without variance
+    out = dict()
+
+    for time_window in [None, 10]:
+        ds = make_ds()
+        ds.calibration_single_ended(sections=sections,
+                                    st_label='st',
+                                    ast_label='ast',
+                                    st_var=stokes_var,
+                                    ast_var=stokes_var,
+                                    method='wls',
+                                    solver='structured',
+                                    fix_gamma=(gamma, 0.),
+                                    time_window=time_window,
+                                    n_jobs=1)
+        out[time_window] = ds
+
+    assert out[10].gamma == gamma
+    assert out[10].gamma_var == 0.
+    np.testing.assert_allclose(out[10].dalpha, out[None].dalpha, rtol=1e-8)
+    np.testing.assert_allclose(
+        out[10].dalpha_var, out[None].dalpha_var, rtol=1e-8)
+
+    # The correlated errors of alpha are not propagated to D_fw and D_bw
+    with pytest.raises(NotImplementedError):
+        make_ds().calibration_double_ended(sections=sections,
+                                           st_label='st',
+                                           ast_label='ast',
+                                           rst_label='rst',
+                                           rast_label='rast',
+                                           st_var=stokes_var,
+                                           ast_var=stokes_var,
+                                           rst_var=stokes_var,
+                                           rast_var=stokes_var,
+                                           method='wls',
+                                           solver='sparse',
+                                           time_window=10,
+                                           n_jobs=1)
+
+    # Double-ended ols, windows calibrated sequentially
+    out = dict()
+
+    for time_window in [None, 10]:
+        ds = make_ds()
+        ds.calibration_double_ended(sections=sections,
+                                    st_label='st',
+                                    ast_label='ast',
+                                    rst_label='rst',
+                                    rast_label='rast',
+                                    method='ols',
+                                    time_window=time_window,
+                                    n_jobs=1)
+        out[time_window] = ds
+
+    np.testing.assert_allclose(out[10].gamma, out[None].gamma, rtol=1e-8)
+    np.testing.assert_allclose(out[10].df, out[None].df, atol=1e-6)
+    np.testing.assert_allclose(out[10].TMPW, out[None].TMPW, atol=1e-4)
+
+    pass
+
+
+def test_calibrate_fixed_closed_form():
+    """With all parameters that are constant in time fixed, the closed form
+    solution should equal the solution of the solver, also for Dask
+    arrays"""
+    from dtscalibration.calibrate_utils import calibration_double_ended_fixed
+    from dtscalibration.calibrate_utils import calibration_double_ended_solver
+    from dtscalibration.calibrate_utils import calibration_single_ended_fixed
+    from dtscalibration.calibrate_utils import calibration_single_ended_solver
+
+    cable_len = 100.
+    nt = 30
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    np.random.seed(0)
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'rst':                   (['x', 'time'], rst),
+        'rast':                  (['x', 'time'], rast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '1'})
+
+    ds.sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+    ds_dask = ds.chunk({'time': 10})
+
+    fix_gamma = (gamma, 1.)
+    fix_dalpha = (dalpha_p - dalpha_m, 1e-10)
+    fix_alpha = (np.linspace(0., 1e-3, x.size), np.full(x.size, 1e-8))
+
+    # Single-ended: only the coefficients of c remain
+    split = calibration_single_ended_solver(
+        ds, 'st', 'ast', stokes_var, stokes_var, solver='external_split')
+    y = split['y'] - fix_gamma[0] * split['X_gamma'].toarray().flatten() - \
+        fix_dalpha[0] * split['X_dalpha'].toarray().flatten()
+    w = 1 / (1 / split['w'] +
+             fix_gamma[1] * split['X_gamma'].toarray().flatten() ** 2 +
+             fix_dalpha[1] * split['X_dalpha'].toarray().flatten() ** 2)
+    ps_sol, ps_var, ps_cov = wls_stats(split['X_c'], y, w=w, calc_cov=True)
+
+    for ds_i in [ds, ds_dask]:
+        p_sol, p_var, p_cov = calibration_single_ended_fixed(
+            ds_i, 'st', 'ast', stokes_var, stokes_var, fix_gamma=fix_gamma,
+            fix_dalpha=fix_dalpha, calc_cov='full')
+
+        np.testing.assert_allclose(p_sol, ps_sol, rtol=1e-10)
+        np.testing.assert_allclose(p_var, ps_var, rtol=1e-8)
+        np.testing.assert_allclose(p_cov, ps_cov, rtol=1e-8, atol=1e-15)
+
+    # Double-ended: only the coefficients of D_fw and D_bw remain
+    split = calibration_double_ended_solver(
+        ds, 'st', 'ast', 'rst', 'rast', stokes_var, stokes_var, stokes_var,
+        stokes_var, solver='external_split')
+    X_E = sp.vstack(
+        (-split['E'], split['E'], split['E'], split['Zero_E_att']))
+    X_gamma = sp.vstack(
+        (split['Z_gamma'], split['Z_gamma'], split['Zero_gamma'],
+         split['Zero_gamma_att'])).toarray().flatten()
+    X = sp.vstack(
+        (sp.hstack((-split['Z_D'], split['Zero_d'])),
+         sp.hstack((split['Zero_d'], -split['Z_D'])),
+         sp.hstack((split['Z_D'] / 2, -split['Z_D'] / 2)),
+         sp.hstack((split['Z_D_att'] / 2, -split['Z_D_att'] / 2))))
+    y = np.concatenate(
+        (split['y_F'], split['y_B'], split['y_att1'], split['y_att2']))
+    y -= X_E.dot(fix_alpha[0]) + fix_gamma[0] * X_gamma
+    w = np.concatenate(
+        (split['w_F'], split['w_B'], split['w_att1'], split['w_att2']))
+    w = 1 / (1 / w + X_E.power(2).dot(fix_alpha[1]) +
+             fix_gamma[1] * X_gamma ** 2)
+    ps_sol, ps_var, ps_cov = wls_stats(X, y, w=w, calc_cov=True)
+
+    for ds_i in [ds, ds_dask]:
+        p_sol, p_var, p_cov = calibration_double_ended_fixed(
+            ds_i, 'st', 'ast', 'rst', 'rast', stokes_var, stokes_var,
+            stokes_var, stokes_var, fix_gamma=fix_gamma, fix_alpha=fix_alpha,
+            calc_cov='full')
+
+        np.testing.assert_allclose(p_sol, ps_sol, rtol=1e-10)
+        np.testing.assert_allclose(p_var, ps_var, rtol=1e-8)
+        np.testing.assert_allclose(p_cov, ps_cov, rtol=1e-8, atol=1e-15)
+
+    pass
+
+
+def test_calibration_model_apply():
+    """A model exported after calibrating the first time steps, stored and
+    applied to the next time steps should give the same result as
+    calibrating the next time steps with the same parameters fixed"""
+    cable_len = 100.
+    nt = 40
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    np.random.seed(0)
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    def make_ds(itime):
+        return DataStore({
+            'st':                    (['x', 'time'], st[:, itime]),
+            'ast':                   (['x', 'time'], ast[:, itime]),
+            'rst':                   (['x', 'time'], rst[:, itime]),
+            'rast':                  (['x', 'time'], rast[:, itime]),
+            'userAcquisitionTimeFW': (['time'], np.ones(nt)[itime]),
+            'userAcquisitionTimeBW': (['time'], np.ones(nt)[itime]),
+            'cold':                  (['time'], ts_cold[itime]),
+            'warm':                  (['time'], ts_warm[itime])
+            },
+            coords={
+                'x':    x,
+                'time': time[itime]},
+            attrs={
+                'isDoubleEnded': '1'})
+
+    labels = dict(st_label='st', ast_label='ast', rst_label='rst',
+                  rast_label='rast')
+    variances = dict(st_var=stokes_var, ast_var=stokes_var,
+                     rst_var=stokes_var, rast_var=stokes_var)
+
+    # Single-ended
+    ds = make_ds(slice(0, 20))
+    ds.is_double_ended = '0'
+    ds.calibration_single_ended(sections=sections,
+                                st_label='st',
+                                ast_label='ast',
+                                st_var=stokes_var,
+                                ast_var=stokes_var,
+                                method='wls',
+                                solver='structured')
+    model = CalibrationModel.from_datastore(
+        ds, st_label='st', ast_label='ast', st_var=stokes_var,
+        ast_var=stokes_var)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = os.path.join(tmpdirname, 'model.nc')
+        model.to_netcdf(path)
+        model = CalibrationModel.from_netcdf(path)
+
+    assert not model.is_double_ended
+    assert model.sections == ds.sections
+    np.testing.assert_allclose(model.params['gamma'], ds.gamma)
+    np.testing.assert_allclose(model.params['p_cov'][0, 0], ds.gamma_var)
+
+    # The labels under which the parameters were stored
+    model_lbl = CalibrationModel.from_datastore(
+        ds.rename({'gamma': 'g', 'dalpha': 'da'}), st_label='st',
+        ast_label='ast', st_var=stokes_var, ast_var=stokes_var,
+        store_gamma='g', store_dalpha='da')
+    for k in ['gamma', 'dalpha', 'p_cov']:
+        np.testing.assert_allclose(model_lbl.params[k], model.params[k])
+
+    # Applied to the calibrated time steps, the variance of c including the
+    # covariance of gamma and dalpha equals that of the calibration
+    ds_same = make_ds(slice(0, 20))
+    model.apply(ds_same)
+    np.testing.assert_allclose(ds_same.c, ds.c, rtol=1e-8)
+    np.testing.assert_allclose(ds_same.c_var, ds.c_var, rtol=1e-2)
+
+    ds_new = make_ds(slice(20, nt))
+    model.apply(ds_new)
+
+    ds_fix = make_ds(slice(20, nt))
+    ds_fix.calibration_single_ended(sections=sections,
+                                    st_label='st',
+                                    ast_label='ast',
+                                    st_var=stokes_var,
+                                    ast_var=stokes_var,
+                                    method='wls',
+                                    fix_gamma=(float(ds.gamma),
+                                               float(ds.gamma_var)),
+                                    fix_dalpha=(float(ds.dalpha),
+                                                float(ds.dalpha_var)),
+                                    fix_cov=model.params['p_cov'].values)
+
+    np.testing.assert_allclose(ds_new.TMPF, ds_fix.TMPF)
+    np.testing.assert_allclose(ds_new.c_var, ds_fix.c_var)
+    np.testing.assert_allclose(ds_new.TMPF.mean(), 12., atol=0.2)
+
+    # Double-ended
+    ds = make_ds(slice(0, 20))
+    ds.calibration_double_ended(sections=sections,
+                                store_tmpw=None,
+                                method='wls',
+                                **labels,
+                                **variances)
+    model = CalibrationModel.from_datastore(ds, **labels, **variances)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = os.path.join(tmpdirname, 'model.nc')
+        model.to_netcdf(path)
+        model = CalibrationModel.from_netcdf(path)
+
+    assert model.is_double_ended
+    np.testing.assert_allclose(model.params['alpha'], ds.alpha)
+    np.testing.assert_allclose(model.params['alpha_var'], ds.alpha_var)
+
+    ds_new = make_ds(slice(20, nt))
+    model.apply(ds_new, store_tmpw=None)
+
+    ds_fix = make_ds(slice(20, nt))
+    ds_fix.calibration_double_ended(sections=sections,
+                                    store_tmpw=None,
+                                    method='wls',
+                                    fix_gamma=(float(ds.gamma),
+                                               float(ds.gamma_var)),
+                                    fix_alpha=(ds.alpha.values,
+                                               ds.alpha_var.values),
+                                    **labels,
+                                    **variances)
+
+    np.testing.assert_allclose(ds_new.TMPF, ds_fix.TMPF)
+    np.testing.assert_allclose(ds_new.TMPB, ds_fix.TMPB)
+    np.testing.assert_allclose(ds_new.df_var, ds_fix.df_var)
+    np.testing.assert_allclose(ds_new.TMPF.mean(), 12., atol=0.2)
+
+    pass
+
+
+def test_online_calibration_single_ended():
+    """Adding the time steps one at a time to the online calibration should
+    give the same gamma, dalpha and temperature of the last time step as
+    calibrating all time steps at once"""
+    cable_len = 100.
+    nt = 30
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4. + np.cos(time) * 4
+    ts_warm = np.ones(nt) * 20. + -np.sin(time) * 4
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    np.random.seed(0)
+    st, ast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast)]
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    def make_ds(itime):
+        return DataStore({
+            'st':                    (['x', 'time'], st[:, itime]),
+            'ast':                   (['x', 'time'], ast[:, itime]),
+            'userAcquisitionTimeFW': (['time'], np.ones(nt)[itime]),
+            'cold':                  (['time'], ts_cold[itime]),
+            'warm':                  (['time'], ts_warm[itime])
+            },
+            coords={
+                'x':    x,
+                'time': time[itime]},
+            attrs={
+                'isDoubleEnded': '0'})
+
+    ds = make_ds(slice(None))
+    ds.calibration_single_ended(sections=sections,
+                                st_label='st',
+                                ast_label='ast',
+                                st_var=stokes_var,
+                                ast_var=stokes_var,
+                                method='wls',
+                                solver='structured')
+
+    online = OnlineCalibrationSingleEnded(
+        sections, st_label='st', ast_label='ast', st_var=stokes_var,
+        ast_var=stokes_var)
+
+    for it in range(nt):
+        ds_new = make_ds(slice(it, it + 1))
+        online.update(ds_new)
+
+    np.testing.assert_allclose(
+        ds_new['gamma'].values[-1], ds['gamma'].values, rtol=1e-10)
+    np.testing.assert_allclose(
+        ds_new['dalpha'].values[-1], ds['dalpha'].values, rtol=1e-8)
+    np.testing.assert_allclose(
+        ds_new['gamma_var'].values[-1], ds['gamma_var'].values, rtol=1e-6)
+    np.testing.assert_allclose(
+        ds_new['TMPF'].values[:, -1], ds['TMPF'].values[:, -1], atol=1e-8)
+
+    # Forgetting the previous time steps
+    online = OnlineCalibrationSingleEnded(
+        sections, st_label='st', ast_label='ast', st_var=stokes_var,
+        ast_var=stokes_var, forgetting_factor=0.9)
+    online.update(make_ds(slice(None)))
+    np.testing.assert_allclose(online.p_val[0], gamma, rtol=1e-2)
+    pass
+
+
+def test_calibrate_wls_lsmr_solver():
+    """The lsmr solver should give the same parameters as the exact
+    structured and block solvers, and converge in fewer iterations when
+    started from a previous solution"""
+    np.random.seed(0)
+
+    cable_len = 100.
+    nt = 20
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'rst':                   (['x', 'time'], rst),
+        'rast':                  (['x', 'time'], rast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '1'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    labels = dict(st_label='st', ast_label='ast', rst_label='rst',
+                  rast_label='rast')
+    variances = dict(st_var=stokes_var, ast_var=stokes_var,
+                     rst_var=stokes_var, rast_var=stokes_var)
+
+    ds_single = ds.copy()
+    ds_single.calibration_single_ended(
+        sections=sections, st_label='st', ast_label='ast',
+        st_var=stokes_var, ast_var=stokes_var, method='wls',
+        solver='structured')
+    p_val_exact = ds_single.p_val.values.copy()
+    p_cov_exact = ds_single.p_cov.values.copy()
+
+    ds_single.calibration_single_ended(
+        sections=sections, st_label='st', ast_label='ast',
+        st_var=stokes_var, ast_var=stokes_var, method='wls',
+        solver='lsmr', solver_kwargs=dict(atol=1e-10, btol=1e-10))
+    np.testing.assert_allclose(
+        ds_single.p_val.values, p_val_exact, rtol=1e-8)
+    np.testing.assert_allclose(
+        ds_single.p_cov.values, p_cov_exact, rtol=1e-6, atol=1e-15)
+
+    for k in ['istop', 'iterations', 'residual_norm', 'wall_time']:
+        assert 'lsmr_' + k in ds_single['gamma'].attrs
+
+    # Warm start from the previous solution
+    iterations = ds_single['gamma'].attrs['lsmr_iterations']
+    ds_single.calibration_single_ended(
+        sections=sections, st_label='st', ast_label='ast',
+        st_var=stokes_var, ast_var=stokes_var, method='wls',
+        solver='lsmr', p_val=ds_single.p_val.values,
+        solver_kwargs=dict(atol=1e-10, btol=1e-10))
+    assert ds_single['gamma'].attrs['lsmr_iterations'] < iterations
+    np.testing.assert_allclose(
+        ds_single.p_val.values, p_val_exact, rtol=1e-8)
+
+    # Double-ended
+    ds.calibration_double_ended(
+        sections=sections, store_tmpw=None, method='wls', solver='block',
+        **labels, **variances)
+    p_val_exact = ds.p_val.values.copy()
+
+    ds.calibration_double_ended(
+        sections=sections, store_tmpw=None, method='wls', solver='lsmr',
+        p_val=p_val_exact, **labels, **variances)
+    np.testing.assert_allclose(ds.p_val.values, p_val_exact, rtol=1e-7)
+    assert ds['gamma'].attrs['lsmr_iterations'] <= 1
+    pass
+
+
+def test_conf_int_delta_method():
+    """The variances of the temperature estimated with the delta method
+    should agree with those estimated with Monte Carlo"""
+    from dask import array as da
+
+    np.random.seed(0)
+    state = da.random.RandomState(0)
+
+    cable_len = 100.
+    nt = 20
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'rst':                   (['x', 'time'], rst),
+        'rast':                  (['x', 'time'], rast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '1'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    labels = dict(st_label='st', ast_label='ast', rst_label='rst',
+                  rast_label='rast')
+    variances = dict(st_var=stokes_var, ast_var=stokes_var,
+                     rst_var=stokes_var, rast_var=stokes_var)
+    conf_ints = [2.5, 97.5]
+
+    # Single-ended
+    ds_single = ds.copy()
+    ds_single.calibration_single_ended(
+        sections=sections, st_label='st', ast_label='ast',
+        st_var=stokes_var, ast_var=stokes_var, method='wls',
+        solver='structured')
+    ds_mc = ds_single.copy()
+    ds_mc.conf_int_single_ended(
+        st_label='st', ast_label='ast', st_var=stokes_var,
+        ast_var=stokes_var, conf_ints=conf_ints, mc_sample_size=500,
+        da_random_state=state)
+    ds_single.conf_int_single_ended(
+        st_label='st', ast_label='ast', st_var=stokes_var,
+        ast_var=stokes_var, conf_ints=conf_ints, method='delta')
+
+    np.testing.assert_allclose(
+        ds_single.TMPF_MC_var.values, ds_mc.TMPF_MC_var.values, rtol=0.4)
+    np.testing.assert_allclose(
+        ds_single.TMPF_MC_var.values.mean(), ds_mc.TMPF_MC_var.values.mean(),
+        rtol=0.02)
+    np.testing.assert_allclose(
+        ds_single.TMPF_MC.values, ds_mc.TMPF_MC.values, atol=0.5)
+
+    # Double-ended
+    ds.calibration_double_ended(
+        sections=sections, store_tmpw=None, method='wls', solver='block',
+        **labels, **variances)
+    ds_mc = ds.copy()
+    ds_mc.conf_int_double_ended(
+        conf_ints=conf_ints, mc_sample_size=500, da_random_state=state,
+        **labels, **variances)
+    ds.conf_int_double_ended(
+        conf_ints=conf_ints, method='delta', **labels, **variances)
+
+    for label in ['TMPF', 'TMPB', 'TMPW']:
+        np.testing.assert_allclose(
+            ds[label + '_MC_var'].values.mean(),
+            ds_mc[label + '_MC_var'].values.mean(), rtol=0.02)
+        np.testing.assert_allclose(
+            ds[label + '_MC'].values, ds_mc[label + '_MC'].values, atol=0.5)
+
+    np.testing.assert_allclose(ds.TMPW.values, ds_mc.TMPW.values, atol=0.2)
+    pass
+
+
+def test_conf_int_mc_batches():
+    """The statistics of the Monte Carlo samples computed per batch should
+    agree with those of all samples at once"""
+    from dask import array as da
+
+    from dtscalibration.datastore_utils import StreamingStatistics
+
+    np.random.seed(0)
+
+    # The streaming statistics of samples of a skewed distribution
+    samples = np.random.gamma(3., size=(1000, 10, 5))
+    conf_ints = [2.5, 50., 97.5]
+
+    stats = StreamingStatistics()
+    for i0 in range(0, 600, 128):
+        stats.update(samples[i0:min(i0 + 128, 600)])
+
+    # Samples processed elsewhere, with the same bins
+    stats2 = stats.empty_like()
+    stats2.update(samples[600:])
+    stats.merge(stats2)
+
+    assert stats.n == 1000
+    np.testing.assert_allclose(stats.mean, samples.mean(axis=0))
+    np.testing.assert_allclose(stats.var(), samples.var(axis=0, ddof=1))
+    np.testing.assert_allclose(
+        stats.quantile(conf_ints),
+        np.percentile(samples, conf_ints, axis=0),
+        atol=0.15 * samples.std())
+
+    # The counts are upcast before they overflow
+    stats3 = StreamingStatistics()
+    stats3.update(np.zeros((40000, 2)))
+    assert stats3.counts.dtype == np.uint16
+    stats3.update(np.zeros((40000, 2)))
+    assert stats3.counts.dtype == np.uint32
+    np.testing.assert_array_equal(stats3.counts.sum(axis=0), 80000)
+    np.testing.assert_array_equal(stats3.quantile([50.]), 0.)
+
+    # Double-ended
+    cable_len = 100.
+    nt = 20
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'rst':                   (['x', 'time'], rst),
+        'rast':                  (['x', 'time'], rast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '1'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    labels = dict(st_label='st', ast_label='ast', rst_label='rst',
+                  rast_label='rast')
+    variances = dict(st_var=stokes_var, ast_var=stokes_var,
+                     rst_var=stokes_var, rast_var=stokes_var)
+
+    ds.calibration_double_ended(
+        sections=sections, method='wls', solver='block', calc_cov='blocks',
+        **labels, **variances)
+    ds_mc = ds.copy()
+    ds_mc.conf_int_double_ended(
+        conf_ints=conf_ints, mc_sample_size=500,
+        da_random_state=da.random.RandomState(0), **labels, **variances)
+    ds.conf_int_double_ended(
+        conf_ints=conf_ints, mc_sample_size=500, mc_batch_size=64,
+        **labels, **variances)
+
+    for label in ['TMPF', 'TMPB', 'TMPW']:
+        np.testing.assert_allclose(
+            ds[label + '_MC_var'].values.mean(),
+            ds_mc[label + '_MC_var'].values.mean(), rtol=0.02)
+        np.testing.assert_allclose(
+            ds[label + '_MC'].values, ds_mc[label + '_MC'].values, atol=0.5)
+
+    assert 'TMPF_MC_set' not in ds and 'MC' not in ds.coords
+    pass
+
+
+def test_cov_factor_cache():
+    """The factor of the covariance matrix is memoized on the DataStore, and
+    the samples drawn with it have the right covariance"""
+    import scipy.sparse as sp
+
+    from dtscalibration.datastore_utils import CovarianceFactor
+
+    np.random.seed(0)
+
+    # Coupling parameter 0 and blocks of two parameters, conditionally
+    # independent given parameter 0
+    nblock = 4
+    npar = 1 + 2 * nblock
+    cov = np.full((npar, npar), 0.3 ** 2 / 2.)
+    cov[0, 0] = 2.
+    cov[0, 1:] = cov[1:, 0] = 0.3
+    cov_sparse = np.zeros((npar, npar))
+    cov_sparse[0] = cov[0]
+    cov_sparse[:, 0] = cov[:, 0]
+    for i in range(nblock):
+        ib = slice(1 + 2 * i, 3 + 2 * i)
+        cov[ib, ib] += np.array([[1., 0.4], [0.4, 1.5]])
+        cov_sparse[ib, ib] = cov[ib, ib]
+    mean = np.arange(npar, dtype=float)
+
+    for cov_i in [cov, sp.csr_matrix(cov_sparse)]:
+        factor = CovarianceFactor(cov_i, cov_rows=[0])
+        samples = factor.rvs(mean, size=200000)
+        np.testing.assert_allclose(samples.mean(axis=0), mean, atol=0.02)
+        np.testing.assert_allclose(np.cov(samples.T), cov, atol=0.03)
+
+    # The factor is reused by the confidence intervals
+    cable_len = 100.
+    nt = 10
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 50)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-(dalpha_r + dalpha_p) * x[:, None]) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-(dalpha_r + dalpha_m) * x[:, None]) / \
+        (np.exp(gamma / temp_real) - 1)
+    st += np.random.normal(scale=2., size=st.shape)
+    ast += np.random.normal(scale=2., size=ast.shape)
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '0'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    ds.calibration_single_ended(
+        sections=sections, st_label='st', ast_label='ast', st_var=4.,
+        ast_var=4., method='wls', solver='sparse')
+
+    factor = ds.get_cov_factor('p_cov', cov_rows=[0, 1])
+    ds.conf_int_single_ended(
+        st_label='st', ast_label='ast', st_var=4., ast_var=4.,
+        conf_ints=[2.5, 97.5], mc_sample_size=100, mc_batch_size=50)
+    assert ds.get_cov_factor('p_cov', cov_rows=[0, 1]) is factor
+    assert ds.get_cov_factor(ds.p_cov.values, cov_rows=[0, 1]) is factor
+
+    # Not shared with a copy, and renewed by a new calibration
+    assert ds.copy().get_cov_factor('p_cov', cov_rows=[0, 1]) is not factor
+    ds.calibration_single_ended(
+        sections=sections, st_label='st', ast_label='ast', st_var=4.,
+        ast_var=4., method='wls', solver='sparse')
+    assert ds.get_cov_factor('p_cov', cov_rows=[0, 1]) is not factor
+    assert len(ds._cov_factors) == 1
+
+    ds.clear_cov_factors()
+    assert not ds._cov_factors
+    pass
+
+
+def test_conf_int_mc_sampling():
+    """The variance-reduced Monte Carlo samples should give the same
+    variance as the delta method, with fewer samples"""
+    import scipy.stats as sst
+
+    from dtscalibration.datastore_utils import standard_normal_rvs
+
+    np.random.seed(0)
+
+    z = standard_normal_rvs(10, (3,), method='antithetic')
+    np.testing.assert_array_equal(z[:5], -z[5:])
+
+    # Exactly one sample per equiprobable interval
+    for method in ['lhs', 'qmc']:
+        z = standard_normal_rvs(16, (50,), method=method)
+        np.testing.assert_array_equal(
+            np.sort(np.floor(sst.norm.cdf(z) * 16), axis=0),
+            np.broadcast_to(np.arange(16.)[:, None], (16, 50)))
+
+    cable_len = 100.
+    nt = 20
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 100)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_p * x[:, None]) * np.exp(gamma / temp_real) / \
+        (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-dalpha_r * x[:, None]) * \
+        np.exp(-dalpha_m * x[:, None]) / (np.exp(gamma / temp_real) - 1)
+    rst = C_p * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * \
+        np.exp(-dalpha_p * (-x[:, None] + cable_len)) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    rast = C_m * np.exp(-dalpha_r * (-x[:, None] + cable_len)) * np.exp(
+        -dalpha_m * (-x[:, None] + cable_len)) / \
+        (np.exp(gamma / temp_real) - 1)
+
+    stokes_var = 4.
+    st, ast, rst, rast = [
+        i + np.random.normal(scale=stokes_var ** 0.5, size=i.shape)
+        for i in (st, ast, rst, rast)]
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'rst':                   (['x', 'time'], rst),
+        'rast':                  (['x', 'time'], rast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'userAcquisitionTimeBW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '1'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    labels = dict(st_label='st', ast_label='ast', rst_label='rst',
+                  rast_label='rast')
+    variances = dict(st_var=stokes_var, ast_var=stokes_var,
+                     rst_var=stokes_var, rast_var=stokes_var)
+
+    ds.calibration_double_ended(
+        sections=sections, method='wls', solver='sparse',
+        **labels, **variances)
+    ds_delta = ds.copy()
+    ds_delta.conf_int_double_ended(method='delta', **labels, **variances)
+    tmpf_var = ds_delta['TMPF_MC_var'].values
+
+    # Three times the relative standard error of the variance of random
+    # samples, which the quasi-random samples should not exceed
+    mc_sample_size = 64
+    rtol = 3 * np.sqrt(2 / (mc_sample_size - 1))
+
+    for mc_batch_size in [None, 64]:
+        ds_mc = ds.copy()
+        ds_mc.conf_int_double_ended(
+            conf_ints=[2.5, 97.5], mc_sample_size=mc_sample_size,
+            mc_sampling='qmc', mc_batch_size=mc_batch_size, mc_seed=0,
+            **labels, **variances)
+
+        np.testing.assert_allclose(
+            ds_mc['TMPF_MC_var'].values, tmpf_var, rtol=rtol)
+        np.testing.assert_allclose(
+            ds_mc['TMPF_MC_var'].values.mean(), tmpf_var.mean(), rtol=0.01)
+
+    # Stops well before the maximum number of samples
+    ds_mc = ds.copy()
+    ds_mc.conf_int_double_ended(
+        conf_ints=[2.5, 97.5], mc_sample_size=10000, mc_batch_size=32,
+        mc_sampling='qmc', mc_rel_tol=0.05, mc_seed=0, **labels,
+        **variances)
+    attrs = ds_mc['TMPF_MC_var'].attrs
+    assert 96 <= attrs['mc_sample_size'] <= 512
+    assert attrs['mc_rel_se'] < 0.05
+    pass
+
+
+def test_conf_int_mc_seed():
+    """With a seed, the Monte Carlo results are reproducible and
+    independent of the chunks"""
+    from dask import array as da
+
+    from dtscalibration.datastore_utils import dask_normal_rvs
+
+    # Both axes span multiple streams, see `_rvs_x_block` and
+    # `_rvs_time_block`
+    loc = np.arange(39000.).reshape((130, 300))
+
+    for method in ['random', 'lhs']:
+        samples = [
+            dask_normal_rvs(
+                da.from_array(loc, chunks=chunks), 2., 8,
+                ((8,),) + da.from_array(loc, chunks=chunks).chunks,
+                method=method, seed=np.random.SeedSequence(3),
+                key=(1,)).compute()
+            for chunks in [(130, 300), (30, 40), (129, 2), (1, 77)]]
+
+        for sample in samples[1:]:
+            np.testing.assert_array_equal(samples[0], sample)
+
+    np.random.seed(0)
+
+    cable_len = 100.
+    nt = 10
+    time = np.arange(nt)
+    x = np.linspace(0., cable_len, 50)
+    ts_cold = np.ones(nt) * 4.
+    ts_warm = np.ones(nt) * 20.
+
+    C_p = 15246
+    C_m = 2400.
+    dalpha_r = 0.0005284
+    dalpha_m = 0.0004961
+    dalpha_p = 0.0005607
+    gamma = 482.6
+    cold_mask = x < 0.5 * cable_len
+    warm_mask = np.invert(cold_mask)  # == False
+    temp_real = np.ones((len(x), nt))
+    temp_real[cold_mask] *= ts_cold + 273.15
+    temp_real[warm_mask] *= ts_warm + 273.15
+
+    st = C_p * np.exp(-(dalpha_r + dalpha_p) * x[:, None]) * \
+        np.exp(gamma / temp_real) / (np.exp(gamma / temp_real) - 1)
+    ast = C_m * np.exp(-(dalpha_r + dalpha_m) * x[:, None]) / \
+        (np.exp(gamma / temp_real) - 1)
+    st += np.random.normal(scale=2., size=st.shape)
+    ast += np.random.normal(scale=2., size=ast.shape)
+
+    ds = DataStore({
+        'st':                    (['x', 'time'], st),
+        'ast':                   (['x', 'time'], ast),
+        'userAcquisitionTimeFW': (['time'], np.ones(nt)),
+        'cold':                  (['time'], ts_cold),
+        'warm':                  (['time'], ts_warm)
+        },
+        coords={
+            'x':    x,
+            'time': time},
+        attrs={
+            'isDoubleEnded': '0'})
+
+    sections = {
+        'cold': [slice(0., 0.5 * cable_len)],
+        'warm': [slice(0.5 * cable_len, cable_len)]}
+
+    kwargs = dict(st_label='st', ast_label='ast', st_var=4., ast_var=4.)
+
+    ds.calibration_single_ended(
+        sections=sections, method='wls', solver='sparse', **kwargs)
+
+    results = []
+
+    for seed, reduce_memory_usage, mc_batch_size in [
+            (1, False, None), (1, True, None), (2, False, None),
+            (1, False, 16), (1, False, 16)]:
+        np.random.seed(seed + len(results))  # Not used with mc_seed
+        ds_mc = ds.copy()
+        ds_mc.conf_int_single_ended(
+            mc_seed=seed, reduce_memory_usage=reduce_memory_usage,
+            mc_batch_size=mc_batch_size, conf_ints=[2.5, 97.5],
+            mc_sample_size=50, **kwargs)
+        results.append(ds_mc['TMPF_MC_var'].values)
+
+    np.testing.assert_array_equal(results[0], results[1])
+    assert not np.array_equal(results[0], results[2])
+    np.testing.assert_array_equal(results[3], results[4])
+    pass